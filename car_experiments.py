@@ -1,8 +1,31 @@
+import argparse
+import copy
+import os
 import pygame
 import sys
 import math
 from car_model import Car  
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pid_yaw'))
+from key_input import add_input_arguments, make_key_input
+from profiler import make_profiler
+from simulation import InputQueue, add_simulation_arguments, parse_simulation_arguments, run_simulation
+from trajectory import TrajectoryRecorder, add_recording_arguments
+
+# Keys read by handle_input and the mode switch, in the bit order of --record-input logs
+INPUT_KEYS = (pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_m)
+
+parser = argparse.ArgumentParser(description="Car Experiments")
+add_simulation_arguments(parser)
+add_recording_arguments(parser)
+add_input_arguments(parser)
+args = parse_simulation_arguments(parser)
+# Key events go from the event loop to the physics step through a queue, so the car is only
+# ever changed by the physics step, whichever thread runs it; --replay-input feeds a log instead
+inputs = InputQueue()
+key_input = make_key_input(args, INPUT_KEYS, inputs)
+profiler = make_profiler(args)  # --profile flags; free when off
+
 # Initialize Pygame
 pygame.init()
 
@@ -125,8 +148,6 @@ class Car:
         rear_dy = math.sin(math.radians(self.angle + self.rear_wheel_angle)) * line_length
         pygame.draw.line(screen, GREEN, (self.x, self.y), (self.x - rear_dx, self.y - rear_dy), 3)
 
-        # Optionally, print steering angles for debugging
-        print(f"Front Angle: {self.front_wheel_angle}, Rear Angle: {self.rear_wheel_angle}")
         pygame.draw.line(screen, RED, (self.x, self.y), (self.x + front_dx, self.y + front_dy), 3)
         
         # Rear steering line (optional, depending on your model)
@@ -134,21 +155,19 @@ class Car:
         rear_dy = math.sin(math.radians(self.angle + self.rear_wheel_angle)) * line_length
         pygame.draw.line(screen, GREEN, (self.x, self.y), (self.x - rear_dx, self.y - rear_dy), 3)
 
-        # Optionally, print steering angles for debugging
-        print(f"Front Angle: {self.front_wheel_angle}, Rear Angle: {self.rear_wheel_angle}")
 
 # Define colors
 WHITE = (255, 255, 255)
 
-def handle_input(car):
-    keys = pygame.key.get_pressed()
-    if keys[pygame.K_UP]:
+def handle_input(car, keys):
+    # `keys` is the set of keys held down this tick, see key_input.KeyInput
+    if pygame.K_UP in keys:
         car.speed += 0.1  # Increase speed
-    if keys[pygame.K_DOWN]:
+    if pygame.K_DOWN in keys:
         car.speed -= 0.1  # Decrease speed
-    if keys[pygame.K_LEFT]:
+    if pygame.K_LEFT in keys:
         car.front_wheel_angle += 1  # Steer left
-    if keys[pygame.K_RIGHT]:
+    if pygame.K_RIGHT in keys:
         car.front_wheel_angle -= 1  # Steer right
 
 def reset_car():
@@ -156,31 +175,49 @@ def reset_car():
 
 def run_experiments():
     car = reset_car()
-    running = True
     mode = "MANUAL"  # Start in manual control mode
+    recorder = TrajectoryRecorder(args.record, dt=args.dt) if args.record else None
+    sim_time = 0.0
 
-    while running:
+    def poll_events():
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_m:  # Switch mode
-                    mode = "MANUAL" if mode != "MANUAL" else "AUTOMATIC"
-
-        screen.fill(WHITE)
-
-        if mode == "MANUAL":
-            handle_input(car)
-        elif mode == "AUTOMATIC":
-            # Example automatic behavior, replace with specific experiment logic
-            car.front_wheel_angle = 5  # Constant steering angle for demonstration
-
-        # Update and draw car
+                return False
+            elif event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                inputs.put(event)
+
+    def physics_step(delta_time):
+        nonlocal sim_time, mode
+        sim_time += delta_time
+        keys, pressed = key_input.tick()
+        if pygame.K_m in pressed:  # Switch mode
+            mode = "MANUAL" if mode != "MANUAL" else "AUTOMATIC"
+        with profiler.phase('control'):
+            if mode == "MANUAL":
+                handle_input(car, keys)
+            elif mode == "AUTOMATIC":
+                # Example automatic behavior, replace with specific experiment logic
+                car.front_wheel_angle = 5  # Constant steering angle for demonstration
+
+        # Update car
         car.update(0)  # For automatic mode, replace 0 with calculated CTE
-        car.draw(screen)
+        if recorder:
+            recorder.record(sim_time, [car])
 
-        pygame.display.flip()
-        pygame.time.Clock().tick(60)
+    def render(alpha, state):
+        screen.fill(WHITE)
+        state.draw(screen)
+        for overlay in profiler.overlays():
+            overlay(screen)
+        with profiler.phase('flip'):
+            pygame.display.flip()
+
+    # Physics runs at a fixed dt, independent of the frame rate; render draws a copy of the car
+    run_simulation(physics_step, render, args, poll=poll_events, snapshot=lambda: copy.copy(car),
+                   profiler=profiler)
+    key_input.close()
+    if recorder:
+        recorder.close()
 
     pygame.quit()
     sys.exit()
@@ -1,12 +1,27 @@
 import math
 import pygame
+from sprite_cache import SpriteCache
 
 BLUE = (0, 0, 255)
 GREEN = (0, 255, 0)
 RED = (255, 0, 0)
 
 
+def build_car_sprite():
+    # Unrotated car body, facing angle 0
+    car_surface = pygame.Surface((40, 20), pygame.SRCALPHA)  # Transparent surface
+    pygame.draw.rect(car_surface, BLUE, car_surface.get_rect())  # Fill the whole 40x20 sprite
+    return car_surface
+
+
+# Rotated car sprites shared by every Car, rendered on first use
+car_sprites = SpriteCache(steps=72)
+car_sprites.register('car', build_car_sprite)
+
+
 class Car:
+    sprite_kind = 'car'  # Key of this vehicle type in car_sprites
+
     def __init__(self, x, y, angle=0):
         self.x = x
         self.y = y
@@ -45,16 +60,8 @@ class Car:
         self.rear_wheel_angle = -pid_output / 2  # Example: rear wheel angle is half and opposite
 
     def draw(self, screen):
-        # Basic car representation
-        car_rect = pygame.Rect(self.x - 20, self.y - 10, 40, 20)  # Example car size
-        car_surface = pygame.Surface((40, 20), pygame.SRCALPHA)  # Transparent surface
-        pygame.draw.rect(car_surface, BLUE, car_rect)  # Draw the car on the surface
-        
-        # Rotate the car surface to match the car's orientation
-        rotated_car = pygame.transform.rotate(car_surface, -self.angle)
-        car_position = rotated_car.get_rect(center=(self.x, self.y))
-
-        screen.blit(rotated_car, car_position.topleft)
+        # Basic car representation: one blit of the cached sprite rotated to the car's orientation
+        car_sprites.blit(screen, self.sprite_kind, self.angle, (self.x, self.y))
 
         # Visualize steering angles with lines
         line_length = 30  # Length of the lines representing wheel direction
@@ -67,6 +74,3 @@ class Car:
         rear_dx = math.cos(math.radians(self.angle + self.rear_wheel_angle)) * line_length
         rear_dy = math.sin(math.radians(self.angle + self.rear_wheel_angle)) * line_length
         pygame.draw.line(screen, GREEN, (self.x, self.y), (self.x - rear_dx, self.y - rear_dy), 3)
-
-        # Optionally, print steering angles for debugging
-        print(f"Front Angle: {self.front_wheel_angle}, Rear Angle: {self.rear_wheel_angle}")
\ No newline at end of file
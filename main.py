@@ -1,8 +1,23 @@
+import argparse
+import copy
+import os
+import sys
 import pygame
 import math
 
 from car_model import Car
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pid_yaw'))
+from integrators import INTEGRATORS
+from profiler import make_profiler
+from simulation import add_simulation_arguments, parse_simulation_arguments, run_simulation
+from renderer import SceneRenderer
+
+parser = argparse.ArgumentParser(description="Autonomous Car with Four-Wheel Steering")
+add_simulation_arguments(parser)
+args = parse_simulation_arguments(parser)
+profiler = make_profiler(args)  # --profile flags; free when off
+
 # Initialize Pygame
 pygame.init()
 
@@ -25,6 +40,7 @@ class Car:
         self.rear_wheel_angle = 0  # Steering angle of the rear wheels
         self.speed = 2  # Speed of the car
         self.length = 50  # Distance between front and rear axles, correcting the missing attribute
+        self.integrator = 'explicit_euler'  # Moves along the old heading; see pid_yaw/integrators.py
 
         # PID components
         self.Kp = 0.1  # Proportional gain
@@ -50,13 +66,10 @@ class Car:
         self.front_wheel_angle = angle_to_target * 0.5
         self.rear_wheel_angle = self.front_wheel_angle * 0.3  # Rear wheels have a smaller steering angle
 
-        print(f"Front steering angle: {self.front_wheel_angle:.2f}, Rear steering angle: {self.rear_wheel_angle:.2f}")
-
     def update_position(self):
         # Convert steering angles and car orientation to radians for calculation
         front_rad = math.radians(self.front_wheel_angle)
         rear_rad = math.radians(self.rear_wheel_angle)
-        car_rad = math.radians(self.angle)
 
         # Simulate car movement based on front and rear wheel steering
         turn_radius_front = self.length / math.sin(front_rad) if front_rad else float('inf')
@@ -65,14 +78,11 @@ class Car:
         # Average the turn radii for simplified car movement
         turn_radius = (turn_radius_front + turn_radius_rear) / 2
 
-        # Update car orientation
-        if turn_radius != float('inf'):
-            turn_angle = (self.speed / turn_radius) * (180 / math.pi)
-            self.angle = (self.angle + turn_angle) % 360
-
-        # Update car position
-        self.x += math.cos(car_rad) * self.speed
-        self.y += math.sin(car_rad) * self.speed
+        # Update car orientation and position over one step of one frame
+        turn_rate = self.speed / turn_radius if turn_radius != float('inf') else 0.0
+        self.x, self.y, yaw = INTEGRATORS[self.integrator](self.x, self.y, math.radians(self.angle),
+                                                           self.speed, turn_rate, 1)
+        self.angle = math.degrees(yaw) % 360
 
     def draw(self, screen):
         car_front = (self.x + 15 * math.cos(math.radians(self.angle)), self.y + 15 * math.sin(math.radians(self.angle)))
@@ -109,41 +119,56 @@ circular_trace = generate_circular_trace(cx, cy, r)
 
 # Create the car instance
 car = Car(circular_trace[0][0], circular_trace[0][1], 0)
+car.integrator = args.integrator or car.integrator
 
 # Main game loop
-running = True
-clock = pygame.time.Clock()
 trace_index = 0
 
-while running:
+
+def poll_events():
     # 1. Event Handling
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
-            running = False
-    
+            return False
+
+
+def physics_step(delta_time):
     # 2. Game State Updates
+    global trace_index
     
     # Update the car's steering based on the current target point
     if trace_index < len(circular_trace):
         target_point = circular_trace[trace_index]
-        car.calculate_steering(target_point[0], target_point[1])
+        with profiler.phase('control'):
+            car.calculate_steering(target_point[0], target_point[1])
         car.update_position()
 
         # Increment trace index, handling looping
         trace_index = (trace_index + 1) % len(circular_trace)
-    
-    # 3. Rendering
-    screen.fill(WHITE)  # Clear the screen with a white background
-    
+
+
+def draw_trace(surface):
     # Draw the circular trace
     for point in circular_trace:
-        pygame.draw.circle(screen, RED, (int(point[0]), int(point[1])), 2)
-    
-    # Draw the car
-    car.draw(screen)
-    
-    pygame.display.flip()  # Update the display with the new frame
-    
-    clock.tick(60)  # Cap the game at 60 frames per second
+        pygame.draw.circle(surface, RED, (int(point[0]), int(point[1])), 2)
+
+
+# The trace is drawn once to a cached background; frames only redraw the car
+renderer = SceneRenderer(screen, profiler=profiler)
+renderer.add_static(draw_trace)
+
+
+def snapshot():
+    # A copy of the car, so a render on another thread never sees a half-updated state
+    return copy.copy(car)
+
+
+def render(alpha, state):
+    # 3. Rendering
+    renderer.render([state], profiler.overlays())
+
+
+# Physics runs at a fixed dt (one trace point per step), independent of the frame rate
+run_simulation(physics_step, render, args, poll=poll_events, snapshot=snapshot, profiler=profiler)
 
 pygame.quit()
\ No newline at end of file
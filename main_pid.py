@@ -1,8 +1,23 @@
+import argparse
+import copy
+import os
+import sys
 import pygame
 import math
 
 from car_model import Car
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pid_yaw'))
+from path import Path, calculate_cte
+from renderer import SceneRenderer
+from profiler import make_profiler
+from simulation import add_simulation_arguments, parse_simulation_arguments, run_simulation
+
+parser = argparse.ArgumentParser(description="Car Following Path with PID Control")
+add_simulation_arguments(parser)
+args = parse_simulation_arguments(parser)
+profiler = make_profiler(args)  # --profile flags; free when off
+
 # Initialize Pygame
 pygame.init()
 
@@ -79,46 +94,52 @@ class Car:
         rear_dy = math.sin(math.radians(self.angle + self.rear_wheel_angle)) * line_length
         pygame.draw.line(screen, GREEN, (self.x, self.y), (self.x - rear_dx, self.y - rear_dy), 3)
 
-        # Optionally, print steering angles for debugging
-        print(f"Front Angle: {self.front_wheel_angle}, Rear Angle: {self.rear_wheel_angle}")
 
 def generate_circle(cx, cy, radius, points=100):
     return [(math.cos(2 * math.pi / points * x) * radius + cx, math.sin(2 * math.pi / points * x) * radius + cy) for x in range(points)]
 
-def calculate_cte(car, circle_center, radius):
-    dx = car.x - circle_center[0]
-    dy = car.y - circle_center[1]
-    distance = math.sqrt(dx**2 + dy**2)
-    return distance - radius
-
 # Circle path setup
 circle_center = (screen_width // 2, screen_height // 2)
 radius = 100
 path = generate_circle(*circle_center, radius)
+reference_path = Path(path, closed=True)
 
 # Car setup
 car = Car(screen_width // 2, screen_height // 2 - radius)
 
 # Main loop
-running = True
-clock = pygame.time.Clock()
-while running:
+def poll_events():
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
-            running = False
+            return False
 
-    screen.fill(WHITE)
 
-    # Draw path
+def physics_step(delta_time):
+    # Update car
+    cte = calculate_cte(car, reference_path)
+    car.update(cte)
+
+
+def draw_path(surface):
     for point in path:
-        pygame.draw.circle(screen, RED, (int(point[0]), int(point[1])), 2)
+        pygame.draw.circle(surface, RED, (int(point[0]), int(point[1])), 2)
+
+
+# The path is drawn once to a cached background; frames only redraw the car
+renderer = SceneRenderer(screen, profiler=profiler)
+renderer.add_static(draw_path)
+
+
+def snapshot():
+    # A copy of the car, so a render on another thread never sees a half-updated state
+    return copy.copy(car)
+
+
+def render(alpha, state):
+    renderer.render([state], profiler.overlays())
 
-    # Update and draw car
-    cte = calculate_cte(car, circle_center, radius)
-    car.update(cte)
-    car.draw(screen)
 
-    pygame.display.flip()
-    clock.tick(60)
+# Physics runs at a fixed dt, independent of the frame rate
+run_simulation(physics_step, render, args, poll=poll_events, snapshot=snapshot, profiler=profiler)
 
 pygame.quit()
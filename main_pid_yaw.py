@@ -1,7 +1,27 @@
+import argparse
+import copy
+import os
+import sys
 import pygame
 import math
 import random
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pid_yaw'))
+from path import Path, calculate_cte
+from path_follower import PathFollower, find_lookahead_point
+from integrators import INTEGRATORS
+from path_generation import seeded_rng
+from profiler import make_profiler
+from renderer import SceneRenderer
+from simulation import add_simulation_arguments, parse_simulation_arguments, run_simulation
+
+parser = argparse.ArgumentParser(description="Enhanced Autonomous 4WS Car Simulation")
+parser.add_argument('--mode', choices=['circle', 'random'], help="Skip the mode selection screen")
+parser.add_argument('--seed', type=int, help="Seed of the random path, to repeat a run")
+add_simulation_arguments(parser)
+args = parse_simulation_arguments(parser)
+profiler = make_profiler(args)  # --profile flags; free when off
+
 # Initialize Pygame
 pygame.init()
 
@@ -28,8 +48,8 @@ screen.blit(text, text_rect)
 pygame.display.flip()
 
 # Mode selection loop
-mode_selection = 'circle'  # Default mode
-waiting_for_input = True
+mode_selection = args.mode or 'circle'  # Default mode
+waiting_for_input = args.mode is None and not args.headless
 while waiting_for_input:
     for event in pygame.event.get():
         if event.type == pygame.KEYDOWN:
@@ -79,30 +99,8 @@ def generate_circle(cx, cy, radius, points=100):
 # Place path generation functions (generate_circle and generate_smooth_random_path) here
 
 
-def calculate_cte(car, circle_center, radius):
-    dx = car.x - circle_center[0]
-    dy = car.y - circle_center[1]
-    distance = math.sqrt(dx**2 + dy**2)
-    return distance - radius
-
-def find_lookahead_point(car, path, lookahead_distance):
-    for point in path:
-        dx = point[0] - car.x
-        dy = point[1] - car.y
-        distance = math.sqrt(dx**2 + dy**2)
-        
-        if distance >= lookahead_distance:
-            # Calculate angle to the lookahead point
-            angle_to_point = math.atan2(dy, dx)
-            # Calculate the steering angle needed
-            angle_diff = angle_to_point - car.yaw
-            # Normalize the angle difference
-            angle_diff = (angle_diff + math.pi) % (2 * math.pi) - math.pi
-            return angle_diff
-    return None
-
-def update_car_steering(car, path, lookahead_distance):
-    angle_diff = find_lookahead_point(car, path, lookahead_distance)
+def update_car_steering(car, follower, lookahead_distance):
+    angle_diff = find_lookahead_point(car, follower, lookahead_distance)
     if angle_diff is not None:
         car.front_wheel_angle = angle_diff  # Simplified, consider PID controller for smoothing
         # Apply limits to the steering angle if necessary
@@ -110,11 +108,11 @@ def update_car_steering(car, path, lookahead_distance):
 
 
 
-def generate_smooth_random_path(start_point, num_segments=5, segment_length=100):
+def generate_smooth_random_path(start_point, num_segments=5, segment_length=100, rng=random):
     points = [start_point]
-    direction = random.uniform(0, 2 * math.pi)
+    direction = rng.uniform(0, 2 * math.pi)
     for _ in range(num_segments):
-        direction += random.uniform(-math.pi / 4, math.pi / 4)  # Slight direction change
+        direction += rng.uniform(-math.pi / 4, math.pi / 4)  # Slight direction change
         end_x = points[-1][0] + math.cos(direction) * segment_length
         end_y = points[-1][1] + math.sin(direction) * segment_length
         points.append((end_x, end_y))
@@ -148,6 +146,7 @@ class Car:
         self.width = 20  # Width of the car
 
         self.max_steering_angle = math.radians(60)  # Maximum steering angle in radians
+        self.integrator = 'euler'  # Pose integrator, see pid_yaw/integrators.py
 
     def update(self, delta_time, cte):
         # PID control for front steering based on CTE
@@ -162,9 +161,9 @@ class Car:
             self.rear_wheel_angle = steering_adjustment / 4  # In-phase steering at high speeds
         
         # Update car yaw and position
-        self.yaw += (self.velocity * math.tan(steering_adjustment) / self.length) * delta_time
-        self.x += self.velocity * math.cos(self.yaw) * delta_time
-        self.y += self.velocity * math.sin(self.yaw) * delta_time
+        yaw_rate = self.velocity * math.tan(steering_adjustment) / self.length
+        self.x, self.y, self.yaw = INTEGRATORS[self.integrator](self.x, self.y, self.yaw, self.velocity,
+                                                                yaw_rate, delta_time)
 
     def draw(self, screen):
         # Calculate car corners for rectangular representation
@@ -203,53 +202,69 @@ class Car:
         pygame.draw.line(screen, RED, front_center, front_line_end, 2)
         pygame.draw.line(screen, GREEN, rear_center, rear_line_end, 2)
 
-        print(f"Front Angle: {self.front_wheel_angle}, Rear Angle: {self.rear_wheel_angle}")
-
 
 # Initialize the car and path based on the selection
 car = Car(screen_width // 2, screen_height // 2, angle=0, velocity=30)
+car.integrator = args.integrator or car.integrator
+profiler.instrument(car.pid_controller, 'update', 'control')
 if mode_selection == 'random':
-    current_path = generate_smooth_random_path((car.x, car.y), num_segments=10, segment_length=50)
+    path_rng, path_seed = seeded_rng(args.seed)  # Repeat this run with --seed
+    print(f"Random path seed: {path_seed}")
+    current_path = generate_smooth_random_path((car.x, car.y), num_segments=10, segment_length=50, rng=path_rng)
 else:  # Default to a circle if not random
     radius = 100
-    current_path = generate_circle(car.x, car.y, radius, points=100)
+    circle_center = (car.x + radius, car.y)  # The car starts on the circle
+    current_path = generate_circle(*circle_center, radius, points=100)
 
       
 
 # Main simulation loop
-running = True
-clock = pygame.time.Clock()
-while running:
-    delta_time = clock.tick(60) / 1000.0  # Convert milliseconds to seconds
+lookahead_distance = 50  # Adjust based on your simulation needs
+reference_path = Path(current_path)  # Arc length, tangents and curvature computed once
+path_follower = PathFollower(current_path)  # Tracks progress so lookahead search stays local
+
+
+def poll_events():
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
-            running = False
+            return False
 
-    lookahead_distance = 50  # Adjust based on your simulation needs
 
+def physics_step(delta_time):
     # Within the simulation loop:
     if mode_selection == 'random':
-        update_car_steering(car, current_path, lookahead_distance)
-    # Update car dynamics here...
-
-    else:
-        # Existing CTE calculation for circular paths
-        dx = car.x - current_path[0][0]
-        dy = car.y - current_path[0][1]
-        cte = math.sqrt(dx**2 + dy**2) - radius
+        with profiler.phase('control'):
+            update_car_steering(car, path_follower, lookahead_distance)
 
+    # Signed cross-track error against the path, whatever its shape
+    cte = calculate_cte(car, reference_path)
     car.update(delta_time, cte)
 
-    # Clear screen and draw everything
-    screen.fill(WHITE)
+
+def draw_path(surface):
     if mode_selection == 'circle':
-        pygame.draw.circle(screen, RED, current_path[0], radius, 1)
+        pygame.draw.circle(surface, RED, circle_center, radius, 1)
     else:
         for i in range(1, len(current_path)):
-            pygame.draw.line(screen, RED, current_path[i - 1], current_path[i], 2)
-    
-    car.draw(screen)
-    pygame.display.flip()
+            pygame.draw.line(surface, RED, current_path[i - 1], current_path[i], 2)
+
+
+# The path is drawn once to a cached background; frames only redraw the car
+renderer = SceneRenderer(screen, profiler=profiler)
+renderer.add_static(draw_path)
+
+
+def snapshot():
+    # A copy of the car, so a render on another thread never sees a half-updated state
+    return copy.copy(car)
+
+
+def render(alpha, state):
+    renderer.render([state], profiler.overlays())
+
+
+# Physics runs at a fixed dt, decoupled from the frame rate
+run_simulation(physics_step, render, args, poll=poll_events, snapshot=snapshot, profiler=profiler)
 
 pygame.quit()
 
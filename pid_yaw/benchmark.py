@@ -0,0 +1,596 @@
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Draw benchmarks render off-screen
+import pygame
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import car_model
+from car import Car
+from car_4ws import Car_4ws
+from car_batch import CarBatch
+from car_4ws_batch import Car4wsBatch
+from collision import box_corners, find_collisions
+from curvature_table import get_table
+from gain_schedule import GainSchedule
+from lane_change import get_library, track
+from mpc import MPC
+from path import Path, calculate_cte
+from path_follower import PathFollower, find_lookahead_point
+from path_generation import generate_circle, generate_smooth_random_path
+from path_tracking import PurePursuit, Stanley
+from pid_controller import PIDController
+from profiler import DISABLED, Profiler
+from rollout import make_path
+from traffic import Traffic
+
+DT = 1 / 60
+BENCHMARKS = {}
+
+
+def benchmark(name, kind='micro'):
+    """
+    Register a benchmark. The decorated function sets up its state and returns
+    run(n), which performs at least n steps and may return how many it did
+    (batched runs round up); throughput is reported in steps/sec.
+    """
+    def register(setup):
+        BENCHMARKS[name] = (kind, setup)
+        return setup
+    return register
+
+
+def _cte_sequence(n):
+    # Bounded, varying CTE input so the controllers do real work without diverging
+    return [5 * math.sin(i / 20) for i in range(n)]
+
+
+# Micro benchmarks: one call per step
+
+@benchmark('car_model.Car.update')
+def _car_model_update():
+    car = car_model.Car(400, 300)
+    ctes = _cte_sequence(4096)
+
+    def run(n):
+        for i in range(n):
+            car.update(ctes[i & 4095] * 0.01)
+    return run
+
+
+@benchmark('car.Car.update')
+def _car_update():
+    car = Car(400, 300, velocity=30)
+    ctes = _cte_sequence(4096)
+
+    def run(n):
+        for i in range(n):
+            car.update(DT, ctes[i & 4095])
+    return run
+
+
+@benchmark('car.Car.update[arc]')
+def _car_update_arc():
+    car = Car(400, 300, velocity=30)
+    car.integrator = 'arc'
+    ctes = _cte_sequence(4096)
+
+    def run(n):
+        for i in range(n):
+            car.update(DT, ctes[i & 4095])
+    return run
+
+
+@benchmark('car_4ws.Car_4ws.update')
+def _car_4ws_update():
+    car = Car_4ws(400, 300, velocity=30)
+    car.front_left_wheel_angle = car.front_right_wheel_angle = math.radians(10)
+    car.rear_left_wheel_angle = car.rear_right_wheel_angle = math.radians(-5)
+
+    def run(n):
+        for _ in range(n):
+            car.update(DT)
+    return run
+
+
+@benchmark('PIDController.update')
+def _pid_update():
+    pid = PIDController(Kp=0.1, Ki=0.01, Kd=0.01)
+    ctes = _cte_sequence(4096)
+
+    def run(n):
+        for i in range(n):
+            pid.update(ctes[i & 4095], DT)
+    return run
+
+
+def _poses_along(path, count=1024, offset=5.0):
+    # Car poses that drive around `path`, slightly off it, for the path queries
+    poses = []
+    for i in range(count):
+        x, y, heading = path.interpolate(path.length * i / count)
+        poses.append((x + offset * math.sin(heading), y - offset * math.cos(heading), heading))
+    return poses
+
+
+@benchmark('find_lookahead_point')
+def _find_lookahead_point():
+    path = make_path('random', seed=0)
+    follower = PathFollower(path)
+    car = Car(0, 0)
+    poses = _poses_along(path)
+
+    def run(n):
+        for i in range(n):
+            j = i & 1023
+            if j == 0:
+                follower.reset()
+            car.x, car.y, car.yaw = poses[j]
+            find_lookahead_point(car, follower, 50)
+    return run
+
+
+@benchmark('calculate_cte')
+def _calculate_cte():
+    path = make_path('random', seed=0)
+    car = Car(0, 0)
+    poses = _poses_along(path)
+
+    def run(n):
+        for i in range(n):
+            car.x, car.y, car.yaw = poses[i & 1023]
+            calculate_cte(car, path)
+    return run
+
+
+@benchmark('generate_circle')
+def _generate_circle():
+    def run(n):
+        for _ in range(n):
+            generate_circle(400, 300, 100, points=100)
+    return run
+
+
+@benchmark('generate_smooth_random_path')
+def _generate_smooth_random_path():
+    def run(n):
+        for _ in range(n):
+            generate_smooth_random_path((400, 300), num_segments=10, segment_length=50)
+    return run
+
+
+def _draw_benchmark(make_car):
+    def setup():
+        surface = pygame.Surface((800, 600))
+        car = make_car()
+
+        def run(n):
+            for i in range(n):
+                car.x = 300 + (i & 255)  # Keep the sprite caches honest
+                car.draw(surface)
+        return run
+    return setup
+
+
+def _turning_car_model():
+    car = car_model.Car(400, 300, angle=30)
+    car.front_wheel_angle, car.rear_wheel_angle = 10, -5
+    return car
+
+
+def _turning_car():
+    car = Car(400, 300, angle=30)
+    car.front_wheel_angle, car.rear_wheel_angle = 0.2, -0.1
+    return car
+
+
+def _turning_car_4ws():
+    car = Car_4ws(400, 300, angle=30)
+    car.front_left_wheel_angle = car.front_right_wheel_angle = 0.2
+    car.rear_left_wheel_angle = car.rear_right_wheel_angle = -0.1
+    return car
+
+
+benchmark('car_model.Car.draw')(_draw_benchmark(_turning_car_model))
+benchmark('car.Car.draw')(_draw_benchmark(_turning_car))
+benchmark('car_4ws.Car_4ws.draw')(_draw_benchmark(_turning_car_4ws))
+
+
+# Batch engines: one step of 1024 vehicles counts as 1024 steps
+
+@benchmark('CarBatch.step[1024]')
+def _car_batch_step():
+    cars = CarBatch(np.zeros(1024), 0, 0, 30)
+    ctes = np.sin(np.arange(1024) / 50)
+
+    def run(n):
+        for _ in range(-(-n // 1024)):
+            cars.step(DT, ctes)
+        return -(-n // 1024) * 1024
+    return run
+
+
+@benchmark('CarBatch.step[10000]')
+def _car_batch_step_large():
+    cars = CarBatch(np.zeros(10000), 0, 0, 30)
+    ctes = np.sin(np.arange(10000) / 50)
+
+    def run(n):
+        for _ in range(-(-n // 10000)):
+            cars.step(DT, ctes)
+        return -(-n // 10000) * 10000
+    return run
+
+
+@benchmark('Car4wsBatch.step[1024]')
+def _car_4ws_batch_step():
+    cars = Car4wsBatch(np.zeros(1024), 0, 0, 30)
+    cars.front_left_wheel_angle[:] = cars.front_right_wheel_angle[:] = np.linspace(-0.5, 0.5, 1024)
+    cars.rear_left_wheel_angle[:] = cars.rear_right_wheel_angle[:] = np.linspace(0.2, -0.2, 1024)
+
+    def run(n):
+        for _ in range(-(-n // 1024)):
+            cars.step(DT)
+        return -(-n // 1024) * 1024
+    return run
+
+
+@benchmark('CarBatch.step[1024,scheduled]')
+def _car_batch_step_scheduled():
+    cars = CarBatch(np.zeros(1024), 0, 0, np.linspace(0, 40, 1024), gain_schedule=GainSchedule.default())
+    ctes = np.sin(np.arange(1024) / 50)
+
+    def run(n):
+        for _ in range(-(-n // 1024)):
+            cars.step(DT, ctes)
+        return -(-n // 1024) * 1024
+    return run
+
+
+@benchmark('CarBatch.step[64]')
+def _car_batch_step_small():
+    cars = CarBatch(np.zeros(64), 0, 0, 30)
+    ctes = np.sin(np.arange(64) / 50)
+
+    def run(n):
+        for _ in range(-(-n // 64)):
+            cars.step(DT, ctes)
+        return -(-n // 64) * 64
+    return run
+
+
+# Path trackers steering 1024 cars along one path: one call counts as 1024 steps
+
+def _tracker_benchmark(make_tracker):
+    def setup():
+        path = make_path('random', seed=0)
+        rng = np.random.default_rng(0)
+        x, y, heading = path.interpolate(rng.uniform(0, path.length, 1024))
+        cars = CarBatch(x + rng.normal(0, 5, 1024), y + rng.normal(0, 5, 1024), np.degrees(heading), 30)
+        tracker = make_tracker(path)
+
+        def run(n):
+            for _ in range(-(-n // 1024)):
+                tracker.steer(cars)
+            return -(-n // 1024) * 1024
+        return run
+    return setup
+
+
+benchmark('PurePursuit.steer[1024]')(_tracker_benchmark(PurePursuit))
+benchmark('Stanley.steer[1024]')(_tracker_benchmark(Stanley))
+
+
+# MPC: one warm-started solve of a Car_4ws driving along a random path counts as one step
+
+@benchmark('MPC.steer')
+def _mpc_steer():
+    path = make_path('random', seed=0)
+    x, y, heading = path.interpolate(0.0)
+    car = Car_4ws(x, y, math.degrees(heading), 30)
+    controller = MPC(path, time_budget=1.0)  # Iterate to convergence, the budget would hide slowdowns
+
+    def run(n):
+        for _ in range(n):
+            controller.steer(car, DT)
+            car.update(DT)
+            if path.project(car.x, car.y)[0] > path.length - 100:
+                car.x, car.y, car.yaw = x, y, heading
+                controller.plan = None
+    return run
+
+
+# Collision detection of 1024 cars in traffic density: one call counts as 1024 steps
+
+@benchmark('find_collisions[1024]')
+def _find_collisions():
+    rng = np.random.default_rng(0)
+    corners = box_corners(rng.uniform(0, 8000, 1024), rng.uniform(0, 600, 1024), rng.normal(0, 0.1, 1024))
+
+    def run(n):
+        for _ in range(-(-n // 1024)):
+            find_collisions(corners)
+        return -(-n // 1024) * 1024
+    return run
+
+
+# Curvature table lookups: one call counts as one step
+
+@benchmark('CurvatureTable.inverse')
+def _curvature_inverse():
+    table = get_table()
+    targets = np.linspace(-0.003, 0.003, 4096).tolist()
+
+    def run(n):
+        for i in range(n):
+            table.inverse(targets[i & 4095], 'counter_phase')
+    return run
+
+
+@benchmark('Car_4ws.steer_to_curvature')
+def _steer_to_curvature():
+    car = Car_4ws(400, 300, velocity=30)
+    targets = np.linspace(-0.01, 0.01, 4096).tolist()
+
+    def run(n):
+        for i in range(n):
+            car.steer_to_curvature(targets[i & 4095])
+    return run
+
+
+# Profiler hooks: one timed phase counts as one step, off being what every main loop pays
+
+def _profiler_benchmark(make_profiler):
+    def setup():
+        profiler = make_profiler()
+
+        def run(n):
+            for _ in range(n):
+                with profiler.phase('physics'):
+                    pass
+        return run
+    return setup
+
+
+benchmark('Profiler.phase[off]')(_profiler_benchmark(lambda: DISABLED))
+benchmark('Profiler.phase[on]')(_profiler_benchmark(Profiler))
+
+
+# Fused rollouts (compiled with numba when it is installed)
+
+@benchmark('Car.rollout')
+def _car_rollout():
+    car = Car(400, 300, velocity=30)
+    ctes = np.array(_cte_sequence(4096))
+
+    def run(n):
+        for _ in range(-(-n // 4096)):
+            car.rollout(ctes, DT)
+        return -(-n // 4096) * 4096
+    return run
+
+
+@benchmark('Car.rollout_circle')
+def _car_rollout_circle():
+    # Closed loop like scenario.circle, with the exact circle CTE computed in the kernel
+    car = Car(500, 300, angle=90, velocity=30)
+
+    def run(n):
+        for _ in range(-(-n // 4096)):
+            car.rollout_circle(400, 300, 100, 4096, DT)
+        return -(-n // 4096) * 4096
+    return run
+
+
+@benchmark('Car_4ws.rollout')
+def _car_4ws_rollout():
+    car = Car_4ws(400, 300, velocity=30)
+    front = np.radians(np.linspace(-20, 20, 4096))
+
+    def run(n):
+        for _ in range(-(-n // 4096)):
+            car.rollout(DT, front_left=front, front_right=front, rear_left=-front / 2, rear_right=-front / 2)
+        return -(-n // 4096) * 4096
+    return run
+
+
+# Macro benchmarks: whole headless scenarios, one physics step per step
+
+@benchmark('scenario.circle', kind='macro')
+def _scenario_circle():
+    def run(n):
+        car = Car(400, 300, angle=0, velocity=30)
+        path = Path(generate_circle(car.x + 100, car.y, 100, points=100))
+        for _ in range(n):
+            car.update(DT, calculate_cte(car, path))
+    return run
+
+
+@benchmark('scenario.random', kind='macro')
+def _scenario_random():
+    path = make_path('random', seed=0)
+
+    def run(n):
+        # main.py random mode: pure pursuit steers, the CTE is still computed for telemetry
+        car = Car(400, 300, angle=math.degrees(path.headings[0]), velocity=30)
+        tracker = PurePursuit(path)
+        for _ in range(n):
+            calculate_cte(car, path)
+            tracker.steer(car)
+            car.drive(DT)
+    return run
+
+
+@benchmark('scenario.lane_change', kind='macro')
+def _scenario_lane_change():
+    lane_centers = [120 * (0.5 + i) for i in range(5)]
+
+    library = get_library()
+
+    def run(n):
+        # Same lane change schedule and maneuver tracking as main1.py
+        car = Car_4ws(0, lane_centers[2], angle=0, velocity=30)
+        max_curvature = get_table(car.max_steering_angle, car.length).range('in_phase')[1]
+        sim_time = change_time = 0.0
+        lane, direction, changes = 2, -1, 0
+        start = end = car.y
+        length, distance = 1.0, 0.0
+        for _ in range(n):
+            sim_time += DT
+            if start == end and sim_time - change_time > 2 and changes < 10:
+                if 0 <= lane + direction < len(lane_centers):
+                    lane += direction
+                    start, end = car.y, lane_centers[lane]
+                    length, distance = float(library.length_for(end - start, max_curvature)), 0.0
+                    changes += 1
+                    if changes % 5 == 0:
+                        direction *= -1
+            reference = library.reference('quintic', distance, length, start, end)
+            car.steer_to_curvature(float(track(car.y, car.yaw, car.velocity, *reference)), 'in_phase')
+            previous_x = car.x
+            car.update(DT)
+            car.x %= 800
+            distance += (car.x - previous_x) % 800
+            if start != end and distance >= length:
+                start = end
+                change_time = sim_time
+    return run
+
+
+@benchmark('scenario.traffic[500]', kind='macro')
+def _scenario_traffic():
+    lane_centers = [120 * (0.5 + i) for i in range(5)]
+
+    def run(n):
+        # main1.py --traffic 500: one tick advances 500 cars
+        traffic = Traffic(500, lane_centers, seed=0)
+        for _ in range(-(-n // 500)):
+            traffic.step(DT)
+        return -(-n // 500) * 500
+    return run
+
+
+def measure(setup, repeats=7, warmup=1, min_time=0.1):
+    """
+    Time one benchmark. The step count of a run is doubled until a run lasts
+    at least `min_time`, `warmup` runs are discarded, then `repeats` runs are
+    timed. Returns steps/sec statistics.
+    """
+    run = setup()
+    steps = 64
+    while True:
+        start = time.perf_counter()
+        done = run(steps) or steps
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        steps *= 2 if elapsed * 10 < min_time else 1.5
+        steps = int(steps)
+
+    for _ in range(warmup):
+        run(steps)
+    rates = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run(steps)
+        rates.append(done / (time.perf_counter() - start))
+    return {
+        'steps': done,
+        'repeats': repeats,
+        'median': statistics.median(rates),
+        'mean': statistics.fmean(rates),
+        'stdev': statistics.stdev(rates) if repeats > 1 else 0.0,
+        'min': min(rates),
+        'max': max(rates),
+    }
+
+
+def run_benchmarks(names, repeats=7, warmup=1, min_time=0.1, log=sys.stderr):
+    results = {}
+    for name in names:
+        results[name] = measure(BENCHMARKS[name][1], repeats, warmup, min_time)
+        results[name]['kind'] = BENCHMARKS[name][0]
+        print(f"{name:32s} {results[name]['median']:14,.0f} steps/s "
+              f"(+-{results[name]['stdev'] / results[name]['median']:.1%})", file=log)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pygame': pygame.version.ver,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.1, log=sys.stderr):
+    """
+    Compare median throughputs. A benchmark regresses when its median falls
+    more than `threshold` below the baseline's. Returns the regressed names.
+    """
+    regressions = []
+    print(f"{'benchmark':32s} {'baseline':>14s} {'current':>14s} {'change':>8s}", file=log)
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            print(f"{name:32s} {'-':>14s} {result['median']:14,.0f}      new", file=log)
+            continue
+        ratio = result['median'] / reference['median']
+        flag = ''
+        if ratio < 1 - threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:32s} {reference['median']:14,.0f} {result['median']:14,.0f} {ratio - 1:+8.1%}{flag}", file=log)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro and macro benchmarks, in steps/sec")
+    parser.add_argument('--filter', default='', help="Only run benchmarks whose name contains this text")
+    parser.add_argument('--kind', choices=['micro', 'macro'], help="Only run micro or macro benchmarks")
+    parser.add_argument('--repeats', type=int, default=7, help="Timed runs per benchmark")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed runs before timing")
+    parser.add_argument('--min-time', type=float, default=0.1, help="Minimum seconds per timed run")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE', help="Flag regressions against a saved JSON result")
+    parser.add_argument('--current', help="With --compare, compare this saved result instead of running")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Relative slowdown counted as a regression")
+    parser.add_argument('--list', action='store_true', help="List the benchmarks and exit")
+    args = parser.parse_args()
+
+    names = [name for name, (kind, _) in BENCHMARKS.items()
+             if args.filter in name and (args.kind is None or kind == args.kind)]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    if args.current:
+        with open(args.current) as current_file:
+            current = json.load(current_file)
+    else:
+        current = run_benchmarks(names, args.repeats, args.warmup, args.min_time)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(current, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
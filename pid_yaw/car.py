@@ -1,5 +1,8 @@
 import math
+import numpy as np
 import pygame
+import kernels
+from integrators import INTEGRATORS, INTEGRATOR_CODES
 from pid_controller import PIDController
 from constants import *
 
@@ -16,23 +19,95 @@ class Car:
         self.width = 20  # Width of the car
 
         self.max_steering_angle = math.radians(60)  # Maximum steering angle in radians
+        self.integrator = 'euler'  # Pose integrator, see integrators.py; 'arc' stays exact at large timesteps
+        self.gain_schedule = None  # Optional gain_schedule.GainSchedule replacing the hard rear-steer switch
 
     def update(self, delta_time, cte):
+        if self.gain_schedule is not None:
+            # Rear ratio and PID gains interpolated at the current speed and path curvature
+            rear_ratio, Kp, Ki, Kd = self.gain_schedule.lookup(
+                self.velocity, math.tan(self.front_wheel_angle) / self.length)
+            pid = self.pid_controller
+            pid.Kp, pid.Ki, pid.Kd = float(Kp), float(Ki), float(Kd)
+
         # PID control for front steering based on CTE
         steering_adjustment = self.pid_controller.update(cte, delta_time)
         self.front_wheel_angle = max(min(steering_adjustment, self.max_steering_angle), -self.max_steering_angle)
 
         # Simplified rear steering logic (for demonstration)
         # Adjusts rear steering based on velocity: counter-phase at low speeds, in-phase at high speeds
-        if self.velocity < 10:  # Threshold velocity for switching steering phase
+        if self.gain_schedule is not None:
+            self.rear_wheel_angle = float(rear_ratio) * steering_adjustment  # Blended across the phase change
+        elif self.velocity < 10:  # Threshold velocity for switching steering phase
             self.rear_wheel_angle = -steering_adjustment / 2  # Counter-phase steering at low speeds
         else:
             self.rear_wheel_angle = steering_adjustment / 4  # In-phase steering at high speeds
         
         # Update car yaw and position
-        self.yaw += (self.velocity * math.tan(steering_adjustment) / self.length) * delta_time
-        self.x += self.velocity * math.cos(self.yaw) * delta_time
-        self.y += self.velocity * math.sin(self.yaw) * delta_time
+        yaw_rate = self.velocity * math.tan(steering_adjustment) / self.length
+        self.x, self.y, self.yaw = INTEGRATORS[self.integrator](self.x, self.y, self.yaw, self.velocity,
+                                                                yaw_rate, delta_time)
+
+    def drive(self, delta_time):
+        # Advance with the front wheel angle already set (e.g. by path_tracking) instead of the PID output
+        self.front_wheel_angle = max(min(self.front_wheel_angle, self.max_steering_angle), -self.max_steering_angle)
+        yaw_rate = self.velocity * math.tan(self.front_wheel_angle) / self.length
+        self.x, self.y, self.yaw = INTEGRATORS[self.integrator](self.x, self.y, self.yaw, self.velocity,
+                                                                yaw_rate, delta_time)
+
+    def rollout(self, ctes, delta_time):
+        """
+        Run update() once per entry of `ctes` in compiled code (kernels.pid_rollout)
+        and leave the car and its PID controller in the final state.
+
+        :return: (steps, 5) array of x, y, yaw, front and rear wheel angle after each step.
+        """
+        if self.gain_schedule is not None:
+            # The kernel hard-codes the rear-steer switch, so scheduled cars step in Python
+            trajectory = np.empty((len(ctes), 5))
+            for i, cte in enumerate(ctes):
+                self.update(delta_time, cte)
+                trajectory[i] = self.x, self.y, self.yaw, self.front_wheel_angle, self.rear_wheel_angle
+            return trajectory
+
+        pid = self.pid_controller
+        trajectory, pid.integral, pid.previous_error = kernels.pid_rollout(
+            float(self.x), float(self.y), float(self.yaw), float(self.velocity),
+            float(pid.Kp), float(pid.Ki), float(pid.Kd), float(pid.integral), float(pid.previous_error),
+            float(self.length), float(self.max_steering_angle), float(delta_time),
+            np.asarray(ctes, dtype=float), INTEGRATOR_CODES[self.integrator])
+        if len(trajectory):
+            self.x, self.y, self.yaw, self.front_wheel_angle, self.rear_wheel_angle = trajectory[-1].tolist()
+        return trajectory
+
+    def rollout_circle(self, center_x, center_y, radius, steps, delta_time):
+        """
+        Closed-loop run of update() around a counterclockwise circle in
+        compiled code (kernels.pid_circle_rollout), the CTE of every step being
+        the exact signed distance to the circle (positive outside). Leaves the
+        car and its PID controller in the final state.
+
+        :return: (steps, 6) array of x, y, yaw, front and rear wheel angle after
+            each step, and the CTE the step was driven with.
+        """
+        if self.gain_schedule is not None:
+            # The kernel hard-codes the rear-steer switch, so scheduled cars step in Python
+            trajectory = np.empty((steps, 6))
+            for i in range(steps):
+                cte = math.hypot(self.x - center_x, self.y - center_y) - radius
+                self.update(delta_time, cte)
+                trajectory[i] = self.x, self.y, self.yaw, self.front_wheel_angle, self.rear_wheel_angle, cte
+            return trajectory
+
+        pid = self.pid_controller
+        trajectory, pid.integral, pid.previous_error = kernels.pid_circle_rollout(
+            float(self.x), float(self.y), float(self.yaw), float(self.velocity),
+            float(pid.Kp), float(pid.Ki), float(pid.Kd), float(pid.integral), float(pid.previous_error),
+            float(self.length), float(self.max_steering_angle), float(delta_time), int(steps),
+            float(center_x), float(center_y), float(radius), INTEGRATOR_CODES[self.integrator])
+        if len(trajectory):
+            self.x, self.y, self.yaw, self.front_wheel_angle, self.rear_wheel_angle = trajectory[-1, :5].tolist()
+        return trajectory
 
     def draw(self, screen):
         # Calculate car corners for rectangular representation
@@ -69,6 +144,4 @@ class Car:
 
         # Drawing the steering lines for front and rear
         pygame.draw.line(screen, RED, front_center, front_line_end, 2)
-        pygame.draw.line(screen, GREEN, rear_center, rear_line_end, 2)
-
-        print(f"Front Angle: {self.front_wheel_angle}, Rear Angle: {self.rear_wheel_angle}")
\ No newline at end of file
+        pygame.draw.line(screen, GREEN, rear_center, rear_line_end, 2)
\ No newline at end of file
@@ -1,5 +1,9 @@
 import math
+import numpy as np
 import pygame
+import kernels
+from curvature_table import get_table
+from integrators import INTEGRATORS, INTEGRATOR_CODES
 from pid_controller import PIDController
 from constants import *
 
@@ -14,6 +18,7 @@ class Car_4ws:
         self.rear_right_wheel_angle = 0
         self.length, self.width = 50, 20
         self.max_steering_angle = math.radians(30)
+        self.integrator = 'euler'  # Pose integrator, see integrators.py
 
     def update(self, delta_time, cte = None):
         if self.velocity == 0:
@@ -37,7 +42,9 @@ class Car_4ws:
         # Calculate effective turning radius
         # Use harmonic mean to avoid division by zero and handle infinite radii correctly
         if turn_radius_front != float('inf') and turn_radius_rear != float('inf'):
-            turn_radius_effective = 2 / (1 / turn_radius_front + 1 / turn_radius_rear)
+            # Equal and opposite axle angles cancel out and the car drives straight
+            total_curvature = 1 / turn_radius_front + 1 / turn_radius_rear
+            turn_radius_effective = float('inf') if total_curvature == 0 else 2 / total_curvature
         else:
             turn_radius_effective = turn_radius_front if turn_radius_rear == float('inf') else turn_radius_rear
         
@@ -48,13 +55,40 @@ class Car_4ws:
             angular_velocity = 0  # No angular velocity if moving straight
         
         # Update yaw and position
-        self.yaw += angular_velocity * delta_time
-        self.x += math.cos(self.yaw) * self.velocity * delta_time
-        self.y += math.sin(self.yaw) * self.velocity * delta_time
+        self.x, self.y, self.yaw = INTEGRATORS[self.integrator](self.x, self.y, self.yaw, self.velocity,
+                                                                angular_velocity, delta_time)
 
-        print(f"Front Left: {math.degrees(self.front_right_wheel_angle)}, Front Right: {math.degrees(self.rear_right_wheel_angle)}")
-        print(f"Rear Left: {math.degrees(self.front_left_wheel_angle)}, Rear Right: {math.degrees(self.rear_left_wheel_angle)}")
 
+    def steer_to_curvature(self, curvature, policy='front_only'):
+        # Set the wheels to turn with `curvature` (1 / radius) under a rear-steer policy, see curvature_table.py
+        front, rear = get_table(self.max_steering_angle, self.length).inverse(curvature, policy)
+        self.front_left_wheel_angle = self.front_right_wheel_angle = float(front)
+        self.rear_left_wheel_angle = self.rear_right_wheel_angle = float(rear)
+
+    def rollout(self, delta_time, steps=None, front_left=None, front_right=None, rear_left=None, rear_right=None):
+        """
+        Run update() for a schedule of wheel angles in compiled code
+        (kernels.car_4ws_rollout) and leave the car in the final state. Wheel
+        angles not given stay at their current value; scalars and arrays of
+        one entry per step are accepted.
+
+        :return: (steps, 7) array of x, y, yaw and the four wheel angles after each step.
+        """
+        schedules = [front_left, front_right, rear_left, rear_right]
+        if steps is None:
+            steps = max(np.size(schedule) for schedule in schedules if schedule is not None)
+        current = (self.front_left_wheel_angle, self.front_right_wheel_angle,
+                   self.rear_left_wheel_angle, self.rear_right_wheel_angle)
+        schedules = [np.ascontiguousarray(np.broadcast_to(np.asarray(value if schedule is None else schedule,
+                                                                     dtype=float), (steps,)))
+                     for schedule, value in zip(schedules, current)]
+        trajectory = kernels.car_4ws_rollout(float(self.x), float(self.y), float(self.yaw), float(self.velocity),
+                                             *schedules, float(self.length), float(self.max_steering_angle),
+                                             float(delta_time), INTEGRATOR_CODES[self.integrator])
+        if len(trajectory) and self.velocity != 0:
+            (self.x, self.y, self.yaw, self.front_left_wheel_angle, self.front_right_wheel_angle,
+             self.rear_left_wheel_angle, self.rear_right_wheel_angle) = trajectory[-1].tolist()
+        return trajectory
 
     def draw(self, screen):
         # Draw car body
@@ -0,0 +1,130 @@
+import math
+import numpy as np
+import kernels
+from curvature_table import get_table
+from integrators import BATCH_INTEGRATORS, INTEGRATOR_CODES
+from car_batch import move_along_heading
+
+
+class Car4wsBatch:
+    """
+    Vectorized version of Car_4ws that advances N four-wheel-steering cars at once.
+
+    The four wheel angles of every car live in arrays; step() reproduces
+    Car_4ws.update with masks instead of branches. Scalars passed to the
+    constructor are broadcast to all cars.
+    """
+
+    def __init__(self, x, y, angle=0, velocity=0, length=50, width=20,
+                 max_steering_angle=math.radians(30), n=None, integrator='euler'):
+        if n is None:
+            n = max(np.size(x), np.size(y), np.size(angle), np.size(velocity))
+        self.n = n
+
+        self.x = self._column(x)
+        self.y = self._column(y)
+        self.yaw = np.radians(self._column(angle))
+        self.velocity = self._column(velocity)
+        self.front_left_wheel_angle = np.zeros(n)
+        self.front_right_wheel_angle = np.zeros(n)
+        self.rear_left_wheel_angle = np.zeros(n)
+        self.rear_right_wheel_angle = np.zeros(n)
+        self.length = self._column(length)
+        self.width = self._column(width)
+        self.max_steering_angle = self._column(max_steering_angle)
+        self.integrator = integrator  # Pose integrator, see integrators.py
+
+        self.avg_front_wheel_angle = np.zeros(n)
+        self.avg_rear_wheel_angle = np.zeros(n)
+        self.curvature = np.zeros(n)  # 1 / turn_radius_effective, 0 when driving straight
+
+        # Scratch buffers reused every step
+        self._moving = np.empty(n, dtype=bool)
+        self._both_steered = np.empty(n, dtype=bool)
+        self._tmp = np.empty(n)
+        self._distance = np.empty(n)
+        self._half = np.empty(n)
+        self._denom = np.empty(n)
+
+    def _column(self, value):
+        return np.array(np.broadcast_to(np.asarray(value, dtype=float), (self.n,)))
+
+    @classmethod
+    def from_cars(cls, cars):
+        # Build a batch that continues from the current state of Car_4ws objects
+        batch = cls([c.x for c in cars], [c.y for c in cars], 0,
+                    [c.velocity for c in cars],
+                    [c.length for c in cars], [c.width for c in cars],
+                    [c.max_steering_angle for c in cars], integrator=cars[0].integrator)
+        batch.yaw[:] = [c.yaw for c in cars]
+        batch.front_left_wheel_angle[:] = [c.front_left_wheel_angle for c in cars]
+        batch.front_right_wheel_angle[:] = [c.front_right_wheel_angle for c in cars]
+        batch.rear_left_wheel_angle[:] = [c.rear_left_wheel_angle for c in cars]
+        batch.rear_right_wheel_angle[:] = [c.rear_right_wheel_angle for c in cars]
+        return batch
+
+    @property
+    def turn_radius_effective(self):
+        # Harmonic-mean turn radius of Car_4ws.update, inf for straight motion
+        radius = np.full(self.n, np.inf)
+        np.divide(1.0, self.curvature, out=radius, where=self.curvature != 0)
+        return radius
+
+    def steer_to_curvature(self, curvature, policy='front_only'):
+        # Car_4ws.steer_to_curvature for every car; assumes the cars share one geometry
+        table = get_table(self.max_steering_angle[0], self.length[0])
+        front, rear = table.inverse(np.broadcast_to(curvature, (self.n,)), policy)
+        self.front_left_wheel_angle[:] = self.front_right_wheel_angle[:] = front
+        self.rear_left_wheel_angle[:] = self.rear_right_wheel_angle[:] = rear
+
+    def step(self, delta_time):
+        if kernels.HAVE_NUMBA and self.n < kernels.BATCH_KERNEL_MAX:
+            kernels.car_4ws_batch_step(self.x, self.y, self.yaw, self.velocity,
+                                       self.front_left_wheel_angle, self.front_right_wheel_angle,
+                                       self.rear_left_wheel_angle, self.rear_right_wheel_angle,
+                                       self.length, self.max_steering_angle, self.curvature,
+                                       float(delta_time), INTEGRATOR_CODES[self.integrator])
+            np.add(self.front_left_wheel_angle, self.front_right_wheel_angle, out=self.avg_front_wheel_angle)
+            self.avg_front_wheel_angle *= 0.5
+            np.add(self.rear_left_wheel_angle, self.rear_right_wheel_angle, out=self.avg_rear_wheel_angle)
+            self.avg_rear_wheel_angle *= 0.5
+            return
+
+        moving = np.not_equal(self.velocity, 0, out=self._moving)  # Parked cars are left untouched
+        tmp = self._tmp
+
+        # Ensure wheel angles are within bounds
+        np.negative(self.max_steering_angle, out=tmp)
+        for wheel in (self.front_left_wheel_angle, self.front_right_wheel_angle,
+                      self.rear_left_wheel_angle, self.rear_right_wheel_angle):
+            np.minimum(wheel, self.max_steering_angle, out=wheel, where=moving)
+            np.maximum(wheel, tmp, out=wheel, where=moving)
+
+        np.add(self.front_left_wheel_angle, self.front_right_wheel_angle, out=self.avg_front_wheel_angle)
+        self.avg_front_wheel_angle *= 0.5
+        np.add(self.rear_left_wheel_angle, self.rear_right_wheel_angle, out=self.avg_rear_wheel_angle)
+        self.avg_rear_wheel_angle *= 0.5
+
+        # The harmonic mean of L / tan(front) and L / tan(rear) is the inverse of
+        # the mean curvature, so work in curvature: an unsteered axle contributes
+        # exactly 0 instead of an infinite radius. When only one axle steers its
+        # radius is used on its own, hence the factor 1/2 only where both steer.
+        np.logical_and(self.avg_front_wheel_angle != 0, self.avg_rear_wheel_angle != 0,
+                       out=self._both_steered)
+        np.tan(self.avg_front_wheel_angle, out=self.curvature)
+        self.curvature += np.tan(self.avg_rear_wheel_angle, out=tmp)
+        self.curvature /= self.length
+        np.multiply(self.curvature, 0.5, out=self.curvature, where=self._both_steered)
+
+        if self.integrator != 'euler':
+            # Parked cars have a zero velocity and yaw rate, so they do not move
+            np.multiply(self.curvature, self.velocity, out=tmp)
+            BATCH_INTEGRATORS[self.integrator](self.x, self.y, self.yaw, self.velocity, tmp, delta_time)
+            return
+
+        # Update yaw and position; straight cars get an exact zero yaw increment
+        distance = self._distance
+        np.multiply(self.velocity, delta_time, out=distance)
+        np.multiply(self.curvature, distance, out=tmp)
+        self.yaw += tmp
+        move_along_heading(self.x, self.y, self.yaw, distance, self._half, self._denom)
@@ -0,0 +1,190 @@
+import math
+import numpy as np
+import kernels
+from integrators import BATCH_INTEGRATORS, INTEGRATOR_CODES
+
+
+def move_along_heading(x, y, yaw, distance, half, denom):
+    # x += cos(yaw) * distance and y += sin(yaw) * distance, in place.
+    # cos/sin go through the half-angle tangent: one tan call is several times
+    # cheaper than separate cos and sin calls on large arrays. distance, half
+    # and denom are overwritten and must be float arrays shaped like yaw.
+    np.multiply(yaw, 0.5, out=half)
+    np.tan(half, out=half)
+    np.multiply(half, half, out=denom)
+    denom += 1.0
+    np.divide(distance, denom, out=distance)
+
+    np.subtract(2.0, denom, out=denom)  # 1 - tan^2(yaw / 2)
+    denom *= distance
+    x += denom
+    half *= 2.0  # 2 tan(yaw / 2)
+    half *= distance
+    y += half
+
+
+class CarBatch:
+    """
+    Vectorized version of Car that advances N vehicles with one step() call.
+
+    Every per-vehicle quantity of Car (pose, velocity, wheel angles and the
+    PIDController state) is stored as a NumPy array of length n, so the
+    bicycle model and the PID law run as array math instead of a Python loop.
+    Scalars passed to the constructor are broadcast to all vehicles. With a
+    gain_schedule.GainSchedule, the gains and rear ratio of every vehicle
+    are looked up from its speed each step instead of the hard switch.
+    """
+
+    def __init__(self, x, y, angle=0, velocity=15, Kp=0.1, Ki=0.0, Kd=0.01,
+                 length=50, max_steering_angle=math.radians(60), n=None, integrator='euler',
+                 gain_schedule=None):
+        if n is None:
+            n = max(np.size(x), np.size(y), np.size(angle), np.size(velocity),
+                    np.size(Kp), np.size(Ki), np.size(Kd))
+        self.n = n
+
+        self.x = self._column(x)
+        self.y = self._column(y)
+        self.yaw = np.radians(self._column(angle))  # Radians, like Car.yaw
+        self.velocity = self._column(velocity)
+        self.front_wheel_angle = np.zeros(n)
+        self.rear_wheel_angle = np.zeros(n)
+        self.length = self._column(length)
+        self.max_steering_angle = self._column(max_steering_angle)
+        self.integrator = integrator  # Pose integrator, see integrators.py
+        self.gain_schedule = gain_schedule
+
+        # PIDController state, one entry per vehicle
+        self.Kp = self._column(Kp)
+        self.Ki = self._column(Ki)
+        self.Kd = self._column(Kd)
+        self.integral = np.zeros(n)
+        self.previous_error = np.zeros(n)
+
+        # Scratch buffers reused every step to avoid per-step allocations
+        self._steering = np.empty(n)
+        self._tmp = np.empty(n)
+        self._half = np.empty(n)
+        self._denom = np.empty(n)
+        self._distance = np.empty(n)
+        self._low_speed = np.empty(n, dtype=bool)
+
+    def _column(self, value):
+        return np.array(np.broadcast_to(np.asarray(value, dtype=float), (self.n,)))
+
+    @classmethod
+    def from_cars(cls, cars):
+        # Build a batch that continues from the current state of scalar Car objects
+        batch = cls([c.x for c in cars], [c.y for c in cars], 0,
+                    [c.velocity for c in cars],
+                    [c.pid_controller.Kp for c in cars],
+                    [c.pid_controller.Ki for c in cars],
+                    [c.pid_controller.Kd for c in cars],
+                    [c.length for c in cars],
+                    [c.max_steering_angle for c in cars], integrator=cars[0].integrator,
+                    gain_schedule=cars[0].gain_schedule)
+        batch.yaw[:] = [c.yaw for c in cars]
+        batch.front_wheel_angle[:] = [c.front_wheel_angle for c in cars]
+        batch.rear_wheel_angle[:] = [c.rear_wheel_angle for c in cars]
+        batch.integral[:] = [c.pid_controller.integral for c in cars]
+        batch.previous_error[:] = [c.pid_controller.previous_error for c in cars]
+        return batch
+
+    def pid_update(self, error, delta_time):
+        # Same law as PIDController.update, written into self._steering
+        error = np.asarray(error, dtype=float)
+        out = self._steering
+        tmp = self._tmp
+
+        np.multiply(error, delta_time, out=tmp)
+        self.integral += tmp
+        np.multiply(self.Kp, error, out=out)
+        np.multiply(self.Ki, self.integral, out=tmp)
+        out += tmp
+        if delta_time > 0:
+            np.subtract(error, self.previous_error, out=tmp)
+            tmp /= delta_time
+            tmp *= self.Kd
+            out += tmp
+        self.previous_error[:] = error
+        return out
+
+    def step(self, delta_time, cte):
+        schedule = self.gain_schedule
+        if schedule is not None:
+            # Gains and rear ratio of the whole fleet in one table lookup
+            np.tan(self.front_wheel_angle, out=self._tmp)
+            self._tmp /= self.length
+            rear_ratio, self.Kp[:], self.Ki[:], self.Kd[:] = schedule.lookup(self.velocity, self._tmp)
+        elif kernels.HAVE_NUMBA and self.n < kernels.BATCH_KERNEL_MAX:
+            # One compiled loop instead of a dozen array passes, see BATCH_KERNEL_MAX
+            cte = np.broadcast_to(np.asarray(cte, dtype=float), (self.n,))
+            kernels.car_batch_step(self.x, self.y, self.yaw, self.velocity, self.front_wheel_angle,
+                                   self.rear_wheel_angle, self.integral, self.previous_error,
+                                   self.Kp, self.Ki, self.Kd, self.length, self.max_steering_angle,
+                                   cte, float(delta_time), INTEGRATOR_CODES[self.integrator])
+            return
+        elif kernels.HAVE_NUMBA:
+            # Large fleets: fused passes for the arithmetic, NumPy's SIMD tan in between
+            cte = np.broadcast_to(np.asarray(cte, dtype=float), (self.n,))
+            delta_time = float(delta_time)
+            kernels.car_batch_control(cte, delta_time, self.Kp, self.Ki, self.Kd, self.integral,
+                                      self.previous_error, self.velocity, self.max_steering_angle,
+                                      self.front_wheel_angle, self.rear_wheel_angle, self._steering)
+            np.tan(self._steering, out=self._tmp)
+            if self.integrator != 'euler':
+                self._tmp *= self.velocity
+                self._tmp /= self.length
+                BATCH_INTEGRATORS[self.integrator](self.x, self.y, self.yaw, self.velocity, self._tmp, delta_time)
+                return
+            kernels.euler_heading(self.yaw, self.velocity, self.length, self._tmp, delta_time, self._half)
+            np.tan(self._half, out=self._half)
+            kernels.euler_move(self.x, self.y, self.velocity, self._half, delta_time)
+            return
+
+        # PID control for front steering based on CTE
+        steering_adjustment = self.pid_update(cte, delta_time)
+        tmp = self._tmp
+        np.negative(self.max_steering_angle, out=tmp)
+        np.minimum(steering_adjustment, self.max_steering_angle, out=self.front_wheel_angle)
+        np.maximum(self.front_wheel_angle, tmp, out=self.front_wheel_angle)
+
+        if schedule is not None:
+            np.multiply(steering_adjustment, rear_ratio, out=self.rear_wheel_angle)
+        else:
+            # Counter-phase rear steering below 10, in-phase above (see Car.update)
+            np.less(self.velocity, 10, out=self._low_speed)
+            np.multiply(steering_adjustment, 0.25, out=self.rear_wheel_angle)
+            np.multiply(steering_adjustment, -0.5, out=self.rear_wheel_angle, where=self._low_speed)
+
+        if self.integrator != 'euler':
+            np.tan(steering_adjustment, out=tmp)
+            tmp *= self.velocity
+            tmp /= self.length
+            BATCH_INTEGRATORS[self.integrator](self.x, self.y, self.yaw, self.velocity, tmp, delta_time)
+            return
+
+        # Update car yaw
+        distance = self._distance
+        np.multiply(self.velocity, delta_time, out=distance)
+        np.tan(steering_adjustment, out=tmp)
+        tmp *= distance
+        tmp /= self.length
+        self.yaw += tmp
+
+        move_along_heading(self.x, self.y, self.yaw, distance, self._half, self._denom)
+
+    def drive(self, delta_time):
+        # Car.drive for every vehicle: the front wheel angles are set by the caller
+        np.negative(self.max_steering_angle, out=self._tmp)
+        np.minimum(self.front_wheel_angle, self.max_steering_angle, out=self.front_wheel_angle)
+        np.maximum(self.front_wheel_angle, self._tmp, out=self.front_wheel_angle)
+        yaw_rate = self._tmp
+        np.tan(self.front_wheel_angle, out=yaw_rate)
+        yaw_rate *= self.velocity
+        yaw_rate /= self.length
+        BATCH_INTEGRATORS[self.integrator](self.x, self.y, self.yaw, self.velocity, yaw_rate, delta_time)
+
+    def state(self):
+        # Stacked (n, 3) pose array, handy for recording trajectories
+        return np.stack((self.x, self.y, self.yaw), axis=1)
@@ -0,0 +1,167 @@
+"""
+Precomputed effective curvature of the 4WS model over (front, rear) angles.
+
+Car_4ws.update turns the average front and rear wheel angles into the
+harmonic mean of the two axle turn radii. In curvature terms that is
+(tan(front) + tan(rear)) / (2 * length) when both axles steer, and
+tan(angle) / length when only one does; the model jumps by a factor of two
+when an axle returns to exactly zero. The table keeps both pieces: a grid of
+the two-axle surface, interpolated bilinearly, and the single-axle curve,
+used when one angle is exactly zero, so grid points reproduce the model.
+
+The inverse direction gives the wheel angles that reach a target curvature
+under a rear-steer policy (rear = ratio * front), from a monotone 1D table
+built per ratio on first use. get_table() builds a table on first use and
+keeps it in memory; building takes well under a millisecond, so nothing is
+written to disk.
+"""
+import argparse
+import math
+import numpy as np
+
+# Rear / front angle ratios of the named rear-steer policies, see Car.update
+POLICIES = {'front_only': 0.0, 'counter_phase': -0.5, 'in_phase': 0.25}
+
+
+def model_curvature(front, rear, length):
+    # Exact 1 / turn_radius_effective of Car_4ws.update (0 when straight) for average axle angles
+    front = np.asarray(front, dtype=float)
+    rear = np.asarray(rear, dtype=float)
+    total = np.tan(front) + np.tan(rear)
+    return np.where((front != 0) & (rear != 0), total / 2, total) / length
+
+
+class CurvatureTable:
+    """
+    Effective curvature (1 / turn_radius_effective, 0 when straight) of
+    Car_4ws on a square grid of average front and rear angles.
+
+    :param max_steering_angle: Grid half-width in radians, the car's limit.
+    :param length: Wheelbase used by the model.
+    :param resolution: Grid points per axis; must be odd so 0 is on the grid.
+    """
+
+    def __init__(self, max_steering_angle=math.radians(30), length=50, resolution=121, surface=None):
+        if resolution % 2 == 0:
+            raise ValueError("resolution must be odd so that zero is a grid angle")
+        self.max_steering_angle = float(max_steering_angle)
+        self.length = float(length)
+        self.resolution = int(resolution)
+        self.angles = np.linspace(-self.max_steering_angle, self.max_steering_angle, self.resolution)
+        self.spacing = self.angles[1] - self.angles[0]
+        # Single-axle curvature, exact when the other axle is at zero
+        self.single = model_curvature(self.angles, 0.0, self.length)
+        if surface is None:
+            # Two-axle surface indexed [front, rear], continued through the zero row and column
+            surface = (self.single[:, None] + self.single[None, :]) / 2
+        self.surface = surface
+        self._inverse = {}
+
+    def _cell(self, angle):
+        # Lower grid index and fraction within the cell, clamped to the grid
+        position = (np.clip(angle, -self.max_steering_angle, self.max_steering_angle)
+                    + self.max_steering_angle) / self.spacing
+        index = np.minimum(position.astype(int), self.resolution - 2)
+        return index, position - index
+
+    def curvature(self, front, rear):
+        """
+        Effective curvature for average front and rear angles (scalars or
+        arrays), clamped to the table range like Car_4ws clamps its wheels.
+        """
+        front = np.asarray(front, dtype=float)
+        rear = np.asarray(rear, dtype=float)
+        i, u = self._cell(front)
+        j, v = self._cell(rear)
+        surface = self.surface
+        both = ((1 - u) * ((1 - v) * surface[i, j] + v * surface[i, j + 1])
+                + u * ((1 - v) * surface[i + 1, j] + v * surface[i + 1, j + 1]))
+        # One axle at zero: the model uses the other axle's radius on its own
+        front_only = (1 - u) * self.single[i] + u * self.single[i + 1]
+        rear_only = (1 - v) * self.single[j] + v * self.single[j + 1]
+        return np.where(rear == 0, front_only, np.where(front == 0, rear_only, both))
+
+    def _inverse_table(self, ratio):
+        # Curvature along rear = ratio * front, sampled on the front grid and sorted for np.interp
+        if ratio not in self._inverse:
+            # Keep the rear angle within its limit as well
+            limit = self.max_steering_angle / max(1.0, abs(ratio))
+            front = np.linspace(-limit, limit, self.resolution)
+            curvature = self.curvature(front, ratio * front)
+            if not np.all(np.diff(curvature) > 0):
+                raise ValueError(f"rear ratio {ratio} does not give a curvature that increases with the front angle")
+            self._inverse[ratio] = (curvature, front)
+        return self._inverse[ratio]
+
+    def inverse(self, curvature, policy='front_only'):
+        """
+        Average front and rear angles that reach `curvature` with
+        rear = ratio * front, ratio being a POLICIES name or a number above -1.
+        Targets beyond reach are clamped to the tightest achievable turn.
+
+        :return: (front, rear) angles in radians.
+        """
+        ratio = float(POLICIES.get(policy, policy))
+        curvatures, fronts = self._inverse_table(ratio)
+        front = np.interp(curvature, curvatures, fronts)
+        return front, ratio * front
+
+    def range(self, policy='front_only'):
+        # Smallest and largest curvature reachable under `policy`
+        curvatures, _ = self._inverse_table(float(POLICIES.get(policy, policy)))
+        return curvatures[0], curvatures[-1]
+
+    def save(self, path):
+        np.savez(path, max_steering_angle=self.max_steering_angle, length=self.length,
+                 resolution=self.resolution, surface=self.surface)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(float(data['max_steering_angle']), float(data['length']), int(data['resolution']),
+                       surface=data['surface'])
+
+
+_tables = {}
+
+
+def get_table(max_steering_angle=math.radians(30), length=50, resolution=121):
+    """
+    Shared CurvatureTable for a car geometry: built on the first call, then
+    served from memory.
+    """
+    key = (round(float(max_steering_angle), 12), float(length), int(resolution))
+    if key not in _tables:
+        _tables[key] = CurvatureTable(max_steering_angle, length, resolution)
+    return _tables[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a 4WS curvature table and report its accuracy")
+    parser.add_argument('--max-steering-angle', type=float, default=30, help="Degrees")
+    parser.add_argument('--length', type=float, default=50)
+    parser.add_argument('--resolution', type=int, default=121)
+    parser.add_argument('--output', help="Save the table to this .npz file")
+    args = parser.parse_args()
+
+    table = CurvatureTable(math.radians(args.max_steering_angle), args.length, args.resolution)
+    if args.output:
+        table.save(args.output)
+
+    # Compare with the exact model at random angles where both axles steer
+    rng = np.random.default_rng(0)
+    front, rear = rng.uniform(-table.max_steering_angle, table.max_steering_angle, (2, 100000))
+    exact = model_curvature(front, rear, table.length)
+    error = np.abs(table.curvature(front, rear) - exact)
+    print(f"forward: max error {error.max():.3e}, relative to max curvature {error.max() / table.single[-1]:.3e}")
+    for name in POLICIES:
+        low, high = table.range(name)
+        target = np.linspace(low, high, 1001)
+        front, rear = table.inverse(target, name)
+        reached = model_curvature(front, rear, table.length)
+        print(f"inverse {name:14s}: curvature {low:+.5f} .. {high:+.5f}, "
+              f"max error of the model at the returned angles {np.abs(reached - target).max():.3e}")
+
+
+if __name__ == '__main__':
+    main()
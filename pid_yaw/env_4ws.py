@@ -0,0 +1,263 @@
+import multiprocessing
+import numpy as np
+import gym
+from gym import spaces
+from gym.utils import seeding
+from gym.vector import VectorEnv
+from car_4ws_batch import Car4wsBatch
+from path import wrap_angle
+from rollout import make_path
+
+# Observation layout, one row per environment
+OBSERVATION = ('x', 'y', 'yaw', 'velocity', 'cte', 'heading_error', 'path_curvature')
+
+
+class Car4wsVectorEnv(VectorEnv):
+    """
+    M four-wheel-steering path-tracking environments stepped together.
+
+    All cars live in one Car4wsBatch and follow the same reference path, so a
+    step of every environment is a handful of NumPy calls. Uses the gym 0.19
+    API: reset() returns the observations, step() returns (observations,
+    rewards, dones, infos). Finished environments are reset automatically;
+    their last observation is in infos[i]['terminal_observation'].
+
+    Action: front left, front right, rear left and rear right wheel angles in
+    radians, then the longitudinal acceleration.
+    Observation: see OBSERVATION. cte is positive to the right of the path.
+    Reward: progress along the path in units of the distance covered at
+    max_velocity in one step, minus cte_weight * (cte / max_cte) ** 2.
+    An episode ends when |cte| exceeds max_cte, at the end of an open path,
+    or after max_steps steps (reported as TimeLimit.truncated).
+
+    :param num_envs: Number of environments M.
+    :param path: 'circle', 'square', 'random' or a Path.
+    :param start_noise: Standard deviations of the initial lateral offset,
+        heading error (radians) and velocity around the path start.
+    """
+
+    def __init__(self, num_envs, path='circle', seed=None, delta_time=1 / 60, max_steps=1000,
+                 max_acceleration=50.0, max_velocity=60.0, initial_velocity=20.0, max_cte=100.0,
+                 cte_weight=1.0, random_start=True, start_noise=(10.0, 0.2, 5.0)):
+        self.path = make_path(path, seed=seed) if isinstance(path, str) else path
+        self.delta_time = delta_time
+        self.max_steps = max_steps
+        self.max_velocity = max_velocity
+        self.initial_velocity = initial_velocity
+        self.max_cte = max_cte
+        self.cte_weight = cte_weight
+        self.random_start = random_start
+        self.start_noise = start_noise
+
+        self.cars = Car4wsBatch(np.zeros(num_envs), 0, 0, 0)
+        max_angle = float(self.cars.max_steering_angle[0])
+        action_space = spaces.Box(low=np.array([-max_angle] * 4 + [-max_acceleration], dtype=np.float32),
+                                  high=np.array([max_angle] * 4 + [max_acceleration], dtype=np.float32))
+        observation_space = spaces.Box(-np.inf, np.inf, shape=(len(OBSERVATION),), dtype=np.float32)
+        super().__init__(num_envs, observation_space, action_space)
+
+        self.steps = np.zeros(num_envs, dtype=int)
+        self.station = np.zeros(num_envs)
+        self._actions = None
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def _reset_envs(self, index):
+        # New episodes for the environments in `index`, near the path start or a random station
+        count = len(index)
+        stations = self.np_random.uniform(0, self.path.length, count) if self.random_start else np.zeros(count)
+        x, y, heading = self.path.interpolate(stations)
+        offset_noise, heading_noise, velocity_noise = self.start_noise
+        offset = self.np_random.normal(0, offset_noise, count)
+        cars = self.cars
+        cars.x[index] = x + offset * np.sin(heading)  # Positive offset is to the right, like the CTE
+        cars.y[index] = y - offset * np.cos(heading)
+        cars.yaw[index] = heading + self.np_random.normal(0, heading_noise, count)
+        cars.velocity[index] = np.clip(self.initial_velocity + self.np_random.normal(0, velocity_noise, count),
+                                       0, self.max_velocity)
+        for wheel in (cars.front_left_wheel_angle, cars.front_right_wheel_angle,
+                      cars.rear_left_wheel_angle, cars.rear_right_wheel_angle):
+            wheel[index] = 0
+        self.steps[index] = 0
+
+    def _observe(self):
+        # Observations and path projection of every car
+        cars = self.cars
+        station, segment, cte = self.path.project(cars.x, cars.y)
+        heading_error = wrap_angle(cars.yaw - self.path.headings[segment])
+        observations = np.stack((cars.x, cars.y, wrap_angle(cars.yaw), cars.velocity, cte, heading_error,
+                                 self.path.curvature_at(station)), axis=1).astype(np.float32)
+        return observations, station, cte
+
+    def reset_async(self, *args, **kwargs):
+        pass
+
+    def reset_wait(self, *args, **kwargs):
+        self._reset_envs(np.arange(self.num_envs))
+        observations, self.station, _ = self._observe()
+        return observations
+
+    def step_async(self, actions):
+        self._actions = actions
+
+    def step_wait(self, *args, **kwargs):
+        actions = np.clip(np.asarray(self._actions, dtype=float).reshape(self.num_envs, -1),
+                          self.action_space.low, self.action_space.high)
+        cars = self.cars
+        cars.front_left_wheel_angle[:] = actions[:, 0]
+        cars.front_right_wheel_angle[:] = actions[:, 1]
+        cars.rear_left_wheel_angle[:] = actions[:, 2]
+        cars.rear_right_wheel_angle[:] = actions[:, 3]
+        cars.velocity += actions[:, 4] * self.delta_time
+        np.clip(cars.velocity, 0, self.max_velocity, out=cars.velocity)
+        cars.step(self.delta_time)
+        self.steps += 1
+
+        observations, station, cte = self._observe()
+        progress = station - self.station
+        if self.path.closed:
+            # Crossing the start of a loop jumps the station by the path length
+            progress = (progress + self.path.length / 2) % self.path.length - self.path.length / 2
+        rewards = progress / (self.max_velocity * self.delta_time) - self.cte_weight * (cte / self.max_cte) ** 2
+
+        failed = ~(np.abs(cte) <= self.max_cte)  # Also catches NaN
+        if not self.path.closed:
+            failed |= station >= self.path.length
+        truncated = (self.steps >= self.max_steps) & ~failed
+        dones = failed | truncated
+
+        infos = [{} for _ in range(self.num_envs)]
+        self.station = station
+        finished = np.flatnonzero(dones)
+        if len(finished):
+            for i in finished:
+                infos[i]['terminal_observation'] = observations[i].copy()
+                if truncated[i]:
+                    infos[i]['TimeLimit.truncated'] = True
+            self._reset_envs(finished)
+            observations, self.station, _ = self._observe()
+        return observations, rewards.astype(np.float32), dones, infos
+
+
+class Car4wsEnv(gym.Env):
+    """
+    Single 4WS path-tracking environment: a Car4wsVectorEnv of one, with the
+    same spaces, reward and termination. After an episode ends the returned
+    observation is the terminal one; call reset() to start the next episode.
+    """
+
+    metadata = {'render.modes': []}
+
+    def __init__(self, **kwargs):
+        self.vector_env = Car4wsVectorEnv(1, **kwargs)
+        self.action_space = self.vector_env.single_action_space
+        self.observation_space = self.vector_env.single_observation_space
+
+    def seed(self, seed=None):
+        return self.vector_env.seed(seed)
+
+    def reset(self):
+        return self.vector_env.reset()[0]
+
+    def step(self, action):
+        observations, rewards, dones, infos = self.vector_env.step(np.asarray(action)[None])
+        info = infos[0]
+        observation = info.pop('terminal_observation', observations[0])
+        return observation, float(rewards[0]), bool(dones[0]), info
+
+
+def _worker(remote, parent_remote, num_envs, kwargs):
+    # Runs one Car4wsVectorEnv in a subprocess, driven by commands over a pipe
+    parent_remote.close()
+    env = Car4wsVectorEnv(num_envs, **kwargs)
+    try:
+        while True:
+            command, data = remote.recv()
+            if command == 'step':
+                remote.send(env.step(data))
+            elif command == 'reset':
+                remote.send(env.reset())
+            elif command == 'seed':
+                remote.send(env.seed(data))
+            elif command == 'close':
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+
+class SubprocCar4wsVectorEnv(VectorEnv):
+    """
+    Car4wsVectorEnv spread over worker processes to use several cores. Each
+    worker steps its share of the environments as one batch, so the pipe
+    traffic is one message per worker per step, not per environment.
+
+    :param num_envs: Total number of environments.
+    :param processes: Number of workers, all cores by default.
+    :param kwargs: Passed to every Car4wsVectorEnv; worker i gets seed + i for
+        its start noise. A named path is built once here, so every worker
+        follows the same Path.
+    """
+
+    def __init__(self, num_envs, processes=None, context=None, **kwargs):
+        processes = min(processes or multiprocessing.cpu_count(), num_envs)
+        self.sizes = [len(part) for part in np.array_split(np.arange(num_envs), processes)]
+        self.bounds = np.cumsum([0] + self.sizes)
+
+        ctx = multiprocessing.get_context(context)
+        seed = kwargs.pop('seed', None)
+        # One road for all workers and the spec env; only the start noise is seeded per worker
+        path = kwargs.get('path', 'circle')
+        kwargs['path'] = make_path(path, seed=seed) if isinstance(path, str) else path
+        self.remotes, self.processes = [], []
+        for i, size in enumerate(self.sizes):
+            remote, work_remote = ctx.Pipe()
+            worker_kwargs = dict(kwargs, seed=None if seed is None else seed + i)
+            process = ctx.Process(target=_worker, args=(work_remote, remote, size, worker_kwargs), daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+        # Spaces are the same as a local environment's
+        spec = Car4wsVectorEnv(1, **kwargs)
+        super().__init__(num_envs, spec.single_observation_space, spec.single_action_space)
+
+    def seed(self, seed=None):
+        seeds = []
+        for i, remote in enumerate(self.remotes):
+            remote.send(('seed', None if seed is None else seed + i))
+        for remote in self.remotes:
+            seeds.extend(remote.recv())
+        return seeds
+
+    def reset_async(self, *args, **kwargs):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+
+    def reset_wait(self, *args, **kwargs):
+        return np.concatenate([remote.recv() for remote in self.remotes])
+
+    def step_async(self, actions):
+        actions = np.asarray(actions)
+        for remote, start, stop in zip(self.remotes, self.bounds[:-1], self.bounds[1:]):
+            remote.send(('step', actions[start:stop]))
+
+    def step_wait(self, *args, **kwargs):
+        results = [remote.recv() for remote in self.remotes]
+        observations, rewards, dones, infos = zip(*results)
+        return (np.concatenate(observations), np.concatenate(rewards), np.concatenate(dones),
+                [info for worker_infos in infos for info in worker_infos])
+
+    def close_extras(self, **kwargs):
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+
+
+gym.envs.registration.register(id='Car4ws-v0', entry_point='env_4ws:Car4wsEnv')
@@ -0,0 +1,156 @@
+"""
+Gain-scheduled rear-steer and PID gains.
+
+Car.update switches the rear wheels from counter-phase (-steering / 2) to
+in-phase (steering / 4) at a hard velocity of 10 and keeps fixed PID gains.
+A GainSchedule instead interpolates the rear/front ratio and Kp, Ki, Kd from
+tables on a uniform speed grid (optionally speed x path curvature), so the
+phase change is a smooth blend. Lookups index the grid directly, O(1) per
+car, and work on whole arrays at once for a CarBatch fleet.
+
+Run this module to build a schedule from a gain_sweep.py CSV: for every
+swept velocity the best non-diverged gains are picked and interpolated over
+the speed grid.
+"""
+import argparse
+import csv
+import sys
+import numpy as np
+
+FIELDS = ('rear_ratio', 'Kp', 'Ki', 'Kd')
+
+
+def _smoothstep(t):
+    t = np.clip(t, 0.0, 1.0)
+    return t * t * (3 - 2 * t)
+
+
+class GainSchedule:
+    """
+    :param speed_range: (min, max) speed of the uniform grid.
+    :param tables: Arrays for every FIELDS entry, shaped (speeds,) or
+        (speeds, curvatures) when curvature_range is given.
+    :param curvature_range: (min, max) |curvature| of the second grid axis.
+    """
+
+    def __init__(self, speed_range, rear_ratio, Kp, Ki, Kd, curvature_range=None):
+        self.speed_range = tuple(float(value) for value in speed_range)
+        self.curvature_range = None if curvature_range is None else tuple(float(value) for value in curvature_range)
+        self.tables = {name: np.asarray(table, dtype=float)
+                       for name, table in zip(FIELDS, (rear_ratio, Kp, Ki, Kd))}
+        shape = self.tables['rear_ratio'].shape
+        if any(table.shape != shape for table in self.tables.values()):
+            raise ValueError("all gain tables must have the same shape")
+        if len(shape) != (1 if curvature_range is None else 2):
+            raise ValueError("tables must be 1D over speed, or 2D over speed and curvature with curvature_range")
+
+    @classmethod
+    def default(cls, blend=(5.0, 15.0), Kp=0.1, Ki=0.0, Kd=0.01, max_speed=100.0, points=101):
+        # Car.update's rule (-1/2 below 10, +1/4 above) blended smoothly across `blend`
+        speeds = np.linspace(0.0, max_speed, points)
+        rear_ratio = -0.5 + 0.75 * _smoothstep((speeds - blend[0]) / (blend[1] - blend[0]))
+        constant = np.ones(points)
+        return cls((0.0, max_speed), rear_ratio, Kp * constant, Ki * constant, Kd * constant)
+
+    def _cell(self, value, value_range, count):
+        # Lower grid index and fraction, clamped to the table
+        low, high = value_range
+        position = (np.clip(value, low, high) - low) * ((count - 1) / (high - low))
+        index = np.minimum(position.astype(int), count - 2)
+        return index, position - index
+
+    def lookup(self, speed, curvature=0.0):
+        """
+        Interpolated (rear_ratio, Kp, Ki, Kd) at `speed` (and |curvature| for
+        2D tables), as arrays shaped like the inputs.
+        """
+        speed = np.asarray(speed, dtype=float)
+        i, u = self._cell(speed, self.speed_range, self.tables['rear_ratio'].shape[0])
+        if self.curvature_range is None:
+            return tuple((1 - u) * table[i] + u * table[i + 1] for table in self.tables.values())
+        j, v = self._cell(np.abs(np.asarray(curvature, dtype=float)), self.curvature_range,
+                          self.tables['rear_ratio'].shape[1])
+        return tuple((1 - u) * ((1 - v) * table[i, j] + v * table[i, j + 1])
+                     + u * ((1 - v) * table[i + 1, j] + v * table[i + 1, j + 1])
+                     for table in self.tables.values())
+
+    def save(self, path):
+        extra = {} if self.curvature_range is None else {'curvature_range': self.curvature_range}
+        # Through a file handle, so np.savez keeps the name as given instead of appending .npz
+        with open(path, 'wb') as output:
+            np.savez(output, speed_range=self.speed_range, **self.tables, **extra)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            curvature_range = data['curvature_range'] if 'curvature_range' in data else None
+            return cls(data['speed_range'], *(data[name] for name in FIELDS), curvature_range=curvature_range)
+
+
+def load_schedule(source):
+    # 'default' for GainSchedule.default(), otherwise a file written by GainSchedule.save
+    return GainSchedule.default() if source == 'default' else GainSchedule.load(source)
+
+
+def from_sweep(rows, objective='rms_cte', path=None, points=101, max_speed=None, rear_ratio=None):
+    """
+    Build a GainSchedule from gain_sweep.py rows (dicts keyed by its COLUMNS).
+
+    For every swept velocity the non-diverged row with the lowest `objective`
+    gives the PID gains; they are interpolated linearly over a uniform grid
+    and held constant beyond the swept velocities. The rear ratio comes from
+    a 'rear_ratio' column when the sweep has one, otherwise from
+    GainSchedule.default() (or `rear_ratio`, a constant).
+    """
+    best = {}
+    for row in rows:
+        if path is not None and row['path'] != path:
+            continue
+        if row['diverged'] in ('True', True):
+            continue
+        velocity = float(row['velocity'])
+        if velocity not in best or float(row[objective]) < float(best[velocity][objective]):
+            best[velocity] = row
+    if not best:
+        raise ValueError("the sweep has no non-diverged rollout to build a schedule from")
+
+    velocities = np.array(sorted(best))
+    max_speed = max_speed or max(100.0, float(velocities[-1]))
+    speeds = np.linspace(0.0, max_speed, points)
+
+    def column(name):
+        return np.interp(speeds, velocities, [float(best[velocity][name]) for velocity in velocities])
+
+    if 'rear_ratio' in best[velocities[0]]:
+        ratio = column('rear_ratio')
+    elif rear_ratio is not None:
+        ratio = np.full(points, float(rear_ratio))
+    else:
+        ratio = GainSchedule.default(max_speed=max_speed, points=points).tables['rear_ratio']
+    return GainSchedule((0.0, max_speed), ratio, column('Kp'), column('Ki'), column('Kd'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a gain schedule from a gain_sweep.py results table")
+    parser.add_argument('sweep', help="CSV written by gain_sweep.py --output (sweep several --velocity values)")
+    parser.add_argument('--output', required=True, help="Schedule file (.npz)")
+    parser.add_argument('--objective', default='rms_cte', help="Metric column to minimize")
+    parser.add_argument('--path', help="Only use rows of this path type")
+    parser.add_argument('--points', type=int, default=101, help="Speed grid points")
+    parser.add_argument('--max-speed', type=float, help="Upper end of the speed grid")
+    parser.add_argument('--rear-ratio', type=float, help="Constant rear/front ratio instead of the default blend")
+    args = parser.parse_args()
+
+    with open(args.sweep, newline='') as sweep:
+        rows = list(csv.DictReader(sweep))
+    schedule = from_sweep(rows, args.objective, args.path, args.points, args.max_speed, args.rear_ratio)
+    schedule.save(args.output)
+
+    low, high = schedule.speed_range
+    for speed in np.linspace(low, high, 6):
+        ratio, Kp, Ki, Kd = (float(value) for value in schedule.lookup(speed))
+        print(f"speed {speed:6.1f}: rear_ratio {ratio:+.3f}  Kp {Kp:.4g}  Ki {Ki:.4g}  Kd {Kd:.4g}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
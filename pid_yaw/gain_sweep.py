@@ -0,0 +1,117 @@
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from multiprocessing import Pool
+import numpy as np
+from rollout import METRICS, make_path, simulate_pid
+
+COLUMNS = ('path', 'velocity', 'Kp', 'Ki', 'Kd') + METRICS
+
+
+def parse_values(text):
+    """
+    Parse a list of values for one swept parameter.
+
+    Accepts a comma separated list ("0.1,0.2,0.5") or a linear range written
+    as start:stop:count ("0:1:11", both ends included).
+    """
+    if ':' in text:
+        start, stop, count = text.split(':')
+        return np.linspace(float(start), float(stop), int(count)).tolist()
+    return [float(value) for value in text.split(',')]
+
+
+_paths = {}
+
+
+def _run_chunk(task):
+    # Worker: one CarBatch rollout for a chunk of gain triples on one path/speed
+    path_type, velocity, gains, options = task
+    key = (path_type, options['seed'])
+    if key not in _paths:
+        _paths[key] = make_path(path_type, seed=options['seed'])
+    gains = np.asarray(gains)
+    metrics = simulate_pid(_paths[key], gains[:, 0], gains[:, 1], gains[:, 2], velocity,
+                           duration=options['duration'], delta_time=options['dt'],
+                           initial_offset=options['initial_offset'])
+    rows = []
+    for i, (Kp, Ki, Kd) in enumerate(gains):
+        row = [path_type, velocity, Kp, Ki, Kd]
+        row += [bool(metrics[name][i]) if name == 'diverged' else float(metrics[name][i]) for name in METRICS]
+        rows.append(row)
+    return rows
+
+
+def sweep(Kp_values, Ki_values, Kd_values, velocities, path_types, workers=None, chunk_size=1024,
+          duration=20.0, dt=1 / 60, initial_offset=20.0, seed=0):
+    """
+    Run the full Kp x Ki x Kd x velocity x path grid across a process pool.
+
+    Each task is a chunk of gain triples for one path and velocity, simulated
+    as a single vectorized batch, so the pool overhead is paid per chunk and
+    not per rollout. Returns a list of rows ordered like COLUMNS.
+    """
+    options = {'duration': duration, 'dt': dt, 'initial_offset': initial_offset, 'seed': seed}
+    gains = list(itertools.product(Kp_values, Ki_values, Kd_values))
+    tasks = [(path_type, velocity, gains[i:i + chunk_size], options)
+             for path_type in path_types
+             for velocity in velocities
+             for i in range(0, len(gains), chunk_size)]
+
+    rows = []
+    with Pool(workers or os.cpu_count()) as pool:
+        for chunk in pool.imap_unordered(_run_chunk, tasks):
+            rows.extend(chunk)
+    return rows
+
+
+def write_table(rows, output):
+    writer = csv.writer(output)
+    writer.writerow(COLUMNS)
+    writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel PID gain sweep with headless rollouts")
+    parser.add_argument('--kp', default='0:1:11', help="Kp values: list 'a,b,c' or range 'start:stop:count'")
+    parser.add_argument('--ki', default='0', help="Ki values")
+    parser.add_argument('--kd', default='0:0.1:5', help="Kd values")
+    parser.add_argument('--velocity', default='30', help="Car velocities")
+    parser.add_argument('--path', default='circle', help="Comma separated path types: circle, square, random")
+    parser.add_argument('--duration', type=float, default=20.0, help="Simulated seconds per rollout")
+    parser.add_argument('--dt', type=float, default=1 / 60, help="Physics timestep in seconds")
+    parser.add_argument('--initial-offset', type=float, default=20.0, help="Starting lateral offset from the path")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random path")
+    parser.add_argument('--workers', type=int, help="Worker processes, all cores by default")
+    parser.add_argument('--chunk-size', type=int, default=1024, help="Gain triples simulated per task")
+    parser.add_argument('--output', help="CSV file for the results table, stdout by default")
+    parser.add_argument('--top', type=int, default=10, help="Best rows by RMS CTE to summarize on stderr")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = sweep(parse_values(args.kp), parse_values(args.ki), parse_values(args.kd),
+                 parse_values(args.velocity), args.path.split(','), workers=args.workers,
+                 chunk_size=args.chunk_size, duration=args.duration, dt=args.dt,
+                 initial_offset=args.initial_offset, seed=args.seed)
+    elapsed = time.perf_counter() - start
+
+    rows.sort(key=lambda row: (row[0], row[1], row[COLUMNS.index('diverged')], row[COLUMNS.index('rms_cte')]))
+    if args.output:
+        with open(args.output, 'w', newline='') as output:
+            write_table(rows, output)
+    else:
+        write_table(rows, sys.stdout)
+
+    print(f"{len(rows)} rollouts in {elapsed:.1f} s", file=sys.stderr)
+    ranked = sorted((row for row in rows if not row[COLUMNS.index('diverged')]),
+                    key=lambda row: row[COLUMNS.index('rms_cte')])
+    for row in ranked[:args.top]:
+        print(', '.join(f"{name}={value:.4g}" if isinstance(value, float) else f"{name}={value}"
+                        for name, value in zip(COLUMNS, row)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
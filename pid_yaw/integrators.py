@@ -0,0 +1,160 @@
+"""
+Pose integrators for the kinematic car models.
+
+Every integrator advances (x, y, yaw) over one step of length dt for a car
+moving at `velocity` while turning at a constant `yaw_rate` (velocity times
+curvature), which is what the models hold fixed within a step:
+
+euler           yaw first, then position along the new heading (Car, Car_4ws)
+explicit_euler  position along the old heading, then yaw (root main.py)
+arc             exact: the car follows a circular arc, so the only error
+                left is the controller's zero-order hold, whatever dt is
+rk4             classic Runge-Kutta, 4th order in dt
+
+The scalar functions use math and return the new pose; the *_batch variants
+take NumPy arrays and update x, y and yaw in place. Run this module to print
+the error of each integrator against a reference at several timesteps.
+"""
+import argparse
+import math
+import numpy as np
+
+
+def euler(x, y, yaw, velocity, yaw_rate, dt):
+    yaw += yaw_rate * dt
+    x += velocity * math.cos(yaw) * dt
+    y += velocity * math.sin(yaw) * dt
+    return x, y, yaw
+
+
+def explicit_euler(x, y, yaw, velocity, yaw_rate, dt):
+    x += velocity * math.cos(yaw) * dt
+    y += velocity * math.sin(yaw) * dt
+    yaw += yaw_rate * dt
+    return x, y, yaw
+
+
+def arc(x, y, yaw, velocity, yaw_rate, dt):
+    # The chord of an arc of length d turning by a spans d * sinc(a / 2) along
+    # the mean heading yaw + a / 2; the series keeps straight lines exact
+    turn = yaw_rate * dt
+    half = turn / 2
+    if abs(half) > 1e-4:
+        chord = velocity * dt * math.sin(half) / half
+    else:
+        chord = velocity * dt * (1 - half * half / 6)
+    heading = yaw + half
+    return x + chord * math.cos(heading), y + chord * math.sin(heading), yaw + turn
+
+
+def rk4(x, y, yaw, velocity, yaw_rate, dt):
+    # With constant yaw rate the stages reduce to Simpson's rule on the heading
+    turn = yaw_rate * dt
+    weight = velocity * dt / 6
+    middle = yaw + turn / 2
+    end = yaw + turn
+    x += weight * (math.cos(yaw) + 4 * math.cos(middle) + math.cos(end))
+    y += weight * (math.sin(yaw) + 4 * math.sin(middle) + math.sin(end))
+    return x, y, end
+
+
+def euler_batch(x, y, yaw, velocity, yaw_rate, dt):
+    yaw += yaw_rate * dt
+    x += velocity * np.cos(yaw) * dt
+    y += velocity * np.sin(yaw) * dt
+
+
+def explicit_euler_batch(x, y, yaw, velocity, yaw_rate, dt):
+    x += velocity * np.cos(yaw) * dt
+    y += velocity * np.sin(yaw) * dt
+    yaw += yaw_rate * dt
+
+
+def arc_batch(x, y, yaw, velocity, yaw_rate, dt):
+    half = yaw_rate * (dt / 2)
+    # np.sinc(t) is sin(pi t) / (pi t), exact at 0
+    chord = velocity * dt * np.sinc(half / math.pi)
+    heading = yaw + half
+    x += chord * np.cos(heading)
+    y += chord * np.sin(heading)
+    yaw += 2 * half
+
+
+def rk4_batch(x, y, yaw, velocity, yaw_rate, dt):
+    turn = yaw_rate * dt
+    weight = velocity * dt / 6
+    middle = yaw + turn / 2
+    end = yaw + turn
+    x += weight * (np.cos(yaw) + 4 * np.cos(middle) + np.cos(end))
+    y += weight * (np.sin(yaw) + 4 * np.sin(middle) + np.sin(end))
+    yaw[...] = end
+
+
+INTEGRATORS = {'euler': euler, 'explicit_euler': explicit_euler, 'arc': arc, 'rk4': rk4}
+BATCH_INTEGRATORS = {'euler': euler_batch, 'explicit_euler': explicit_euler_batch,
+                     'arc': arc_batch, 'rk4': rk4_batch}
+# Integer codes of the integrators inside the compiled kernels
+INTEGRATOR_CODES = {'euler': 0, 'explicit_euler': 1, 'arc': 2, 'rk4': 3}
+
+
+def _yaw_rate_profile(t, velocity):
+    # Smoothly varying test manoeuvre: curvature between -1/60 and 1/40
+    return velocity * (0.0042 + 0.0208 * math.sin(0.7 * t) * math.cos(0.23 * t))
+
+
+def integration_error(integrator, dt, duration=60.0, velocity=30.0, reference_dt=1e-4, yaw_rate=None):
+    """
+    Final and maximum position error of `integrator` at timestep dt.
+
+    The yaw rate is held constant over each step like a controller would
+    hold it: a fixed `yaw_rate`, compared with the closed-form circle, or by
+    default a smooth manoeuvre sampled at the start of every step. The
+    reference for the manoeuvre follows the continuous yaw rate, sampled at
+    the middle of every `reference_dt` substep, so holding the rate over a
+    large dt counts as error like the integration itself does.
+
+    :return: (final_error, max_error, steps)
+    """
+    steps = int(round(duration / dt))
+    step = INTEGRATORS[integrator]
+    x = y = yaw = 0.0
+    max_error = 0.0
+    substeps = max(1, int(round(dt / reference_dt)))
+    rx = ry = ryaw = 0.0
+    for i in range(steps):
+        rate = yaw_rate if yaw_rate is not None else _yaw_rate_profile(i * dt, velocity)
+        x, y, yaw = step(x, y, yaw, velocity, rate, dt)
+        if yaw_rate is not None:
+            # Closed form: circle of radius velocity / yaw_rate through the origin
+            t = (i + 1) * dt
+            if yaw_rate:
+                radius = velocity / yaw_rate
+                rx, ry = radius * math.sin(yaw_rate * t), radius * (1 - math.cos(yaw_rate * t))
+            else:
+                rx, ry = velocity * t, 0.0
+        else:
+            substep = dt / substeps
+            for k in range(substeps):
+                rx, ry, ryaw = arc(rx, ry, ryaw, velocity, _yaw_rate_profile(i * dt + (k + 0.5) * substep, velocity),
+                                   substep)
+        max_error = max(max_error, math.hypot(x - rx, y - ry))
+    return math.hypot(x - rx, y - ry), max_error, steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Position error of each integrator against a reference")
+    parser.add_argument('--dt', default='0.0167,0.05,0.1,0.25,0.5', help="Comma separated timesteps")
+    parser.add_argument('--duration', type=float, default=60.0, help="Simulated seconds")
+    parser.add_argument('--velocity', type=float, default=30.0)
+    parser.add_argument('--yaw-rate', type=float, help="Constant yaw rate instead of the smooth manoeuvre")
+    args = parser.parse_args()
+
+    print(f"{'integrator':16s} {'dt':>8s} {'steps':>7s} {'final error':>12s} {'max error':>12s}")
+    for name in INTEGRATORS:
+        for dt in (float(value) for value in args.dt.split(',')):
+            final, worst, steps = integration_error(name, dt, args.duration, args.velocity, yaw_rate=args.yaw_rate)
+            print(f"{name:16s} {dt:8.4f} {steps:7d} {final:12.3e} {worst:12.3e}")
+
+
+if __name__ == '__main__':
+    main()
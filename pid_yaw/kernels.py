@@ -0,0 +1,236 @@
+"""
+Compiled physics and control kernels.
+
+With numba installed every kernel is compiled with @njit(cache=True), so the
+machine code is cached on disk (in __pycache__) and later runs start without
+recompiling. Without numba, njit is a no-op and the very same functions run
+as plain Python, giving the same results as Car, Car_4ws and PIDController
+(the operations are written in the same order).
+"""
+import math
+import numpy as np
+import integrators
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # Stand-in for numba.njit, used both as @njit and as @njit(...)
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+# The batch kernels loop over vehicles with scalar libm calls. NumPy's SIMD
+# tan is much faster per element, so above this many vehicles CarBatch.step
+# splits the work: the arithmetic runs in the fused passes car_batch_control,
+# euler_heading and euler_move, and the two tan calls go through NumPy.
+# Car4wsBatch.step uses its NumPy version there.
+BATCH_KERNEL_MAX = 1024
+
+_euler = njit(cache=True)(integrators.euler)
+_explicit_euler = njit(cache=True)(integrators.explicit_euler)
+_arc = njit(cache=True)(integrators.arc)
+_rk4 = njit(cache=True)(integrators.rk4)
+
+
+@njit(cache=True)
+def integrate(integrator, x, y, yaw, velocity, yaw_rate, delta_time):
+    # Pose step with the integrator of code `integrator`, see integrators.INTEGRATOR_CODES
+    if integrator == 0:
+        return _euler(x, y, yaw, velocity, yaw_rate, delta_time)
+    if integrator == 1:
+        return _explicit_euler(x, y, yaw, velocity, yaw_rate, delta_time)
+    if integrator == 2:
+        return _arc(x, y, yaw, velocity, yaw_rate, delta_time)
+    return _rk4(x, y, yaw, velocity, yaw_rate, delta_time)
+
+
+@njit(cache=True)
+def pid_update(error, delta_time, Kp, Ki, Kd, integral, previous_error):
+    # PIDController.update; returns (output, integral, previous_error)
+    integral += error * delta_time
+    derivative = (error - previous_error) / delta_time if delta_time > 0 else 0.0
+    return Kp * error + Ki * integral + Kd * derivative, integral, error
+
+
+@njit(cache=True)
+def bicycle_update(x, y, yaw, velocity, steering_adjustment, length, max_steering_angle, delta_time,
+                   integrator=0):
+    # Car.update after the PID step; returns (x, y, yaw, front_wheel_angle, rear_wheel_angle)
+    front_wheel_angle = max(min(steering_adjustment, max_steering_angle), -max_steering_angle)
+    if velocity < 10:
+        rear_wheel_angle = -steering_adjustment / 2
+    else:
+        rear_wheel_angle = steering_adjustment / 4
+    x, y, yaw = integrate(integrator, x, y, yaw, velocity,
+                          velocity * math.tan(steering_adjustment) / length, delta_time)
+    return x, y, yaw, front_wheel_angle, rear_wheel_angle
+
+
+@njit(cache=True)
+def turn_radius(front_left, front_right, rear_left, rear_right, length):
+    # Effective turn radius of Car_4ws.update (harmonic mean of the axles), inf when straight
+    avg_front_wheel_angle = (front_left + front_right) / 2
+    avg_rear_wheel_angle = (rear_left + rear_right) / 2
+    turn_radius_front = math.inf if avg_front_wheel_angle == 0 else length / math.tan(avg_front_wheel_angle)
+    turn_radius_rear = math.inf if avg_rear_wheel_angle == 0 else length / math.tan(avg_rear_wheel_angle)
+    if turn_radius_front != math.inf and turn_radius_rear != math.inf:
+        # Opposite axle angles cancel out: straight, like Car4wsBatch's zero curvature
+        total_curvature = 1 / turn_radius_front + 1 / turn_radius_rear
+        turn_radius_effective = math.inf if total_curvature == 0 else 2 / total_curvature
+    else:
+        turn_radius_effective = turn_radius_front if turn_radius_rear == math.inf else turn_radius_rear
+    return turn_radius_effective
+
+
+@njit(cache=True)
+def car_4ws_update(x, y, yaw, velocity, front_left, front_right, rear_left, rear_right,
+                   length, max_steering_angle, delta_time, integrator=0):
+    # Car_4ws.update; returns (x, y, yaw, front_left, front_right, rear_left, rear_right)
+    if velocity == 0:
+        return x, y, yaw, front_left, front_right, rear_left, rear_right
+    front_left = max(min(front_left, max_steering_angle), -max_steering_angle)
+    front_right = max(min(front_right, max_steering_angle), -max_steering_angle)
+    rear_left = max(min(rear_left, max_steering_angle), -max_steering_angle)
+    rear_right = max(min(rear_right, max_steering_angle), -max_steering_angle)
+
+    turn_radius_effective = turn_radius(front_left, front_right, rear_left, rear_right, length)
+    if turn_radius_effective != math.inf:
+        angular_velocity = velocity / turn_radius_effective
+    else:
+        angular_velocity = 0.0
+
+    x, y, yaw = integrate(integrator, x, y, yaw, velocity, angular_velocity, delta_time)
+    return x, y, yaw, front_left, front_right, rear_left, rear_right
+
+
+@njit(cache=True)
+def pid_rollout(x, y, yaw, velocity, Kp, Ki, Kd, integral, previous_error,
+                length, max_steering_angle, delta_time, cte, integrator=0):
+    """
+    Open-loop rollout of Car: one PID + bicycle step per entry of `cte`.
+
+    :return: (trajectory, integral, previous_error), trajectory being a
+        (steps, 5) array of x, y, yaw, front and rear wheel angle after each step.
+    """
+    steps = cte.shape[0]
+    trajectory = np.empty((steps, 5))
+    for i in range(steps):
+        steering_adjustment, integral, previous_error = pid_update(
+            cte[i], delta_time, Kp, Ki, Kd, integral, previous_error)
+        x, y, yaw, front, rear = bicycle_update(x, y, yaw, velocity, steering_adjustment,
+                                                length, max_steering_angle, delta_time, integrator)
+        trajectory[i, 0] = x
+        trajectory[i, 1] = y
+        trajectory[i, 2] = yaw
+        trajectory[i, 3] = front
+        trajectory[i, 4] = rear
+    return trajectory, integral, previous_error
+
+
+@njit(cache=True)
+def pid_circle_rollout(x, y, yaw, velocity, Kp, Ki, Kd, integral, previous_error,
+                       length, max_steering_angle, delta_time, steps, center_x, center_y, radius,
+                       integrator=0):
+    """
+    Closed-loop rollout of Car around a counterclockwise circle, the CTE being
+    the exact signed distance to it (positive outside, as Path gives for
+    generate_circle). Returns like pid_rollout, with the CTE of every step as
+    a sixth trajectory column.
+    """
+    trajectory = np.empty((steps, 6))
+    for i in range(steps):
+        cte = math.hypot(x - center_x, y - center_y) - radius
+        steering_adjustment, integral, previous_error = pid_update(
+            cte, delta_time, Kp, Ki, Kd, integral, previous_error)
+        x, y, yaw, front, rear = bicycle_update(x, y, yaw, velocity, steering_adjustment,
+                                                length, max_steering_angle, delta_time, integrator)
+        trajectory[i, 0] = x
+        trajectory[i, 1] = y
+        trajectory[i, 2] = yaw
+        trajectory[i, 3] = front
+        trajectory[i, 4] = rear
+        trajectory[i, 5] = cte
+    return trajectory, integral, previous_error
+
+
+@njit(cache=True)
+def car_4ws_rollout(x, y, yaw, velocity, front_left, front_right, rear_left, rear_right,
+                    length, max_steering_angle, delta_time, integrator=0):
+    """
+    Open-loop rollout of Car_4ws under a schedule of commanded wheel angles,
+    one entry per step. Returns a (steps, 7) array of x, y, yaw and the four
+    applied (clamped) wheel angles after each step.
+    """
+    steps = front_left.shape[0]
+    trajectory = np.empty((steps, 7))
+    for i in range(steps):
+        state = car_4ws_update(x, y, yaw, velocity, front_left[i], front_right[i],
+                               rear_left[i], rear_right[i], length, max_steering_angle, delta_time, integrator)
+        x, y, yaw = state[0], state[1], state[2]
+        for j in range(7):
+            trajectory[i, j] = state[j]
+    return trajectory
+
+
+@njit(cache=True)
+def car_batch_step(x, y, yaw, velocity, front_wheel_angle, rear_wheel_angle, integral, previous_error,
+                   Kp, Ki, Kd, length, max_steering_angle, cte, delta_time, integrator=0):
+    # CarBatch.step as one compiled loop, updating the state arrays in place
+    for i in range(x.shape[0]):
+        steering_adjustment, integral[i], previous_error[i] = pid_update(
+            cte[i], delta_time, Kp[i], Ki[i], Kd[i], integral[i], previous_error[i])
+        x[i], y[i], yaw[i], front_wheel_angle[i], rear_wheel_angle[i] = bicycle_update(
+            x[i], y[i], yaw[i], velocity[i], steering_adjustment, length[i], max_steering_angle[i], delta_time,
+            integrator)
+
+
+@njit(cache=True, error_model='numpy')
+def car_batch_control(cte, delta_time, Kp, Ki, Kd, integral, previous_error, velocity, max_steering_angle,
+                      front_wheel_angle, rear_wheel_angle, steering):
+    # PID, wheel clamp and rear steering of CarBatch.step in one pass; `steering` gets the PID output
+    for i in range(cte.shape[0]):
+        steering_adjustment, integral[i], previous_error[i] = pid_update(
+            cte[i], delta_time, Kp[i], Ki[i], Kd[i], integral[i], previous_error[i])
+        front_wheel_angle[i] = max(min(steering_adjustment, max_steering_angle[i]), -max_steering_angle[i])
+        if velocity[i] < 10:
+            rear_wheel_angle[i] = -steering_adjustment / 2
+        else:
+            rear_wheel_angle[i] = steering_adjustment / 4
+        steering[i] = steering_adjustment
+
+
+@njit(cache=True, error_model='numpy')
+def euler_heading(yaw, velocity, length, tan_steering, delta_time, half):
+    # Yaw part of the Euler step from tan(steering); `half` gets yaw / 2 for euler_move
+    for i in range(yaw.shape[0]):
+        yaw[i] += velocity[i] * delta_time * tan_steering[i] / length[i]
+        half[i] = 0.5 * yaw[i]
+
+
+@njit(cache=True, error_model='numpy')
+def euler_move(x, y, velocity, tan_half, delta_time):
+    # x += cos(yaw) * v * dt, y += sin(yaw) * v * dt from t = tan(yaw / 2), like car_batch.move_along_heading
+    for i in range(x.shape[0]):
+        t = tan_half[i]
+        distance = velocity[i] * delta_time / (1.0 + t * t)
+        x[i] += (1.0 - t * t) * distance
+        y[i] += 2.0 * t * distance
+
+
+@njit(cache=True)
+def car_4ws_batch_step(x, y, yaw, velocity, front_left, front_right, rear_left, rear_right,
+                       length, max_steering_angle, curvature, delta_time, integrator=0):
+    # Car4wsBatch.step as one compiled loop, updating the state arrays in place
+    for i in range(x.shape[0]):
+        if velocity[i] == 0:
+            continue
+        (x[i], y[i], yaw[i], front_left[i], front_right[i],
+         rear_left[i], rear_right[i]) = car_4ws_update(
+            x[i], y[i], yaw[i], velocity[i], front_left[i], front_right[i],
+            rear_left[i], rear_right[i], length[i], max_steering_angle[i], delta_time, integrator)
+        radius = turn_radius(front_left[i], front_right[i], rear_left[i], rear_right[i], length[i])
+        curvature[i] = 0.0 if radius == math.inf else 1 / radius
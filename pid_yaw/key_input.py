@@ -0,0 +1,151 @@
+"""
+Deterministic record and replay of the keyboard input of the manual driving modes.
+
+The manual modes read the keyboard once per physics tick as two sets: the
+keys held down and the keys pressed since the previous tick. KeyInput builds
+them from the pygame KEYDOWN/KEYUP events queued by the event loop, and can
+log them to an InputRecording as bit masks: one 8-byte entry (tick number,
+held mask, pressed mask) for every tick where the state changes, so holding a
+key or idling costs nothing. Replaying the recording feeds the same state
+back tick by tick through the fixed-step loop, headless and at full CPU
+speed, so a driving session reruns exactly, for profiling or as a
+regression test.
+"""
+import os
+import sys
+import time
+import numpy as np
+import pygame
+
+ENTRY = np.dtype([('tick', '<u4'), ('held', '<u2'), ('pressed', '<u2')])
+MAX_KEYS = 16
+
+
+class InputRecording:
+    """
+    :param keys: pygame key codes, bit i of the masks standing for keys[i].
+    :param dt: Physics timestep of the session; a replay runs with the same one.
+    :param ticks: Number of ticks the session lasted.
+    :param entries: ENTRY records of the ticks where the state changed.
+    """
+
+    def __init__(self, keys, dt, ticks=0, entries=()):
+        if len(keys) > MAX_KEYS:
+            raise ValueError(f"at most {MAX_KEYS} keys can be recorded, got {len(keys)}")
+        self.keys = tuple(int(key) for key in keys)
+        self.dt = float(dt)
+        self.ticks = int(ticks)
+        self.entries = list(entries)
+
+    def append(self, tick, held, pressed):
+        self.entries.append((tick, held, pressed))
+
+    def save(self, path):
+        # Through a file handle, so np.savez keeps the name as given instead of appending .npz
+        with open(path, 'wb') as output:
+            np.savez(output, keys=np.array(self.keys), dt=self.dt, ticks=self.ticks,
+                     entries=np.array(self.entries, dtype=ENTRY))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['keys'].tolist(), float(data['dt']), int(data['ticks']), data['entries'].tolist())
+
+
+class KeyInput:
+    """
+    Per-tick keyboard state of a manual driving mode. Call tick() once at the
+    start of every physics step.
+
+    :param keys: pygame key codes the mode reacts to; other keys are ignored.
+    :param queue: simulation.InputQueue the event loop puts KEYDOWN/KEYUP events in.
+    :param recording: InputRecording that live ticks are logged to, or the one
+        replayed when `replay` is set (the queue is then ignored).
+    :param path: File the recording is saved to by close().
+    """
+
+    def __init__(self, keys, queue=None, recording=None, replay=False, path=None):
+        self.keys = tuple(keys)
+        self._bits = {key: 1 << index for index, key in enumerate(self.keys)}
+        self.queue = queue
+        self.recording = recording
+        self.replay = replay
+        self.path = path
+        self.tick_count = 0
+        self._held = 0
+        self._next_entry = 0
+        self._started = None
+
+    def _decode(self, mask):
+        return tuple(key for index, key in enumerate(self.keys) if mask >> index & 1)
+
+    def tick(self):
+        """
+        Advance one tick and return (held, pressed): the keys held down and
+        the keys pressed during the tick, in `keys` order, whether they come
+        from the queue or from a replay.
+        """
+        if self._started is None:
+            self._started = time.perf_counter()
+        pressed = 0
+        if self.replay:
+            entries = self.recording.entries
+            if self._next_entry < len(entries) and entries[self._next_entry][0] == self.tick_count:
+                _, self._held, pressed = entries[self._next_entry]
+                self._next_entry += 1
+        else:
+            held = self._held
+            for event in self.queue.drain() if self.queue is not None else ():
+                bit = self._bits.get(event.key, 0)
+                if event.type == pygame.KEYDOWN:
+                    held |= bit
+                    pressed |= bit
+                else:
+                    held &= ~bit
+            if self.recording is not None:
+                if held != self._held or pressed:
+                    self.recording.append(self.tick_count, held, pressed)
+                self.recording.ticks = self.tick_count + 1
+            self._held = held
+        self.tick_count += 1
+        # A press and release within one tick leaves the key pressed but not held
+        return set(self._decode(self._held)), self._decode(pressed)
+
+    def close(self):
+        # Save a live recording, or report the replay speed
+        if self.replay:
+            elapsed = time.perf_counter() - self._started if self._started is not None else 0.0
+            rate = self.tick_count / elapsed if elapsed > 0 else 0.0
+            print(f"Replayed {self.tick_count} ticks ({len(self.recording.entries)} input changes) "
+                  f"in {elapsed:.3f} s, {rate:.0f} ticks/s", file=sys.stderr)
+        elif self.recording is not None and self.path:
+            self.recording.save(self.path)
+            print(f"Recorded {self.recording.ticks} ticks of input to {self.path}", file=sys.stderr)
+
+
+def add_input_arguments(parser):
+    parser.add_argument('--record-input', metavar='FILE',
+                        help="Log the per-tick key state of the manual driving mode to FILE (.npz)")
+    parser.add_argument('--replay-input', metavar='FILE',
+                        help="Drive the manual mode from a --record-input log, headless at full CPU speed")
+    return parser
+
+
+def make_key_input(args, keys, queue):
+    """
+    KeyInput configured from add_input_arguments() flags. Must be called
+    before pygame.display.set_mode(): a replay switches the run to headless
+    with the recorded --dt and, unless --duration is given, the recorded length.
+    """
+    if args.replay_input:
+        recording = InputRecording.load(args.replay_input)
+        if recording.keys != tuple(keys):
+            raise ValueError(f"{args.replay_input} was recorded with other keys than this mode reads")
+        args.headless = True
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        args.dt = recording.dt
+        if args.duration is None:
+            args.duration = recording.ticks * recording.dt
+        return KeyInput(keys, recording=recording, replay=True)
+    recording = InputRecording(keys, args.dt) if args.record_input else None
+    return KeyInput(keys, queue, recording, path=args.record_input)
@@ -0,0 +1,109 @@
+"""
+Smooth lane-change maneuvers from a precomputed, normalized library.
+
+A lane change from lateral position y0 to y1 over a distance `length`
+follows y(d) = y0 + (y1 - y0) * s(d / length), d being the distance driven
+since the start and s a normalized shape that rises from 0 to 1 over [0, 1]
+with zero slope and curvature at both ends. Being geometric, the path does
+not change when the car brakes; at a constant speed v a maneuver of
+`duration` seconds is one of length v * duration. The shapes are solved
+once, sampled with their first two derivatives, and every maneuver is only
+a scaling and a translation of a table lookup:
+
+quintic   the minimum-jerk polynomial, solved from its six boundary conditions
+clothoid  curvature changing linearly with distance (small-angle clothoid
+          arcs), integrated numerically
+
+Everything works on arrays, so a whole fleet is evaluated with one call.
+"""
+import numpy as np
+
+
+def _quintic(tau):
+    # Solve the boundary-value problem s(0) = s'(0) = s''(0) = 0, s(1) = 1, s'(1) = s''(1) = 0
+    powers = np.arange(6)
+    rows = []
+    for t in (0.0, 1.0):
+        rows.append(t ** powers)
+        rows.append(powers * t ** np.maximum(powers - 1, 0))
+        rows.append(powers * (powers - 1) * t ** np.maximum(powers - 2, 0))
+    coefficients = np.linalg.solve(np.array(rows), [0, 0, 0, 1, 0, 0])
+    s = np.polynomial.Polynomial(coefficients)
+    return s(tau), s.deriv(1)(tau), s.deriv(2)(tau)
+
+
+def _clothoid(tau):
+    # Second derivative piecewise linear: up, down through zero to the opposite peak, back up
+    acceleration = np.interp(tau, [0, 0.25, 0.75, 1], [0, 1, -1, 0])
+    step = tau[1] - tau[0]
+    velocity = np.concatenate(([0], np.cumsum((acceleration[1:] + acceleration[:-1]) / 2) * step))
+    position = np.concatenate(([0], np.cumsum((velocity[1:] + velocity[:-1]) / 2) * step))
+    # Normalize the rise to exactly 1
+    return position / position[-1], velocity / position[-1], acceleration / position[-1]
+
+
+SHAPES = {'quintic': _quintic, 'clothoid': _clothoid}
+
+
+class ManeuverLibrary:
+    """
+    Normalized lane-change shapes sampled on a uniform grid of tau in [0, 1].
+
+    :param samples: Grid points per shape.
+    """
+
+    def __init__(self, samples=1025):
+        self.tau = np.linspace(0.0, 1.0, samples)
+        self.tables = {name: shape(self.tau) for name, shape in SHAPES.items()}
+        # Peak |s''|, which sets the lateral acceleration of a maneuver
+        self.peak_acceleration = {name: float(np.abs(table[2]).max()) for name, table in self.tables.items()}
+
+    def evaluate(self, shape, tau):
+        # (s, s', s'') at tau, clamped to the maneuver's start and end
+        s, ds, dds = self.tables[shape]
+        tau = np.clip(tau, 0.0, 1.0)
+        return np.interp(tau, self.tau, s), np.interp(tau, self.tau, ds), np.interp(tau, self.tau, dds)
+
+    def length_for(self, offset, max_curvature, shape='quintic', margin=0.8):
+        """
+        Shortest lane change by `offset` whose path curvature stays within
+        `margin` times `max_curvature`, leaving the rest for feedback.
+        """
+        # The path curvature is about offset * s'' / length ** 2
+        return np.sqrt(np.abs(offset) * self.peak_acceleration[shape] / (margin * max_curvature))
+
+    def reference(self, shape, distance, length, y0, y1):
+        """
+        Reference lateral position, heading and path curvature of maneuvers
+        (scalars or arrays) after driving `distance` toward +x.
+
+        :return: (y, heading, curvature).
+        """
+        length = np.maximum(length, 1e-9)
+        s, ds, dds = self.evaluate(shape, distance / length)
+        offset = y1 - y0
+        slope = offset * ds / length  # dy/dx
+        bend = offset * dds / (length * length)  # d2y/dx2
+        return y0 + offset * s, np.arctan(slope), bend / (1 + slope * slope) ** 1.5
+
+
+def track(y, yaw, speed, reference_y, reference_heading, reference_curvature, lateral_gain=4.0, heading_gain=4.0):
+    """
+    Curvature command that follows a maneuver reference: its feedforward
+    curvature plus feedback making the lateral error e obey
+    e'' + heading_gain * e' + lateral_gain * e = 0 (small angles).
+    """
+    speed = np.maximum(speed, 1.0)
+    return reference_curvature + (heading_gain * (reference_heading - yaw)
+                                  + lateral_gain * (reference_y - y) / speed) / speed
+
+
+_library = None
+
+
+def get_library():
+    # Shared ManeuverLibrary, built on first use
+    global _library
+    if _library is None:
+        _library = ManeuverLibrary()
+    return _library
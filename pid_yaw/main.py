@@ -1,12 +1,48 @@
+import argparse
+import copy
 import math
-from time import clock_getres
 import pygame
 from constants import *
 from car import Car
 from car_4ws import Car_4ws
-from path_generation import generate_circle, generate_smooth_random_path
+from gain_schedule import load_schedule
+from key_input import add_input_arguments, make_key_input
+from mpc import MPC
+from path import Path, calculate_cte
+from path_generation import generate_circle, generate_smooth_random_path, generate_square_path, seeded_rng
+from path_tracking import TRACKERS
 from pid_controller import PIDController
-
+from profiler import make_profiler
+from renderer import SceneRenderer
+from simulation import InputQueue, add_simulation_arguments, parse_simulation_arguments, run_simulation
+from telemetry import add_telemetry_arguments, make_telemetry
+from trajectory import TrajectoryRecorder, add_recording_arguments
+
+# Keys of the manual mode, in the bit order of --record-input logs
+MANUAL_KEYS = (pygame.K_w, pygame.K_s, pygame.K_a, pygame.K_d)
+
+parser = argparse.ArgumentParser(description="Enhanced Autonomous 4WS Car Simulation")
+parser.add_argument('--mode', choices=['circle', 'random', 'square', 'manual'], help="Skip the mode selection screen")
+parser.add_argument('--seed', type=int, help="Seed of the random path, to repeat a run")
+parser.add_argument('--controller', choices=['pid', 'mpc'] + sorted(TRACKERS),
+                    help="Steering controller of the autonomous modes; pure_pursuit by default on random paths, "
+                         "pid otherwise. mpc drives a four-wheel-steering car")
+parser.add_argument('--gain-schedule', metavar='FILE', help="Speed-scheduled PID gains and rear-steer ratio for the "
+                    "autonomous modes: a gain_schedule.py file or 'default'")
+add_simulation_arguments(parser)
+add_telemetry_arguments(parser)
+add_recording_arguments(parser)
+add_input_arguments(parser)
+args = parse_simulation_arguments(parser)
+profiler = make_profiler(args)  # --profile flags; free when off
+# Key events reach the physics step through a lock-free queue; only the physics step touches the car.
+# --replay-input drives the manual mode from a log instead, headless
+inputs = InputQueue()
+key_input = make_key_input(args, MANUAL_KEYS, inputs)
+if args.replay_input:
+    args.mode = args.mode or 'manual'
+if args.headless and args.mode is None:
+    parser.error("--headless requires --mode")
 
 # Initialize Pygame
 pygame.init()
@@ -17,16 +53,6 @@ pygame.display.set_caption("Enhanced Autonomous 4WS Car Simulation")
 
 
 
-def generate_square_path(center_x, center_y, side_length):
-    half_side = side_length / 2
-    return [
-        (center_x - half_side, center_y - half_side),  # Top-left
-        (center_x + half_side, center_y - half_side),  # Top-right
-        (center_x + half_side, center_y + half_side),  # Bottom-right
-        (center_x - half_side, center_y + half_side),  # Bottom-left
-        (center_x - half_side, center_y - half_side)  # Return to start
-    ]
-
 def set_wheel_angles_manually(car):
     print("Enter wheel angles in degrees (Front Left, Front Right, Rear Left, Rear Right):")
     angles = input().split()  # Expecting four numbers separated by spaces
@@ -43,19 +69,19 @@ def set_wheel_angles_manually(car):
         print("Invalid input. Expected four angles.")
 
 
-def handle_manual_control(car, event):
+def handle_manual_control(car, key):
     if isinstance(car, Car_4ws):
         angle_increment = math.radians(5)
-        if event.key == pygame.K_w:  # Increase velocity
+        if key == pygame.K_w:  # Increase velocity
             car.velocity += 1
-        elif event.key == pygame.K_s:  # Decrease velocity
+        elif key == pygame.K_s:  # Decrease velocity
             car.velocity -= 1
 
-        elif event.key == pygame.K_a: # Turn left
+        elif key == pygame.K_a: # Turn left
             car.front_right_wheel_angle += angle_increment
             car.rear_right_wheel_angle += angle_increment
 
-        elif event.key == pygame.K_d: # Turn right
+        elif key == pygame.K_d: # Turn right
             car.front_right_wheel_angle += angle_increment
             car.rear_right_wheel_angle += angle_increment
 
@@ -70,16 +96,19 @@ def display_mode_selection(screen):
     circle_text = font.render("Press '1' for Circle Mode", True, BLACK)
     random_text = font.render("Press '2' for Random Trace Mode", True, BLACK)
     manual_text = font.render("Press '3' for Manual Steering Mode", True, BLACK)
+    square_text = font.render("Press '4' for Square Mode", True, BLACK)
 
     # Get rects for text positioning
     circle_rect = circle_text.get_rect(center=(screen_width / 2, screen_height / 3))
     random_rect = random_text.get_rect(center=(screen_width / 2, screen_height / 2))
     manual_rect = manual_text.get_rect(center=(screen_width / 2, screen_height * 2 / 3))
+    square_rect = square_text.get_rect(center=(screen_width / 2, screen_height * 5 / 6))
 
     # Blit (copy) text surfaces to the main screen surface
     screen.blit(circle_text, circle_rect)
     screen.blit(random_text, random_rect)
     screen.blit(manual_text, manual_rect)
+    screen.blit(square_text, square_rect)
 
     pygame.display.flip()  # Update the screen to show the text
 
@@ -98,6 +127,8 @@ def get_user_mode_selection(screen):
                     mode_selection = 'random'
                 elif event.key == pygame.K_3:
                     mode_selection = 'manual'
+                elif event.key == pygame.K_4:
+                    mode_selection = 'square'
             elif event.type == pygame.QUIT:
                 pygame.quit()
                 exit()
@@ -105,36 +136,7 @@ def get_user_mode_selection(screen):
     return mode_selection
 
 
-def calculate_cte(car, circle_center, radius):
-    dx = car.x - circle_center[0]
-    dy = car.y - circle_center[1]
-    distance = math.sqrt(dx**2 + dy**2)
-    return distance - radius
-
-def find_lookahead_point(car, path, lookahead_distance):
-    for point in path:
-        dx = point[0] - car.x
-        dy = point[1] - car.y
-        distance = math.sqrt(dx**2 + dy**2)
-        
-        if distance >= lookahead_distance:
-            # Calculate angle to the lookahead point
-            angle_to_point = math.atan2(dy, dx)
-            # Calculate the steering angle needed
-            angle_diff = angle_to_point - car.yaw
-            # Normalize the angle difference
-            angle_diff = (angle_diff + math.pi) % (2 * math.pi) - math.pi
-            return angle_diff
-    return None
-
-def update_car_steering(car, path, lookahead_distance):
-    angle_diff = find_lookahead_point(car, path, lookahead_distance)
-    if angle_diff is not None:
-        car.front_wheel_angle = angle_diff  # Simplified, consider PID controller for smoothing
-        # Apply limits to the steering angle if necessary
-
-
-mode_selection = get_user_mode_selection(screen)
+mode_selection = args.mode or get_user_mode_selection(screen)
 
 # Select car type based on mode
 if mode_selection in ['manual', 'input']:
@@ -142,102 +144,140 @@ if mode_selection in ['manual', 'input']:
 else:
     car = Car(screen_width // 2, screen_height // 2, angle=0, velocity=30)
 
+# Random paths come from a seeded generator so any run can be repeated with --seed
+path_rng, path_seed = seeded_rng(args.seed)
+if mode_selection == 'random':
+    print(f"Random path seed: {path_seed}")
+
 # For manual input mode, ask for wheel angles before starting the loop
 radius = 100  # Define the radius variable
 if mode_selection == 'circle':
     current_path = generate_circle(car.x, car.y, radius, points=100)
 elif mode_selection == 'random':
-    current_path = generate_smooth_random_path((car.x, car.y), num_segments=10, segment_length=50)
+    current_path = generate_smooth_random_path((car.x, car.y), num_segments=10, segment_length=50, rng=path_rng)
 
 # Initialize the car and path based on the selection
 car = Car(screen_width // 2, screen_height // 2, angle=0, velocity=30)
 if mode_selection == 'random':
-    current_path = generate_smooth_random_path((car.x, car.y), num_segments=10, segment_length=50)
+    current_path = generate_smooth_random_path((car.x, car.y), num_segments=10, segment_length=50, rng=path_rng)
+elif mode_selection == 'square':
+    current_path = generate_square_path(car.x + 100, car.y, 200)  # The car starts on the left side
 else:  # Default to a circle if not random
     radius = 100
-    current_path = generate_circle(car.x, car.y, radius, points=100)
+    circle_center = (car.x + radius, car.y)  # The car starts on the circle
+    current_path = generate_circle(*circle_center, radius, points=100)
 
 if mode_selection == 'manual':
     car = Car_4ws(screen_width // 2, screen_height // 2)
 else:
     car = Car(screen_width // 2, screen_height // 2, angle=0, velocity=30)  # Assuming this is for autonomous modes
+if mode_selection != 'manual' and args.controller == 'mpc':
+    car = Car_4ws(screen_width // 2, screen_height // 2, angle=0, velocity=30)
+car.integrator = args.integrator or car.integrator
+if args.gain_schedule and isinstance(car, Car):
+    car.gain_schedule = load_schedule(args.gain_schedule)
+if isinstance(car, Car):
+    profiler.instrument(car.pid_controller, 'update', 'control')
      
 
-# Main simulation loop
-running = True
-while running:
-    import pygame.time
+reference_path = Path(current_path)  # Arc length, tangents and curvature computed once
+# Geometric trackers and the MPC steer the car themselves; the PID controller steers on the CTE alone
+controller = args.controller or ('pure_pursuit' if mode_selection == 'random' else 'pid')
+if controller == 'mpc':
+    tracker = MPC(reference_path, car.length, car.max_steering_angle)
+elif controller != 'pid':
+    tracker = TRACKERS[controller](reference_path)
+else:
+    tracker = None
+# Per-step records replace the old per-frame prints; free when no sink is selected
+telemetry, telemetry_overlay = make_telemetry(args)
+recorder = TrajectoryRecorder(args.record, dt=args.dt) if args.record else None
+sim_time = 0.0
+
 
-    clock = pygame.time.Clock()
-    delta_time = clock.tick(60) / 1000.0
+def poll_events():
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
-            pygame.quit()
-            exit()
-        elif event.type == pygame.KEYDOWN and mode_selection == 'manual':
-            handle_manual_control(car, event)
-
-    screen.fill(WHITE)
-    if mode_selection == 'circle':
-        pygame.draw.circle(screen, RED, current_path[0], radius, 1)
-    else:
-        for i in range(1, len(current_path)):
-            pygame.draw.line(screen, RED, current_path[i - 1], current_path[i], 2)
-
-    lookahead_distance = 50  # Adjust based on your simulation needs
-
+            return False
+        elif event.type in (pygame.KEYDOWN, pygame.KEYUP) and mode_selection == 'manual':
+            inputs.put(event)
 
 
+def physics_step(delta_time):
+    global sim_time
+    sim_time += delta_time
     if mode_selection == 'manual':
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_w]:  # Accelerate
+        keys, pressed = key_input.tick()
+        for key in pressed:
+            handle_manual_control(car, key)
+        if pygame.K_w in keys:  # Accelerate
             car.velocity += 0.05  # Adjust for realism
-        if keys[pygame.K_s]:  # Decelerate
+        if pygame.K_s in keys:  # Decelerate
             car.velocity -= 0.05
         
         
-        if keys[pygame.K_d]:  # Steer left
+        if pygame.K_d in keys:  # Steer left
             car.front_right_wheel_angle += math.radians(1)
             car.rear_right_wheel_angle += math.radians(1)
-        if keys[pygame.K_a]:  # Steer right
+        if pygame.K_a in keys:  # Steer right
             car.front_right_wheel_angle -= math.radians(1)
             car.rear_right_wheel_angle -= math.radians(1)
 
-        print(f"Front Left: {math.degrees(car.front_right_wheel_angle)}, Front Right: {math.degrees(car.rear_right_wheel_angle)}")
-        print(f"Rear Left: {math.degrees(car.front_left_wheel_angle)}, Rear Right: {math.degrees(car.rear_left_wheel_angle)}")
-
-        
-        
         # Ensure angles are within limits
         car.front_left_wheel_angle = max(min(car.front_left_wheel_angle, car.max_steering_angle), -car.max_steering_angle)
         car.front_right_wheel_angle = max(min(car.front_right_wheel_angle, car.max_steering_angle), -car.max_steering_angle)
 
         car.update(delta_time)  # Update car's state with the new velocity and angles
-
-
-
-    # Within the simulation loop:
-    if mode_selection == 'random':
-        update_car_steering(car, current_path, lookahead_distance)
-    # Update car dynamics here...
-
+        telemetry.record_car(sim_time, car)
+        if recorder:
+            recorder.record(sim_time, [car])
+        return
+
+    # Signed cross-track error against the path, whatever its shape
+    cte = calculate_cte(car, reference_path)
+    if controller == 'mpc':
+        with profiler.phase('control'):
+            tracker.steer(car, delta_time)
+        car.update(delta_time)
+    elif tracker is not None:
+        with profiler.phase('control'):
+            tracker.steer(car)
+        car.drive(delta_time)
     else:
-        # Existing CTE calculation for circular paths
-        dx = car.x - current_path[0][0]
-        dy = car.y - current_path[0][1]
-        cte = math.sqrt(dx**2 + dy**2) - radius
+        car.update(delta_time, cte)
+    telemetry.record_car(sim_time, car, cte)
+    if recorder:
+        recorder.record(sim_time, [car])
 
-    car.update(delta_time, cte)
 
-    # Clear screen and draw everything
-    screen.fill(WHITE)
+def draw_path(surface):
     if mode_selection == 'circle':
-        pygame.draw.circle(screen, RED, current_path[0], radius, 1)
+        pygame.draw.circle(surface, RED, circle_center, radius, 1)
     else:
         for i in range(1, len(current_path)):
-            pygame.draw.line(screen, RED, current_path[i - 1], current_path[i], 2)
-    
-    car.draw(screen)
-    pygame.display.flip()
+            pygame.draw.line(surface, RED, current_path[i - 1], current_path[i], 2)
+
+
+# The path is drawn once to a cached background; frames only redraw the car
+renderer = SceneRenderer(screen, profiler=profiler)
+renderer.add_static(draw_path)
+
+
+def snapshot():
+    # A copy of the car, so a render on another thread never sees a half-updated state
+    return copy.copy(car)
+
+
+def render(alpha, state):
+    overlays = [telemetry_overlay.draw] if telemetry_overlay else []
+    renderer.render([state], overlays + list(profiler.overlays()))
+
+
+# Main simulation loop: physics runs at a fixed dt, decoupled from the frame rate
+run_simulation(physics_step, render, args, poll=poll_events, snapshot=snapshot, profiler=profiler)
+key_input.close()
+telemetry.close()
+if recorder:
+    recorder.close()
 
 pygame.quit()
\ No newline at end of file
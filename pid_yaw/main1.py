@@ -1,6 +1,28 @@
+import argparse
+import copy
+import math
 import pygame
 import sys
 from car_4ws import Car_4ws  # 确保 car_4ws.py 在同一个目录下
+from curvature_table import get_table
+from lane_change import SHAPES, get_library, track
+from profiler import make_profiler
+from renderer import SceneRenderer
+from simulation import add_simulation_arguments, parse_simulation_arguments, run_simulation
+from telemetry import add_telemetry_arguments, car_state, make_telemetry
+from trajectory import TrajectoryRecorder, add_recording_arguments
+
+# 命令行参数（无界面运行、快进等）
+parser = argparse.ArgumentParser(description="4WS lane change demo")
+parser.add_argument('--traffic', type=int, metavar='N', help="Traffic mode: N cars on the lanes, the first one "
+                                                             "changing lanes like the single car does")
+parser.add_argument('--seed', type=int, help="Seed of the traffic mode")
+parser.add_argument('--maneuver', choices=sorted(SHAPES), default='quintic', help="Lane change trajectory shape")
+add_simulation_arguments(parser)
+add_telemetry_arguments(parser)
+add_recording_arguments(parser)
+args = parse_simulation_arguments(parser)
+profiler = make_profiler(args)  # 分阶段计时（--profile 等参数），关闭时几乎无开销
 
 # 初始化pygame
 pygame.init()
@@ -14,58 +36,138 @@ WHITE = (255, 255, 255)
 BLUE = (0, 0, 255)
 GREEN = (0, 255, 0)
 
-# 初始化车辆
-car = Car_4ws(400, 550, angle=90, velocity=30)  # 车辆水平初始位置在屏幕底部中央，角度设置为90度表示向上
-
-# 设置时钟
-clock = pygame.time.Clock()
-
 # 定义车道参数
 lane_height = screen_height / 5
 num_lanes = 5
 lane_centers = [lane_height * (0.5 + i) for i in range(num_lanes)]
 current_lane = 2  # 起始在中间车道
 
+# 初始化车辆：沿车道向右行驶，驶出屏幕右侧后从左侧重新进入
+car = Car_4ws(0, lane_centers[current_lane], angle=0, velocity=30)
+car.integrator = args.integrator or car.integrator
+
 # 变道控制
 change_count = 0
 direction = -1  # -1 for up, 1 for down
 
+# 变道轨迹：从归一化轨迹库缩放平移得到，不需要每次求解
+library = get_library()
+max_curvature = get_table(car.max_steering_angle, car.length).range('in_phase')[1]
+maneuver_from = maneuver_to = lane_centers[current_lane]  # 起止横向位置，相等表示保持车道
+maneuver_length = 1.0
+maneuver_distance = 0.0  # 本次变道已行驶的距离
+
 # 主循环
-running = True
+sim_time = 0  # 仿真时间（秒），与帧率无关
 change_time = 0  # 时间控制变道频率
-while running:
+telemetry, telemetry_overlay = make_telemetry(args)  # 遥测记录，未选择输出时几乎无开销
+traffic = None
+if args.traffic:
+    from traffic import Traffic
+    # 交通模式：所有车辆在同一批次中推进，碰撞用网格粗筛加分离轴检测
+    traffic = Traffic(args.traffic, lane_centers, seed=args.seed)
+    traffic.cars.integrator = args.integrator or traffic.cars.integrator
+    profiler.instrument(traffic, 'detect_collisions', 'collision')  # 碰撞检测单独计时
+    font = pygame.font.Font(None, 24)
+# 轨迹录制，可用 replay.py 回放；交通模式下录制全部车辆，因此在创建 traffic 之后再建
+recorder = TrajectoryRecorder(args.record, n_cars=traffic.n if traffic else 1, dt=args.dt) if args.record else None
+
+
+def poll_events():
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
-            running = False
+            return False
+
+
+def traffic_step(delta_time):
+    global sim_time
+    sim_time += delta_time
+    traffic.step(delta_time)
+    # 遥测记录自车（第0辆）的状态
+    telemetry.record((sim_time,) + tuple(value[0] for value in car_state(traffic.cars)) + (math.nan,) * 4)
+    if recorder:
+        recorder.record(sim_time, traffic.cars)
+
 
-    # 每隔一定时间尝试变道
-    if pygame.time.get_ticks() - change_time > 2000 and change_count < 10:  # 每2秒尝试一次变道
+def physics_step(delta_time):
+    global sim_time, change_time, current_lane, change_count, direction
+    global maneuver_from, maneuver_to, maneuver_length, maneuver_distance
+    sim_time += delta_time
+
+    # 上一次变道完成后每隔一定时间开始新的变道
+    if maneuver_from == maneuver_to and sim_time - change_time > 2 and change_count < 10:  # 每2秒尝试一次变道
         if 0 <= current_lane + direction < num_lanes:
             current_lane += direction
-            car.y = lane_centers[current_lane]
+            maneuver_from, maneuver_to = car.y, lane_centers[current_lane]
+            maneuver_length = float(library.length_for(maneuver_to - maneuver_from, max_curvature, args.maneuver))
+            maneuver_distance = 0.0
             change_count += 1
-            change_time = pygame.time.get_ticks()
             if change_count % 5 == 0:  # 每五次变道后改变方向
                 direction *= -1
 
-    # 更新车辆位置
-    car.update(0.05)  # 假设 delta_time 是 0.05
-
-    # 清屏
-    screen.fill(WHITE)
+    # 跟踪变道轨迹：前馈曲率加横向与航向反馈，经曲率表换算为四轮转角（同相后轮转向）
+    with profiler.phase('control'):
+        reference = library.reference(args.maneuver, maneuver_distance, maneuver_length, maneuver_from, maneuver_to)
+        car.steer_to_curvature(float(track(car.y, car.yaw, car.velocity, *reference)), 'in_phase')
 
+    # 更新车辆位置
+    previous_x = car.x
+    car.update(delta_time)
+    car.x %= screen_width
+    maneuver_distance += (car.x - previous_x) % screen_width
+    if maneuver_from != maneuver_to and maneuver_distance >= maneuver_length:
+        maneuver_from = maneuver_to  # 变道完成
+        change_time = sim_time
+    telemetry.record_car(sim_time, car)
+    if recorder:
+        recorder.record(sim_time, [car])
+
+
+def draw_lanes(surface):
     # 绘制车道
     for i in range(num_lanes + 1):
-        pygame.draw.line(screen, BLUE, (0, i * lane_height), (screen_width, i * lane_height), 2)
-
-    # 绘制车辆
-    car.draw(screen)
-
-    # 刷新屏幕
-    pygame.display.flip()
-
-    # 控制帧率
-    clock.tick(60)
+        pygame.draw.line(surface, BLUE, (0, i * lane_height), (screen_width, i * lane_height), 2)
+
+
+# 车道只绘制一次到缓存背景，每帧只重绘车辆
+renderer = SceneRenderer(screen, profiler=profiler)
+renderer.add_static(draw_lanes)
+
+
+def render(alpha, state):
+    # 绘制车辆快照并只刷新变化区域
+    overlays = [telemetry_overlay.draw] if telemetry_overlay else []
+    renderer.render([state], overlays + list(profiler.overlays()))
+
+
+def render_traffic(alpha, state):
+    # 视窗跟随自车；车道背景来自缓存，车辆每帧重绘（绘制的是物理线程发布的快照）
+    screen.blit(renderer.background, (0, 0))
+    state.draw(screen, state.cars.x[0] - screen_width / 2)
+    status = (f"{state.n} cars  lane changes {state.lane_changes}  "
+              f"colliding pairs {len(state.collision_pairs)}  "
+              f"collision check {state.collision_seconds * 1000:.2f} ms")
+    screen.blit(font.render(status, True, (0, 0, 0)), (10, 10))
+    if telemetry_overlay:
+        telemetry_overlay.draw(screen)
+    for overlay in profiler.overlays():
+        overlay(screen)
+    with profiler.phase('flip'):
+        pygame.display.flip()
+
+
+# 物理以固定步长运行，渲染与之解耦；渲染只读取状态快照（--threaded 时物理在独立线程运行）
+if traffic:
+    run_simulation(traffic_step, render_traffic, args, poll=poll_events, snapshot=traffic.snapshot,
+                   profiler=profiler)
+    print(f"{traffic.n} cars, {traffic.lane_changes} lane changes, "
+          f"{traffic.collision_ticks} colliding pair-ticks", file=sys.stderr)
+else:
+    run_simulation(physics_step, render, args, poll=poll_events, snapshot=lambda: copy.copy(car),
+                   profiler=profiler)
+telemetry.close()
+if recorder:
+    recorder.close()
 
 pygame.quit()
 sys.exit()
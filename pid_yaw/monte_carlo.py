@@ -0,0 +1,236 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from multiprocessing import Pool
+import numpy as np
+from curvature_table import POLICIES
+from gain_schedule import load_schedule
+from rollout import METRICS, make_path, simulate_mpc, simulate_pid, simulate_tracker
+
+COLUMNS = ('index', 'seed', 'failed') + METRICS
+
+
+def path_seeds(root_seed, count):
+    """
+    Independent per-path seeds spawned from one root seed with
+    np.random.SeedSequence. Path i always gets the same seed whatever the
+    number of workers or the order they run in, and that seed alone rebuilds
+    the path.
+    """
+    children = np.random.SeedSequence(root_seed).spawn(count)
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in children]
+
+
+def evaluate_pid(path, options):
+    # The pid_yaw Car's PID controller tracking the path from a lateral offset
+    schedule = options.get('gain_schedule')
+    metrics = simulate_pid(path, options['Kp'], options['Ki'], options['Kd'], options['velocity'],
+                           duration=options['duration'], delta_time=options['dt'],
+                           initial_offset=options['initial_offset'], recorder=options.get('recorder'),
+                           gain_schedule=load_schedule(schedule) if schedule else None)
+    return {name: metrics[name][0].item() for name in METRICS}
+
+
+def evaluate_pure_pursuit(path, options):
+    # path_tracking.PurePursuit on a Car (--steering 2ws) or a Car_4ws (--steering 4ws)
+    metrics = simulate_tracker(path, 'pure_pursuit', options['velocity'], options['steering'], options['policy'],
+                               duration=options['duration'], delta_time=options['dt'],
+                               initial_offset=options['initial_offset'], recorder=options.get('recorder'),
+                               lookahead=options['lookahead'])
+    return {name: metrics[name][0].item() for name in METRICS}
+
+
+def evaluate_stanley(path, options):
+    # path_tracking.Stanley on a Car (--steering 2ws) or a Car_4ws (--steering 4ws)
+    metrics = simulate_tracker(path, 'stanley', options['velocity'], options['steering'], options['policy'],
+                               duration=options['duration'], delta_time=options['dt'],
+                               initial_offset=options['initial_offset'], recorder=options.get('recorder'),
+                               gain=options['stanley_gain'])
+    return {name: metrics[name][0].item() for name in METRICS}
+
+
+def evaluate_mpc(path, options):
+    # mpc.MPC steering front and rear axles of a Car_4ws
+    metrics = simulate_mpc(path, options['velocity'], duration=options['duration'], delta_time=options['dt'],
+                           initial_offset=options['initial_offset'], recorder=options.get('recorder'),
+                           max_iterations=options['mpc_iterations'])
+    return {name: metrics[name][0].item() for name in METRICS}
+
+
+# Controllers selectable with --controller: evaluate(path, options) -> {metric: value}
+CONTROLLERS = {'pid': evaluate_pid, 'pure_pursuit': evaluate_pure_pursuit, 'stanley': evaluate_stanley,
+               'mpc': evaluate_mpc}
+
+
+def evaluate_seed(seed, options):
+    """
+    Build the random path of `seed` and run the selected controller on it.
+    Deterministic: the same seed and options give bit-identical metrics, in a
+    worker process or in --replay.
+    """
+    path = make_path('random', seed=seed, num_segments=options['num_segments'])
+    metrics = CONTROLLERS[options['controller']](path, options)
+    failed = bool(metrics['diverged'] or not metrics['max_cte'] <= options['failure_cte'])
+    return failed, metrics
+
+
+def _run_chunk(task):
+    # Worker: evaluate a chunk of (index, seed) pairs
+    chunk, options = task
+    rows = []
+    for index, seed in chunk:
+        failed, metrics = evaluate_seed(seed, options)
+        rows.append([index, seed, failed] + [metrics[name] for name in METRICS])
+    return rows
+
+
+def run(count, options, root_seed=0, workers=None, chunk_size=8):
+    pairs = list(enumerate(path_seeds(root_seed, count)))
+    tasks = [(pairs[i:i + chunk_size], options) for i in range(0, count, chunk_size)]
+    rows = []
+    with Pool(workers or os.cpu_count()) as pool:
+        for chunk in pool.imap_unordered(_run_chunk, tasks):
+            rows.extend(chunk)
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+def wilson_interval(successes, trials, z=1.96):
+    # Wilson score interval of a binomial proportion, sound even at 0 or n successes
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def quantile_interval(values, q, z=1.96):
+    # Distribution-free confidence interval of the q-quantile from order statistics
+    values = np.sort(values)
+    n = len(values)
+    spread = z * math.sqrt(n * q * (1 - q))
+    low = int(max(0, math.floor(n * q - spread)))
+    high = int(min(n - 1, math.ceil(n * q + spread)))
+    return float(values[low]), float(values[high])
+
+
+def summarize(rows, worst=10):
+    failed = np.array([row[2] for row in rows])
+    rms_cte = np.array([row[COLUMNS.index('rms_cte')] for row in rows])
+    finite = rms_cte[np.isfinite(rms_cte)]
+    n = len(rows)
+    summary = {
+        'paths': n,
+        'failures': int(failed.sum()),
+        'failure_rate': float(failed.mean()) if n else 0.0,
+        'failure_rate_ci95': wilson_interval(int(failed.sum()), n),
+    }
+    if len(finite):
+        summary['rms_cte'] = {
+            'mean': float(finite.mean()),
+            'mean_ci95': (float(finite.mean() - 1.96 * finite.std(ddof=1) / math.sqrt(len(finite))),
+                          float(finite.mean() + 1.96 * finite.std(ddof=1) / math.sqrt(len(finite))))
+            if len(finite) > 1 else (float(finite.mean()),) * 2,
+            'std': float(finite.std(ddof=1)) if len(finite) > 1 else 0.0,
+            'quantiles': {f'p{round(q * 100)}': float(np.quantile(finite, q)) for q in (0.05, 0.5, 0.9, 0.99)},
+            'median_ci95': quantile_interval(finite, 0.5),
+            'p90_ci95': quantile_interval(finite, 0.9),
+            'max': float(finite.max()),
+        }
+    # Failures first, then by decreasing RMS CTE (NaN counts as worst)
+    order = sorted(rows, key=lambda row: (not row[2], -np.nan_to_num(row[COLUMNS.index('rms_cte')], nan=np.inf)))
+    summary['worst'] = [dict(zip(COLUMNS, row)) for row in order[:worst]]
+    summary['failing_seeds'] = [row[1] for row in rows if row[2]]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo robustness evaluation over seeded random paths")
+    parser.add_argument('--paths', type=int, default=1000, help="Number of random paths")
+    parser.add_argument('--seed', type=int, default=0, help="Root seed the per-path seeds are spawned from")
+    parser.add_argument('--controller', choices=sorted(CONTROLLERS), default='pid', help="Controller under test")
+    parser.add_argument('--kp', type=float, default=0.1)
+    parser.add_argument('--ki', type=float, default=0.0)
+    parser.add_argument('--kd', type=float, default=0.01)
+    parser.add_argument('--steering', choices=['2ws', '4ws'], default='2ws',
+                        help="Car model steered by the pure_pursuit and stanley controllers")
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='front_only',
+                        help="Rear-steer policy of the 4ws steering")
+    parser.add_argument('--lookahead', type=float, default=50.0, help="Pure pursuit lookahead distance")
+    parser.add_argument('--stanley-gain', type=float, default=1.0, help="Stanley cross-track gain")
+    parser.add_argument('--mpc-iterations', type=int, default=200,
+                        help="MPC solver iterations per step; no wall-clock budget, so runs are reproducible")
+    parser.add_argument('--velocity', type=float, default=30.0, help="Car velocity")
+    parser.add_argument('--gain-schedule', metavar='FILE', help="Speed-scheduled gains and rear ratio replacing "
+                        "--kp/--ki/--kd: a gain_schedule.py file or 'default'")
+    parser.add_argument('--segments', type=int, default=40, help="Segments of 50 units per random path")
+    parser.add_argument('--duration', type=float, help="Simulated seconds per path, by default 90%% of the "
+                                                        "time to drive the path")
+    parser.add_argument('--dt', type=float, default=1 / 60, help="Physics timestep in seconds")
+    parser.add_argument('--initial-offset', type=float, default=20.0, help="Starting lateral offset from the path")
+    parser.add_argument('--failure-cte', type=float, default=50.0, help="A path fails once |CTE| exceeds this")
+    parser.add_argument('--workers', type=int, help="Worker processes, all cores by default")
+    parser.add_argument('--worst', type=int, default=10, help="Worst seeds to report")
+    parser.add_argument('--output', help="Write the summary as JSON to this file")
+    parser.add_argument('--table', help="Write one CSV row per path to this file")
+    parser.add_argument('--replay', type=int, metavar='SEED', help="Re-run a single path seed and print its metrics")
+    parser.add_argument('--record', metavar='DIR', help="With --replay, record the run for replay.py")
+    args = parser.parse_args()
+
+    options = {
+        'controller': args.controller, 'Kp': args.kp, 'Ki': args.ki, 'Kd': args.kd,
+        'velocity': args.velocity, 'num_segments': args.segments,
+        'duration': args.duration or 0.9 * (args.segments - 1) * 50 / args.velocity,
+        'dt': args.dt, 'initial_offset': args.initial_offset, 'failure_cte': args.failure_cte,
+        'gain_schedule': args.gain_schedule, 'steering': args.steering, 'policy': args.policy,
+        'lookahead': args.lookahead, 'stanley_gain': args.stanley_gain, 'mpc_iterations': args.mpc_iterations,
+    }
+
+    if args.replay is not None:
+        if args.record:
+            from trajectory import TrajectoryRecorder
+            options['recorder'] = TrajectoryRecorder(args.record, dt=args.dt)
+        failed, metrics = evaluate_seed(args.replay, options)
+        if args.record:
+            options.pop('recorder').close()
+        print(json.dumps({'seed': args.replay, 'failed': failed, **metrics}, indent=2))
+        return
+
+    start = time.perf_counter()
+    rows = run(args.paths, options, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+    summary = summarize(rows, args.worst)
+    summary['options'] = options
+    summary['root_seed'] = args.seed
+
+    if args.table:
+        with open(args.table, 'w', newline='') as table:
+            writer = csv.writer(table)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(summary, output, indent=2)
+
+    low, high = summary['failure_rate_ci95']
+    print(f"{len(rows)} paths in {elapsed:.1f} s", file=sys.stderr)
+    print(f"failure rate {summary['failure_rate']:.2%} (95% CI {low:.2%} - {high:.2%})", file=sys.stderr)
+    if 'rms_cte' in summary:
+        rms = summary['rms_cte']
+        print(f"RMS CTE mean {rms['mean']:.3f} (95% CI {rms['mean_ci95'][0]:.3f} - {rms['mean_ci95'][1]:.3f}), "
+              + ', '.join(f"{name} {value:.3f}" for name, value in rms['quantiles'].items())
+              + f", max {rms['max']:.3f}", file=sys.stderr)
+    print("worst seeds (replay with --replay SEED and the same options):", file=sys.stderr)
+    for row in summary['worst']:
+        print(f"  seed {row['seed']}: failed={row['failed']} rms_cte={row['rms_cte']:.3f} "
+              f"max_cte={row['max_cte']:.3f}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+Model predictive steering of Car_4ws along a Path.
+
+Every step the controller plans the average front and rear wheel angles over
+`horizon` model steps of `model_dt` seconds and applies the first one. The
+prediction works in path coordinates (cross-track error and heading error),
+linearized along the reference: with h = velocity * model_dt the error
+dynamics are linear in the curvature error w = curvature - path curvature,
+
+    heading' = heading + h * w
+    cte'     = cte - h * heading'   (the CTE is positive to the right)
+
+so the predicted errors are free + gamma @ w with matrices that depend only
+on h. They are built once per h and cached, as are the path curvature and
+the feedforward wheel angles at every path point. The curvature of Car_4ws
+when both axles steer is (tan(front) + tan(rear)) / (2 * length); that is
+the only nonlinearity left, handled exactly in the gradient.
+
+The plan is solved by accelerated projected gradient (FISTA) on the box
+|angle| <= max_steering_angle, so every iterate is feasible. It starts from
+the previous plan shifted by the time elapsed, runs until it converges,
+reaches `max_iterations` or the next iteration would overrun `time_budget`,
+and falls back to the warm start (the last feasible plan) when the result is
+worse or not finite. The wall-clock budget is for live loops; offline
+evaluation passes time_budget=None so a run depends on its inputs only. Run
+this module to measure solve times and compare with scipy's L-BFGS-B on the
+same problems.
+"""
+import argparse
+import math
+import sys
+import time
+from collections import OrderedDict
+import numpy as np
+from path import wrap_angle
+
+
+class MPC:
+    """
+    :param path: Reference path.Path.
+    :param length: Wheelbase of the car, Car_4ws.length.
+    :param max_steering_angle: Wheel angle limit, Car_4ws.max_steering_angle.
+    :param horizon: Planned model steps.
+    :param model_dt: Seconds per model step; the plan is held between them.
+    :param front_weight: Cost of front wheel angle squared; rear_weight likewise.
+        Their ratio sets how the curvature is shared between the axles.
+    :param rate_weight: Cost of wheel angle changes between model steps.
+    :param time_budget: Seconds a whole solve may take, setup and final checks
+        included; None stops on max_iterations and tolerance only, reproducibly.
+    :param model_cache: Number of prediction models (one per distance per
+        model step, i.e. per speed) kept, least recently used dropped first.
+    :param tolerance: Largest wheel angle change, in radians, of a converged iteration.
+    """
+
+    def __init__(self, path, length=50, max_steering_angle=math.radians(30), horizon=20, model_dt=0.15,
+                 cte_weight=1.0, heading_weight=20.0, front_weight=1.0, rear_weight=10.0,
+                 rate_weight=2.0, time_budget=0.004, max_iterations=200, tolerance=3e-4, model_cache=32):
+        self.path = path
+        self.length = float(length)
+        self.max_steering_angle = float(max_steering_angle)
+        self.horizon = horizon
+        self.model_dt = model_dt
+        self.cte_weight = cte_weight
+        self.heading_weight = heading_weight
+        self.front_weight = front_weight
+        self.rear_weight = rear_weight
+        self.rate_weight = rate_weight
+        self.time_budget = time_budget
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.angle_weights = np.array([[front_weight], [rear_weight]], dtype=float)
+
+        # Feedforward angles at every path point: the reference curvature shared
+        # between the axles in the ratio that minimizes the angle costs
+        share = 2 * self.length * path.curvature / (front_weight + rear_weight)
+        limit = self.max_steering_angle
+        self._feedforward = (np.clip(np.arctan(share * rear_weight), -limit, limit),
+                             np.clip(np.arctan(share * front_weight), -limit, limit))
+        # Heading of the reference at every path point, integrated from the interpolated
+        # curvature so it turns smoothly through the polyline's corners like the reference does
+        turn = (path.curvature[1:] + path.curvature[:-1]) / 2 * path.segment_lengths
+        self._heading = path.headings[0] - turn[0] / 2 + np.concatenate(([0.0], np.cumsum(turn)))
+        self._models = OrderedDict()
+        self.model_cache = model_cache
+
+        self.plan = None  # (2, horizon) front and rear angles of the last accepted plan
+        self.applied = (0.0, 0.0)
+        # Statistics of the last solve and totals
+        self.solve_time = 0.0
+        self.solve_cpu_time = 0.0  # Thread CPU time of the solve; less than solve_time when the OS preempted it
+        self.iterations = 0
+        self.solves = 0
+        self.fallbacks = 0
+
+    def _model(self, h):
+        # Prediction matrices and gradient step size for a distance h per model step, cached
+        key = round(h, 9)
+        if key in self._models:
+            self._models.move_to_end(key)
+        else:
+            n = self.horizon
+            # Response of (cte, heading) at steps 1..n to a unit curvature error at each step
+            lag = np.arange(n)[:, None] - np.arange(n)[None, :] + 1  # Steps since the input, <= 0 before it
+            gamma = np.stack((-h * h * np.maximum(lag, 0), h * (lag > 0)))
+            # Free response to the initial (cte, heading)
+            free = np.zeros((2, n, 2))
+            free[0, :, 0] = 1
+            free[0, :, 1] = -h * np.arange(1, n + 1)
+            free[1, :, 1] = 1
+            gamma, free = gamma.reshape(2 * n, n), free.reshape(2 * n, 2)
+            weights = np.repeat([self.cte_weight, self.heading_weight], n)
+            hessian = gamma.T @ (weights[:, None] * gamma)
+            # Lipschitz bound of the gradient: both angles drive w through sec^2 / (2 length)
+            slope = 1 / (math.cos(self.max_steering_angle) ** 2 * 2 * self.length)
+            lipschitz = (4 * np.linalg.eigvalsh(hessian)[-1] * slope * slope
+                         + 2 * max(self.front_weight, self.rear_weight) + 8 * self.rate_weight)
+            self._models[key] = (gamma, free, weights, 1.2 * lipschitz)
+            if len(self._models) > self.model_cache:
+                self._models.popitem(last=False)
+        return self._models[key]
+
+    def _cost(self, angles, model, errors, reference, previous, gradient=False):
+        gamma, free, weights, _ = model
+        tangent = np.tan(angles)
+        w = (tangent[0] + tangent[1]) / (2 * self.length) - reference
+        predicted = free @ errors + gamma @ w  # cte at steps 1..n, then heading error
+        weighted = weights * predicted
+        change = angles.copy()
+        change[:, 0] -= previous
+        change[:, 1:] -= angles[:, :-1]
+        penalty = self.angle_weights * angles
+        cost = weighted @ predicted + np.sum(penalty * angles) + self.rate_weight * np.sum(change * change)
+        if not gradient:
+            return cost
+        grad_w = 2 * (gamma.T @ weighted) / (2 * self.length)
+        grad = grad_w * (1 + tangent * tangent) + 2 * penalty
+        change *= 2 * self.rate_weight
+        grad += change
+        grad[:, :-1] -= change[:, 1:]
+        return cost, grad
+
+    def problem(self, x, y, yaw, velocity):
+        """
+        The optimization problem at a car state: (model, errors, reference),
+        errors being the initial (cte, heading error) and reference the path
+        curvature at the middle of every model step.
+        """
+        station, _, cte = self.path.project(x, y)
+        heading_error = wrap_angle(yaw - np.interp(station, self.path.stations, self._heading))
+        h = abs(velocity) * self.model_dt
+        stations = station + h * (np.arange(self.horizon) + 0.5)
+        reference = self.path.curvature_at(stations)
+        return self._model(h), np.array([cte, heading_error]), reference, stations
+
+    def solve(self, x, y, yaw, velocity, delta_time):
+        """
+        Plan from a car state and return the (front, rear) average wheel angles
+        to apply for the next `delta_time` seconds.
+        """
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        model, errors, reference, stations = self.problem(x, y, yaw, velocity)
+        previous = np.array(self.applied)
+
+        # Warm start: the last plan advanced by delta_time, interpolated between model steps
+        if self.plan is None:
+            warm = np.stack([np.interp(stations, self.path.stations, table) for table in self._feedforward])
+        else:
+            steps = np.arange(self.horizon)
+            warm = np.stack([np.interp(steps + delta_time / self.model_dt, steps, row) for row in self.plan])
+
+        # The cost of the warm start is needed for the fallback check; its timing is what the
+        # check of the result will take, reserved out of the budget along with one iteration
+        check_start = time.perf_counter()
+        warm_cost = self._cost(warm, model, errors, reference, previous)
+        check_time = time.perf_counter() - check_start
+        deadline = math.inf if self.time_budget is None else start + self.time_budget
+
+        # FISTA, restarting the momentum when it points uphill; one gradient per iteration
+        limit = self.max_steering_angle
+        step = 1 / model[3]
+        angles = extrapolated = warm
+        momentum = 1.0
+        iterations = 0
+        iteration_time = 2 * check_time  # Estimate until an iteration has been timed
+        while iterations < self.max_iterations:
+            now = time.perf_counter()
+            # Stop before an iteration that would leave no time to check its result
+            if now + 1.5 * iteration_time + 2 * check_time > deadline:
+                break
+            iterations += 1
+            _, grad = self._cost(extrapolated, model, errors, reference, previous, gradient=True)
+            candidate = np.clip(extrapolated - step * grad, -limit, limit)
+            move = candidate - angles
+            if np.sum(grad * (candidate - extrapolated)) > 0:
+                momentum = 1.0
+            next_momentum = (1 + math.sqrt(1 + 4 * momentum * momentum)) / 2
+            extrapolated = candidate + (momentum - 1) / next_momentum * move
+            angles, momentum = candidate, next_momentum
+            iteration_time = max(iteration_time, time.perf_counter() - now)
+            if np.abs(move).max() < self.tolerance:
+                break
+
+        cost = self._cost(angles, model, errors, reference, previous) if iterations else warm_cost
+        if not np.isfinite(cost) or cost > warm_cost:
+            angles = warm  # Fall back to the last feasible plan
+            self.fallbacks += 1
+        self.plan = angles
+        self.applied = (float(angles[0, 0]), float(angles[1, 0]))
+        self.iterations = iterations
+        self.solves += 1
+        self.solve_time = time.perf_counter() - start
+        self.solve_cpu_time = time.thread_time() - cpu_start
+        front, rear = self.applied
+        # Car_4ws uses the single-axle radius when an axle is exactly straight; keep the two-axle model
+        if front == 0.0 or rear == 0.0:
+            front, rear = front or math.copysign(1e-12, rear), rear or math.copysign(1e-12, front)
+        return front, rear
+
+    def steer(self, car, delta_time):
+        # Solve for a Car_4ws and set its four wheel angles
+        front, rear = self.solve(car.x, car.y, car.yaw, car.velocity, delta_time)
+        car.front_left_wheel_angle = car.front_right_wheel_angle = front
+        car.rear_left_wheel_angle = car.rear_right_wheel_angle = rear
+
+
+def main():
+    from car_4ws import Car_4ws
+    from scipy.optimize import minimize
+    from rollout import make_path
+
+    parser = argparse.ArgumentParser(description="Closed-loop MPC run: solve times and optimality")
+    parser.add_argument('--path', default='random', choices=['circle', 'square', 'random'])
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random path")
+    parser.add_argument('--velocity', type=float, default=30.0)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--dt', type=float, default=1 / 60, help="Physics timestep in seconds")
+    parser.add_argument('--horizon', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=4.0, help="Solve time budget in milliseconds")
+    parser.add_argument('--max-iterations', type=int, default=200)
+    parser.add_argument('--initial-offset', type=float, default=20.0)
+    args = parser.parse_args()
+
+    path = make_path(args.path, seed=args.seed)
+    x0, y0, heading = path.interpolate(0.0)
+    car = Car_4ws(x0 + args.initial_offset * math.sin(heading), y0 - args.initial_offset * math.cos(heading),
+                  math.degrees(heading), args.velocity)
+    controller = MPC(path, car.length, car.max_steering_angle, args.horizon, time_budget=args.budget / 1000,
+                     max_iterations=args.max_iterations)
+
+    solve_times, descheduled, iterations, ctes, gaps = [], [], [], [], []
+    steps = int(round(args.duration / args.dt))
+    for step in range(steps):
+        previous = np.array(controller.applied)
+        controller.steer(car, args.dt)
+        solve_times.append(controller.solve_time)
+        # Wall time the thread spent preempted by the OS is outside the solver's control
+        descheduled.append(max(0.0, controller.solve_time - controller.solve_cpu_time))
+        iterations.append(controller.iterations)
+        if step % 50 == 0:
+            # Cost of the accepted plan against L-BFGS-B on the same problem
+            model, errors, reference, _ = controller.problem(car.x, car.y, car.yaw, car.velocity)
+            objective = lambda flat: controller._cost(flat.reshape(2, -1), model, errors, reference, previous,
+                                                      gradient=True)
+            result = minimize(lambda flat: (lambda c, g: (c, g.ravel()))(*objective(flat)),
+                              controller.plan.ravel(), jac=True, method='L-BFGS-B',
+                              bounds=[(-car.max_steering_angle, car.max_steering_angle)] * (2 * args.horizon))
+            ours = controller._cost(controller.plan, model, errors, reference, previous)
+            gaps.append((ours - result.fun) / max(result.fun, 1e-12))
+        car.update(args.dt)
+        ctes.append(path.cross_track_error(car.x, car.y))
+
+    solve_times = np.array(solve_times) * 1000
+    ctes = np.array(ctes)
+    print(f"{steps} steps, RMS CTE {np.sqrt(np.mean(ctes ** 2)):.3f}, max |CTE| after 2 s "
+          f"{np.abs(ctes[int(2 / args.dt):]).max():.3f}", file=sys.stderr)
+    print(f"solve time ms: mean {solve_times.mean():.3f}, p50 {np.percentile(solve_times, 50):.3f}, "
+          f"p99 {np.percentile(solve_times, 99):.3f}, max {solve_times.max():.3f} "
+          f"(budget {args.budget} ms, {args.dt * 1000:.1f} ms per step)", file=sys.stderr)
+    print(f"iterations: mean {np.mean(iterations):.1f}, max {max(iterations)}; fallbacks {controller.fallbacks}",
+          file=sys.stderr)
+    print(f"relative cost gap to L-BFGS-B: median {np.median(gaps):.2e}, max {max(gaps):.2e}", file=sys.stderr)
+    own_times = solve_times - np.array(descheduled) * 1000
+    print(f"{(solve_times > args.budget).sum()} solves over budget in wall time, "
+          f"{(own_times > args.budget).sum()} of them without preemption; "
+          f"max without preemption {own_times.max():.3f} ms", file=sys.stderr)
+    assert (own_times <= args.budget).all(), "a solve overran its time budget"
+
+
+if __name__ == '__main__':
+    main()
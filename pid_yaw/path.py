@@ -0,0 +1,201 @@
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class Path:
+    """
+    Polyline path backed by NumPy arrays with its geometry precomputed once.
+
+    Cumulative arc length, unit tangents, headings and curvature are computed
+    at construction, and a KD-tree over segment midpoints makes projecting a
+    point (or a batch of points) onto the path O(log n).
+
+    :param points: Sequence of (x, y) points, e.g. from generate_circle.
+    :param closed: Whether the path loops; by default a path whose last point
+        repeats its first is treated as closed.
+    """
+
+    def __init__(self, points, closed=None):
+        points = np.asarray(points, dtype=float)
+        # Drop repeated points, they make zero-length segments
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = np.any(np.diff(points, axis=0) != 0, axis=1)
+        points = points[keep]
+        if closed is None:
+            closed = len(points) > 2 and np.array_equal(points[0], points[-1])
+        if closed and not np.array_equal(points[0], points[-1]):
+            points = np.vstack((points, points[:1]))
+        if len(points) < 2:
+            raise ValueError("A path needs at least two distinct points")
+        self.points = points
+        self.closed = closed
+
+        segments = np.diff(points, axis=0)
+        self.segment_lengths = np.hypot(segments[:, 0], segments[:, 1])
+        self.tangents = segments / self.segment_lengths[:, None]
+        self.headings = np.arctan2(self.tangents[:, 1], self.tangents[:, 0])
+        self.stations = np.concatenate(([0.0], np.cumsum(self.segment_lengths)))  # Arc length at each point
+        self.length = self.stations[-1]
+
+        # Discrete curvature at each point: turning angle over the mean length of
+        # the two adjacent segments. Open path ends have zero curvature.
+        turn = np.diff(self.headings)
+        mean_length = (self.segment_lengths[:-1] + self.segment_lengths[1:]) / 2
+        self.curvature = np.zeros(len(points))
+        self.curvature[1:-1] = wrap_angle(turn) / mean_length
+        if closed:
+            wrap_turn = wrap_angle(self.headings[0] - self.headings[-1])
+            self.curvature[0] = self.curvature[-1] = wrap_turn / (
+                (self.segment_lengths[0] + self.segment_lengths[-1]) / 2)
+
+        self._tree = cKDTree(points[:-1] + segments / 2)
+        self._max_half_length = self.segment_lengths.max() / 2
+        # Plain float copies for the single-point fast path of project()
+        self._segment_list = list(zip(points[:-1, 0].tolist(), points[:-1, 1].tolist(),
+                                      self.tangents[:, 0].tolist(), self.tangents[:, 1].tolist(),
+                                      self.segment_lengths.tolist(), self.stations[:-1].tolist()))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _segment_projection(self, x, y, segment):
+        # Clamped projection parameter and signed lateral offset on the given segments
+        start = self.points[segment]
+        tangent = self.tangents[segment]
+        rx, ry = x - start[..., 0], y - start[..., 1]
+        t = np.clip((rx * tangent[..., 0] + ry * tangent[..., 1]) / self.segment_lengths[segment], 0.0, 1.0)
+        ex = rx - t * self.segment_lengths[segment] * tangent[..., 0]
+        ey = ry - t * self.segment_lengths[segment] * tangent[..., 1]
+        distance = np.hypot(ex, ey)
+        # Positive to the right of the direction of travel (x-y math axes), so a
+        # point outside a circle from generate_circle gets a positive error,
+        # like the original distance - radius
+        right = ex * tangent[..., 1] - ey * tangent[..., 0]
+        return t, np.where(right < 0, -distance, distance), distance
+
+    def project(self, x, y, candidates=8):
+        """
+        Project a point or arrays of points onto the path.
+
+        :return: (station, segment, signed_offset) where station is the arc
+            length of the nearest path point, segment the index of the segment
+            it lies on and signed_offset the cross-track error (positive to the
+            right of the path).
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        shape = np.broadcast(x, y).shape
+        if x.size == 1 and y.size == 1:
+            # One point, e.g. a single car: plain float math beats a dozen tiny array ops
+            station, segment, offset = self._project_point(float(x.flat[0]), float(y.flat[0]), candidates)
+            if not shape:
+                return station, segment, offset
+            return np.full(shape, station), np.full(shape, segment), np.full(shape, offset)
+        px, py = np.broadcast_to(x, shape).ravel(), np.broadcast_to(y, shape).ravel()
+        query = np.stack((px, py), axis=1)
+
+        k = min(candidates, len(self.segment_lengths))
+        midpoint_distance, segment = self._tree.query(query, k=k)
+        segment = segment.reshape(len(query), k)
+        midpoint_distance = midpoint_distance.reshape(len(query), k)
+
+        t, offset, distance = self._segment_projection(px[:, None], py[:, None], segment)
+        best = np.argmin(distance, axis=1)
+        rows = np.arange(len(query))
+        segment, t, offset = segment[rows, best], t[rows, best], offset[rows, best]
+        distance = distance[rows, best]
+
+        # Any segment closer than the best one found has its midpoint within
+        # distance + max_half_length; when such a midpoint was not among the k
+        # candidates, search the ball around the point exactly
+        unsure = np.flatnonzero(distance + self._max_half_length > midpoint_distance[:, -1])
+        if k < len(self.segment_lengths):
+            for row in unsure:
+                ball = np.array(self._tree.query_ball_point(query[row], distance[row] + self._max_half_length))
+                bt, boffset, bdistance = self._segment_projection(px[row], py[row], ball)
+                j = np.argmin(bdistance)
+                if bdistance[j] < distance[row]:
+                    segment[row], t[row], offset[row] = ball[j], bt[j], boffset[j]
+
+        station = self.stations[segment] + t * self.segment_lengths[segment]
+        if not shape:
+            return float(station[0]), int(segment[0]), float(offset[0])
+        return station.reshape(shape), segment.reshape(shape), offset.reshape(shape)
+
+    def _segment_point(self, x, y, segment):
+        # Scalar _segment_projection: (t, signed offset, distance)
+        sx, sy, tx, ty, length, _ = self._segment_list[segment]
+        rx, ry = x - sx, y - sy
+        t = min(max((rx * tx + ry * ty) / length, 0.0), 1.0)
+        ex = rx - t * length * tx
+        ey = ry - t * length * ty
+        distance = math.hypot(ex, ey)
+        return t, (-distance if ex * ty - ey * tx < 0 else distance), distance
+
+    def _project_point(self, x, y, candidates):
+        # project() for a single point, same candidate search without arrays
+        k = min(candidates, len(self._segment_list))
+        midpoint_distance, segments = self._tree.query((x, y), k=k)
+        if k == 1:
+            midpoint_distance, segments = [midpoint_distance], [segments]
+        else:
+            midpoint_distance, segments = midpoint_distance.tolist(), segments.tolist()
+        best = None
+        for segment in segments:
+            t, offset, distance = self._segment_point(x, y, segment)
+            if best is None or distance < best[3]:
+                best = (segment, t, offset, distance)
+        if k < len(self._segment_list) and best[3] + self._max_half_length > midpoint_distance[-1]:
+            for segment in self._tree.query_ball_point((x, y), best[3] + self._max_half_length):
+                t, offset, distance = self._segment_point(x, y, segment)
+                if distance < best[3]:
+                    best = (segment, t, offset, distance)
+        segment, t, offset, _ = best
+        station = self._segment_list[segment][5] + t * self._segment_list[segment][4]
+        return station, segment, offset
+
+    def cross_track_error(self, x, y):
+        # Signed distance to the path, positive to the right of it
+        return self.project(x, y)[2]
+
+    def heading_error(self, x, y, yaw):
+        # Vehicle yaw minus the path heading at the projection, wrapped to [-pi, pi)
+        segment = self.project(x, y)[1]
+        return wrap_angle(np.asarray(yaw) - self.headings[segment])
+
+    def _normalize_station(self, station):
+        station = np.asarray(station, dtype=float)
+        if self.closed:
+            return np.mod(station, self.length)
+        return np.clip(station, 0.0, self.length)
+
+    def interpolate(self, station):
+        """
+        (x, y, heading) at the given arc length(s); wraps on closed paths and
+        clamps to the ends of open ones.
+        """
+        station = self._normalize_station(station)
+        segment = np.clip(np.searchsorted(self.stations, station, side='right') - 1,
+                          0, len(self.segment_lengths) - 1)
+        along = station - self.stations[segment]
+        x = self.points[segment, 0] + along * self.tangents[segment, 0]
+        y = self.points[segment, 1] + along * self.tangents[segment, 1]
+        heading = self.headings[segment]
+        if not np.ndim(station):
+            return float(x), float(y), float(heading)
+        return x, y, heading
+
+    def curvature_at(self, station):
+        # Curvature linearly interpolated between path points
+        return np.interp(self._normalize_station(station), self.stations, self.curvature)
+
+
+def wrap_angle(angle):
+    # Angle (scalar or array) wrapped to [-pi, pi)
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def calculate_cte(car, path):
+    # Signed cross-track error of a car against a Path, positive to the right of it
+    return path.cross_track_error(car.x, car.y)
@@ -0,0 +1,329 @@
+import math
+import numpy as np
+
+
+class SegmentGrid:
+    """
+    Uniform grid over the segments of a polyline, used to find the segment
+    nearest to an arbitrary point without scanning the whole path.
+
+    Every segment is registered in each cell its bounding box touches. The
+    cell -> segments mapping is stored CSR-style (sorted segment ids plus
+    per-cell offsets), so building it is a handful of NumPy calls even for
+    10^6 segments.
+    """
+
+    def __init__(self, starts, ends, cell_size):
+        self.cell_size = float(cell_size)
+        self.starts = starts
+        self.ends = ends
+
+        lo = np.minimum(starts, ends)
+        hi = np.maximum(starts, ends)
+        self.origin = lo.min(axis=0)
+        cell_lo = ((lo - self.origin) // self.cell_size).astype(np.int64)
+        cell_hi = ((hi - self.origin) // self.cell_size).astype(np.int64)
+        self.shape = cell_hi.max(axis=0) + 1
+
+        # Expand every segment into the cells of its bounding box
+        span = cell_hi - cell_lo + 1
+        counts = span[:, 0] * span[:, 1]
+        segment_ids = np.repeat(np.arange(len(starts)), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        local = np.arange(len(segment_ids)) - first
+        width = span[segment_ids, 0]
+        cx = cell_lo[segment_ids, 0] + local % width
+        cy = cell_lo[segment_ids, 1] + local // width
+        keys = cx * self.shape[1] + cy
+
+        order = np.argsort(keys, kind='stable')
+        self.segment_ids = segment_ids[order]
+        self.offsets = np.searchsorted(keys[order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    def _cell_segments(self, cx, cy):
+        if cx < 0 or cy < 0 or cx >= self.shape[0] or cy >= self.shape[1]:
+            return self.segment_ids[:0]
+        key = cx * self.shape[1] + cy
+        return self.segment_ids[self.offsets[key]:self.offsets[key + 1]]
+
+    def nearest(self, x, y):
+        # Search rings of cells around (x, y) until no closer segment can exist
+        cx, cy = ((np.array((x, y)) - self.origin) // self.cell_size).astype(np.int64)
+        # Clamp the starting cell so points outside the grid still find segments
+        cx = min(max(cx, 0), self.shape[0] - 1)
+        cy = min(max(cy, 0), self.shape[1] - 1)
+        best, best_distance = -1, math.inf
+        max_ring = max(self.shape)
+        for ring in range(max_ring + 1):
+            if ring:
+                cells = [(cx + i, cy - ring) for i in range(-ring, ring + 1)]
+                cells += [(cx + i, cy + ring) for i in range(-ring, ring + 1)]
+                cells += [(cx - ring, cy + j) for j in range(-ring + 1, ring)]
+                cells += [(cx + ring, cy + j) for j in range(-ring + 1, ring)]
+            else:
+                cells = [(cx, cy)]
+            candidates = [self._cell_segments(i, j) for i, j in cells]
+            candidates = np.concatenate(candidates)
+            if len(candidates):
+                distance = point_segment_distance(x, y, self.starts[candidates], self.ends[candidates])
+                k = np.argmin(distance)
+                if distance[k] < best_distance:
+                    best, best_distance = int(candidates[k]), float(distance[k])
+            # Anything in the next ring is at least `ring` cells away
+            if best >= 0 and best_distance <= ring * self.cell_size:
+                break
+        return best
+
+
+def point_segment_distance(x, y, starts, ends):
+    d = ends - starts
+    length_sq = np.einsum('ij,ij->i', d, d)
+    t = ((x - starts[:, 0]) * d[:, 0] + (y - starts[:, 1]) * d[:, 1]) / np.where(length_sq > 0, length_sq, 1)
+    t = np.clip(t, 0, 1)
+    return np.hypot(starts[:, 0] + t * d[:, 0] - x, starts[:, 1] + t * d[:, 1] - y)
+
+
+class PathFollower:
+    """
+    Tracks a vehicle's progress along a polyline path.
+
+    The follower remembers the segment the vehicle is on and only searches
+    forward from it, a few segments with scalar math and then in doubling
+    NumPy chunks, so a query costs amortized O(1) per unit of distance driven
+    instead of O(path length). When the vehicle is far from its tracked
+    segment (e.g. after a reset or teleport) it relocalizes through a uniform
+    grid over the segments.
+
+    :param path: Sequence of (x, y) points or a Path.
+    :param closed: Whether the path loops; by default a path whose last point
+        repeats its first (as generate_circle returns) is treated as closed.
+    :param relocalize_distance: Distance from the tracked segment beyond which
+        the follower relocalizes through the grid.
+    :param cell_size: Grid cell size, by default about twice the mean segment length.
+    """
+
+    SCALAR_STEPS = 4  # Segments checked one by one before switching to NumPy chunks
+
+    def __init__(self, path, closed=None, relocalize_distance=100, cell_size=None):
+        points = np.asarray(getattr(path, 'points', path), dtype=float)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 2:
+            raise ValueError(f"PathFollower needs a path of at least two (x, y) points, got shape {points.shape}")
+        if closed is None:
+            closed = getattr(path, 'closed', None)
+        if closed is None:
+            closed = len(points) > 2 and np.array_equal(points[0], points[-1])
+        if closed and not np.array_equal(points[0], points[-1]):
+            points = np.vstack((points, points[:1]))
+        self.points = points
+        self.closed = closed
+        self.relocalize_distance = relocalize_distance
+
+        starts, ends = points[:-1], points[1:]
+        self.num_segments = len(starts)
+        self.x0, self.y0 = starts[:, 0].copy(), starts[:, 1].copy()
+        self.dx, self.dy = ends[:, 0] - starts[:, 0], ends[:, 1] - starts[:, 1]
+        self.length_sq = self.dx ** 2 + self.dy ** 2
+        self._safe_length_sq = np.where(self.length_sq > 0, self.length_sq, 1.0)
+        if cell_size is None:
+            # About twice the mean segment length, but never so small that the
+            # grid has many more cells than the path has segments
+            extent = np.ptp(points, axis=0)
+            cell_size = max(2 * np.sqrt(self.length_sq).mean(),
+                            math.sqrt(max(extent[0] * extent[1], extent.max() ** 2 / 100) / self.num_segments),
+                            1e-6)
+        self.grid = SegmentGrid(starts, ends, cell_size)
+
+        # Plain lists make the scalar math of short walks cheap
+        self._x = points[:, 0].tolist()
+        self._y = points[:, 1].tolist()
+
+        self.segment = None  # Index of the tracked segment, None until localized
+        self.t = 0.0  # Projection parameter along the tracked segment, in [0, 1]
+        self._lookahead_segment = None
+
+    def reset(self):
+        self.segment = None
+        self._lookahead_segment = None
+
+    def _next(self, i):
+        if i + 1 < self.num_segments:
+            return i + 1
+        return 0 if self.closed else None
+
+    def _previous(self, i):
+        if i > 0:
+            return i - 1
+        return self.num_segments - 1 if self.closed else None
+
+    def _project(self, i, x, y):
+        # Unclamped projection parameter of (x, y) on segment i
+        x0, y0 = self._x[i], self._y[i]
+        dx, dy = self._x[i + 1] - x0, self._y[i + 1] - y0
+        length_sq = dx * dx + dy * dy
+        return ((x - x0) * dx + (y - y0) * dy) / length_sq if length_sq > 0 else 0.0
+
+    def _distance(self, i, t, x, y):
+        t = min(max(t, 0.0), 1.0)
+        x0, y0 = self._x[i], self._y[i]
+        return math.hypot(x0 + t * (self._x[i + 1] - x0) - x, y0 + t * (self._y[i + 1] - y0) - y)
+
+    def _gallop(self, start, limit, test):
+        # First segment index at or after `start` (wrapping on closed paths)
+        # for which test(indices) is True, checking chunks of doubling size
+        chunk, offset = 16, 0
+        while offset < limit:
+            idx = start + offset + np.arange(min(chunk, limit - offset))
+            if self.closed:
+                idx %= self.num_segments
+            else:
+                idx = idx[idx < self.num_segments]
+                if not len(idx):
+                    return None
+            hits = test(idx)
+            if hits.any():
+                return int(idx[np.argmax(hits)])
+            offset += chunk
+            chunk *= 2
+        return None
+
+    def update(self, x, y, max_walk=100000):
+        """
+        Advance the tracked segment to the one (x, y) projects onto and return
+        its index. Relocalizes through the grid when the vehicle is far away.
+        """
+        i = self.segment
+        if i is None:
+            i = self.grid.nearest(x, y)
+            self._lookahead_segment = None
+
+        t = self._project(i, x, y)
+        if t > 1:
+            for _ in range(self.SCALAR_STEPS):
+                j = self._next(i)
+                if j is None:
+                    break
+                i, t = j, self._project(j, x, y)
+                if t <= 1:
+                    break
+            else:
+                j = self._next(i)
+                if j is not None:
+                    j = self._gallop(j, min(max_walk, self.num_segments), lambda idx: (
+                        (x - self.x0[idx]) * self.dx[idx] + (y - self.y0[idx]) * self.dy[idx]
+                        <= self.length_sq[idx]))
+                    if j is not None:
+                        i, t = j, self._project(j, x, y)
+        elif t < 0:
+            # Small backwards moves only; anything larger relocalizes below
+            for _ in range(self.SCALAR_STEPS):
+                j = self._previous(i)
+                if j is None:
+                    break
+                i, t = j, self._project(j, x, y)
+                if t >= 0:
+                    break
+
+        if self._distance(i, t, x, y) > self.relocalize_distance:
+            j = self.grid.nearest(x, y)
+            if j != i:
+                i, t = j, self._project(j, x, y)
+                self._lookahead_segment = None
+
+        self.segment, self.t = i, min(max(t, 0.0), 1.0)
+        return i
+
+    def _exit_point(self, i, x, y, radius_sq):
+        # Parameter u in [0, 1] where segment i leaves the circle around (x, y), or None
+        x0, y0 = self._x[i], self._y[i]
+        dx, dy = self._x[i + 1] - x0, self._y[i + 1] - y0
+        fx, fy = x0 - x, y0 - y
+        a = dx * dx + dy * dy
+        if a == 0:
+            return None
+        b = fx * dx + fy * dy
+        disc = b * b - a * (fx * fx + fy * fy - radius_sq)
+        if disc < 0:
+            return None
+        u = (math.sqrt(disc) - b) / a
+        return u if 0 <= u <= 1 else None
+
+    def _exit_parameters(self, idx, x, y, radius_sq):
+        # Vectorized _exit_point over segment indices, NaN where there is no exit
+        fx, fy = self.x0[idx] - x, self.y0[idx] - y
+        dx, dy = self.dx[idx], self.dy[idx]
+        a = self._safe_length_sq[idx]
+        b = fx * dx + fy * dy
+        disc = b * b - a * (fx * fx + fy * fy - radius_sq)
+        with np.errstate(invalid='ignore'):
+            u = (np.sqrt(disc) - b) / a
+        u[(self.length_sq[idx] == 0) | (u > 1)] = np.nan
+        return u
+
+    def lookahead_point(self, x, y, lookahead_distance):
+        """
+        Point on the path, ahead of the vehicle's projection, exactly
+        `lookahead_distance` away from (x, y); interpolated on the segment.
+        If the vehicle is farther than that from the path, the projection
+        itself is returned. Returns None when an open path ends first.
+        """
+        i = self.update(x, y)
+        t = self.t
+        x0, y0 = self._x[i], self._y[i]
+        px = x0 + t * (self._x[i + 1] - x0)
+        py = y0 + t * (self._y[i + 1] - y0)
+        radius_sq = lookahead_distance * lookahead_distance
+        if (px - x) ** 2 + (py - y) ** 2 >= radius_sq:
+            return px, py
+
+        # The crossing is on the tracked segment past t, or on a later one
+        k, u = i, self._exit_point(i, x, y, radius_sq)
+        if u is None or u < t:
+            # Resume from last call's lookahead segment if it is still ahead and
+            # its start is inside the circle; the crossing cannot be before it
+            k = self._next(i)
+            j = self._lookahead_segment
+            if j is not None and j != i and self._ahead(i, j):
+                if (self._x[j] - x) ** 2 + (self._y[j] - y) ** 2 < radius_sq:
+                    k = j
+            u = None
+            for _ in range(self.SCALAR_STEPS):
+                if k is None:
+                    return None
+                u = self._exit_point(k, x, y, radius_sq)
+                if u is not None:
+                    break
+                k = self._next(k)
+            if u is None:
+                if k is None:
+                    return None
+                k = self._gallop(k, self.num_segments,
+                                 lambda idx: self._exit_parameters(idx, x, y, radius_sq) >= 0)
+                if k is None:
+                    return None
+                u = self._exit_point(k, x, y, radius_sq)
+
+        self._lookahead_segment = k
+        x0, y0 = self._x[k], self._y[k]
+        return x0 + u * (self._x[k + 1] - x0), y0 + u * (self._y[k + 1] - y0)
+
+    def _ahead(self, i, j):
+        # Whether segment j lies within half a lap ahead of segment i
+        if self.closed:
+            return 0 < (j - i) % self.num_segments < self.num_segments // 2
+        return j > i
+
+
+def find_lookahead_point(car, follower, lookahead_distance):
+    # Heading error towards the lookahead point, or None past the end of the path
+    point = follower.lookahead_point(car.x, car.y, lookahead_distance)
+    if point is None:
+        return None
+    dx = point[0] - car.x
+    dy = point[1] - car.y
+    # Calculate angle to the lookahead point
+    angle_to_point = math.atan2(dy, dx)
+    # Calculate the steering angle needed
+    angle_diff = angle_to_point - car.yaw
+    # Normalize the angle difference
+    angle_diff = (angle_diff + math.pi) % (2 * math.pi) - math.pi
+    return angle_diff
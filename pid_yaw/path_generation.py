@@ -1,19 +1,22 @@
 import math
 import random
 
-def generate_smooth_random_path(start_point, num_segments=5, segment_length=100):
+def generate_smooth_random_path(start_point, num_segments=5, segment_length=100, rng=None):
     """
     Generates a smooth, random path starting from 'start_point'.
     
     :param start_point: A tuple of (x, y) coordinates to start the path.
     :param num_segments: Number of segments (or points) to generate.
     :param segment_length: Approximate length of each segment.
+    :param rng: random.Random to draw from, e.g. from seeded_rng(); the global
+        random module by default.
     :return: A list of tuples representing the points along the path.
     """
+    rng = rng or random
     points = [start_point]
-    direction = random.uniform(0, 2 * math.pi)
+    direction = rng.uniform(0, 2 * math.pi)
     for _ in range(num_segments - 1):
-        direction += random.uniform(-math.pi / 4, math.pi / 4)  # Slight direction change
+        direction += rng.uniform(-math.pi / 4, math.pi / 4)  # Slight direction change
         new_point = (points[-1][0] + math.cos(direction) * segment_length,
                      points[-1][1] + math.sin(direction) * segment_length)
         points.append(new_point)
@@ -21,6 +24,16 @@ def generate_smooth_random_path(start_point, num_segments=5, segment_length=100)
 
 
 
+def seeded_rng(seed=None):
+    """
+    random.Random for reproducible paths. Without a seed one is drawn, so the
+    run can still be repeated: returns (rng, seed).
+    """
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    return random.Random(seed), seed
+
+
 def generate_circle(cx, cy, radius, points=100):
     circle = []
     for i in range(points):
@@ -30,4 +43,15 @@ def generate_circle(cx, cy, radius, points=100):
         circle.append((x, y))
     # Ensure the path is continuous by appending the starting point at the end
     circle.append(circle[0])
-    return circle
\ No newline at end of file
+    return circle
+
+
+def generate_square_path(center_x, center_y, side_length):
+    half_side = side_length / 2
+    return [
+        (center_x - half_side, center_y - half_side),  # Top-left
+        (center_x + half_side, center_y - half_side),  # Top-right
+        (center_x + half_side, center_y + half_side),  # Bottom-right
+        (center_x - half_side, center_y + half_side),  # Bottom-left
+        (center_x - half_side, center_y - half_side)  # Return to start
+    ]
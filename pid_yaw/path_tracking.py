@@ -0,0 +1,116 @@
+"""
+Geometric path trackers for whole fleets: pure pursuit and Stanley.
+
+Both controllers take arrays of vehicle states and one shared Path and
+compute a curvature command for every vehicle in a few array passes: the
+projection onto the path goes through Path.project (one KD-tree query for
+the batch) and the lookahead point through Path.interpolate, so the cost
+grows with the number of vehicles, not with Python iterations. Scalars work
+too, for a single Car.
+
+The curvature command is turned into wheel angles by apply_curvature():
+
+2ws  front_wheel_angle = atan(curvature * length), rear_wheel_angle = 0,
+     the fields of Car / CarBatch, then advanced with drive()
+4ws  the four wheel angles of Car_4ws / Car4wsBatch through the curvature
+     table under a rear-steer policy (steer_to_curvature), then update()/step()
+
+The car models turn their center about the instantaneous center of rotation,
+so the curvature of the center's path is tan(front) / length exactly and no
+rear-axle offset is needed.
+"""
+import numpy as np
+from path import wrap_angle
+
+MODES = ('2ws', '4ws')
+
+
+class PurePursuit:
+    """
+    Steer every vehicle along the circular arc through a lookahead point on
+    the path, `lookahead + lookahead_time * velocity` of arc length ahead of
+    its projection.
+
+    :param path: Shared path.Path.
+    """
+
+    def __init__(self, path, lookahead=50.0, lookahead_time=0.0):
+        self.path = path
+        self.lookahead = lookahead
+        self.lookahead_time = lookahead_time
+
+    def curvature(self, x, y, yaw, velocity):
+        station, _, _ = self.path.project(x, y)
+        distance = self.lookahead + self.lookahead_time * np.abs(velocity)
+        tx, ty, _ = self.path.interpolate(station + distance)
+        dx, dy = tx - np.asarray(x), ty - np.asarray(y)
+        chord = np.hypot(dx, dy)
+        alpha = wrap_angle(np.arctan2(dy, dx) - yaw)
+        # A target behind the car gets the tightest turn toward its side
+        alpha = np.where(np.abs(alpha) > np.pi / 2, np.copysign(np.pi / 2, alpha), alpha)
+        # The arc through the target point tangent to the heading: 2 sin(alpha) / chord
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(chord > 1e-9, 2 * np.sin(alpha) / chord, 0.0)
+
+    def steer(self, cars, mode='2ws', policy='front_only'):
+        curvature = self.curvature(cars.x, cars.y, cars.yaw, cars.velocity)
+        apply_curvature(cars, curvature, mode, policy)
+        return curvature
+
+
+class Stanley:
+    """
+    Stanley steering law at the front axle: the path heading error plus
+    atan(gain * cte / (softening + velocity)), as a curvature command.
+
+    :param path: Shared path.Path.
+    :param gain: Cross-track gain, 1 / seconds.
+    :param softening: Keeps the cross-track term bounded at low speed.
+    """
+
+    def __init__(self, path, gain=1.0, softening=1.0):
+        self.path = path
+        self.gain = gain
+        self.softening = softening
+
+    def curvature(self, x, y, yaw, velocity, length=50, max_steering_angle=np.pi / 3):
+        # Error at the front axle, half a car length ahead of the center
+        front_x = np.asarray(x) + length / 2 * np.cos(yaw)
+        front_y = np.asarray(y) + length / 2 * np.sin(yaw)
+        _, segment, cte = self.path.project(front_x, front_y)
+        heading_error = wrap_angle(self.path.headings[segment] - yaw)
+        # The CTE is positive to the right of the path, which needs a left (positive) turn
+        steering = heading_error + np.arctan2(self.gain * cte, self.softening + np.abs(velocity))
+        steering = np.clip(steering, -max_steering_angle, max_steering_angle)
+        return np.tan(steering) / length
+
+    def steer(self, cars, mode='2ws', policy='front_only'):
+        curvature = self.curvature(cars.x, cars.y, cars.yaw, cars.velocity, cars.length, cars.max_steering_angle)
+        apply_curvature(cars, curvature, mode, policy)
+        return curvature
+
+
+TRACKERS = {'pure_pursuit': PurePursuit, 'stanley': Stanley}
+
+
+def apply_curvature(cars, curvature, mode='2ws', policy='front_only'):
+    """
+    Set the wheel angles of a car or a batch of cars to turn with
+    `curvature` (1 / radius, positive to the left).
+
+    :param mode: '2ws' for Car / CarBatch (front wheels only), '4ws' for
+        Car_4ws / Car4wsBatch.
+    :param policy: Rear-steer policy of the 4ws mode, see curvature_table.POLICIES.
+    """
+    if mode == '4ws':
+        cars.steer_to_curvature(curvature, policy)
+    elif mode == '2ws':
+        front = np.clip(np.arctan(curvature * cars.length), -cars.max_steering_angle, cars.max_steering_angle)
+        if np.ndim(cars.front_wheel_angle):
+            cars.front_wheel_angle[:] = front
+            cars.rear_wheel_angle[:] = 0.0
+        else:
+            cars.front_wheel_angle = float(front)
+            cars.rear_wheel_angle = 0.0
+    else:
+        raise ValueError(f"Unknown steering mode: {mode}, expected one of {MODES}")
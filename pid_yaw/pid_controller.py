@@ -5,9 +5,14 @@ class PIDController:
         self.Kd = Kd
         self.previous_error = 0
         self.integral = 0
+        # Terms of the last output, kept for telemetry
+        self.p_term = self.i_term = self.d_term = 0.0
 
     def update(self, error, delta_time):
         self.integral += error * delta_time
         derivative = (error - self.previous_error) / delta_time if delta_time > 0 else 0
         self.previous_error = error
-        return self.Kp * error + self.Ki * self.integral + self.Kd * derivative
\ No newline at end of file
+        self.p_term = self.Kp * error
+        self.i_term = self.Ki * self.integral
+        self.d_term = self.Kd * derivative
+        return self.p_term + self.i_term + self.d_term
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""
+Per-phase frame profiler for the main loops.
+
+The simulation loops time their phases (events, physics, draw) and the entry
+points add finer ones (control, flip) with `with profiler.phase(name):`.
+Phases nest: a phase's time excludes the phases opened inside it, so
+'physics' is the step without its 'control' part. Every duration, taken with
+perf_counter_ns, goes into a fixed-size histogram per phase: log-spaced bins,
+8 per octave, so a value costs one bin increment and percentiles are
+accurate to about 6%. Whole frames are timed too, and a frame that overruns
+its 1 / fps budget counts as dropped.
+
+Results are shown by an optional overlay (p50 / p99 per phase), exported as
+JSON (summary and histogram bins) and as a Chrome trace of the most recent
+spans (chrome://tracing or https://ui.perfetto.dev). A disabled profiler
+hands out one shared no-op context, so the hooks can stay in every loop.
+"""
+import contextlib
+import itertools
+import json
+import sys
+import threading
+import time
+
+SUB_BINS = 8  # Bins per octave
+BINS = 2 * SUB_BINS + 35 * SUB_BINS  # Exact bins below 16 ns, then octaves up to about 2**39 ns
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def _bin(ns):
+    if ns < 2 * SUB_BINS:
+        return max(ns, 0)
+    shift = ns.bit_length() - 4
+    return min(2 * SUB_BINS + (shift - 1) * SUB_BINS + (ns >> shift) - SUB_BINS, BINS - 1)
+
+
+def _bin_range(index):
+    # [low, high) nanoseconds of a bin
+    if index < 2 * SUB_BINS:
+        return index, index + 1
+    shift = (index - 2 * SUB_BINS) // SUB_BINS + 1
+    low = ((index - 2 * SUB_BINS) % SUB_BINS + SUB_BINS) << shift
+    return low, low + (1 << shift)
+
+
+class Histogram:
+    """Fixed-size log-binned histogram of durations in nanoseconds."""
+
+    def __init__(self):
+        self.counts = [0] * BINS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        self.counts[_bin(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q):
+        # Midpoint of the bin holding the q-th percentile, in nanoseconds
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                low, high = _bin_range(index)
+                return min((low + high) / 2, self.max)
+        return float(self.max)
+
+    def summary(self):
+        return {'count': self.count,
+                'total_ms': self.total / 1e6,
+                'mean_ms': self.total / self.count / 1e6 if self.count else 0.0,
+                'p50_ms': self.percentile(50) / 1e6,
+                'p90_ms': self.percentile(90) / 1e6,
+                'p99_ms': self.percentile(99) / 1e6,
+                'max_ms': self.max / 1e6}
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start', 'children')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        stack.append(self)
+        self.children = 0
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].children += duration
+        self.profiler._add(self.name, duration - self.children, self.start, duration)
+
+
+class Profiler:
+    """
+    :param fps: Frame rate whose budget (1 / fps) decides which frames are dropped.
+    :param trace_capacity: Number of most recent spans kept for the Chrome trace.
+    :param enabled: A disabled profiler records nothing.
+    :param overlay: Whether overlays() returns the on-screen overlay.
+    """
+
+    def __init__(self, fps=60, trace_capacity=65536, enabled=True, overlay=False):
+        self.enabled = enabled
+        self.show_overlay = overlay
+        self.frame_budget = int(1e9 / fps)
+        self.histograms = {}
+        self.frames = 0
+        self.dropped_frames = 0
+        self._local = threading.local()
+        self._trace = [None] * trace_capacity
+        self._trace_index = itertools.count()  # next() is atomic, so both loop threads can record
+        self._threads = {}
+        self._origin = time.perf_counter_ns()
+        self._font = None
+        self._overlay_text = []
+        self._overlay_updated = 0
+
+    def phase(self, name):
+        # Context manager timing one phase; nests
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def instrument(self, obj, method, name):
+        # Time every call of obj.method (an instance or module attribute) as phase `name`
+        if not self.enabled:
+            return
+        function = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+            with _Span(self, name):
+                return function(*args, **kwargs)
+        setattr(obj, method, timed)
+
+    def frame(self, start_ns):
+        # End a frame of the render loop that started at perf_counter_ns() `start_ns`
+        if not self.enabled:
+            return
+        duration = time.perf_counter_ns() - start_ns
+        self._add('frame', duration, start_ns, duration)
+        self.frames += 1
+        if duration > self.frame_budget:
+            self.dropped_frames += 1
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def _add(self, name, exclusive, start, duration):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram())
+        histogram.add(exclusive)
+        thread = threading.get_ident()
+        if thread not in self._threads:
+            self._threads[thread] = threading.current_thread().name
+        self._trace[next(self._trace_index) % len(self._trace)] = (name, start, duration, thread)
+
+    def _phases(self):
+        # Snapshot of the histograms: the physics thread may add a phase while the main thread reads them
+        return list(self.histograms.items())
+
+    def summary(self):
+        return {name: histogram.summary() for name, histogram in self._phases()}
+
+    def to_json(self):
+        # Summary plus the non-empty histogram bins, as [low_ns, high_ns, count]
+        return {'frame_budget_ms': self.frame_budget / 1e6,
+                'frames': self.frames,
+                'dropped_frames': self.dropped_frames,
+                'phases': {name: dict(histogram.summary(),
+                                      bins=[list(_bin_range(index)) + [count]
+                                            for index, count in enumerate(histogram.counts) if count])
+                           for name, histogram in self._phases()}}
+
+    def save_json(self, path):
+        with open(path, 'w') as output:
+            json.dump(self.to_json(), output, indent=1)
+
+    def save_trace(self, path):
+        # Chrome trace event format: one complete ('X') event per span, timestamps in microseconds
+        spans = sorted((span for span in self._trace if span is not None), key=lambda span: span[1])
+        threads = list(self._threads.items())
+        tids = {thread: tid for tid, (thread, _) in enumerate(threads)}
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tids[thread], 'args': {'name': name}}
+                  for thread, name in threads]
+        events += [{'name': name, 'cat': 'frame' if name == 'frame' else 'phase', 'ph': 'X', 'pid': 0,
+                    'tid': tids[thread], 'ts': (start - self._origin) / 1e3, 'dur': duration / 1e3}
+                   for name, start, duration, thread in spans]
+        with open(path, 'w') as output:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output)
+
+    def report(self):
+        lines = [f"{'phase':<12}{'calls':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'total s':>9}"]
+        for name, histogram in sorted(self._phases(), key=lambda item: -item[1].total):
+            stats = histogram.summary()
+            lines.append(f"{name:<12}{stats['count']:>9}{stats['p50_ms']:>9.3f}{stats['p99_ms']:>9.3f}"
+                         f"{stats['max_ms']:>9.3f}{stats['total_ms'] / 1e3:>9.3f}")
+        lines.append(f"{self.frames} frames, {self.dropped_frames} over the {self.frame_budget / 1e6:.1f} ms budget")
+        return '\n'.join(lines)
+
+    def overlays(self):
+        # SceneRenderer overlays: the profiler overlay when enabled with overlay=True
+        return (self.draw,) if self.enabled and self.show_overlay else ()
+
+    def draw(self, screen, position=(10, 10), color=(0, 0, 0)):
+        """
+        Draw p50 / p99 per phase and the dropped frame count; the text is
+        refreshed twice a second. Returns the Rect it touched.
+        """
+        import pygame
+        if self._font is None:
+            self._font = pygame.font.Font(None, 20)
+        now = time.perf_counter_ns()
+        if now - self._overlay_updated > 500_000_000:
+            self._overlay_updated = now
+            lines = [f"{name}: p50 {histogram.percentile(50) / 1e6:.2f} ms  p99 {histogram.percentile(99) / 1e6:.2f} ms"
+                     for name, histogram in sorted(self._phases())]
+            lines.append(f"dropped frames: {self.dropped_frames} / {self.frames}")
+            self._overlay_text = [self._font.render(line, True, color) for line in lines]
+        x, y = position
+        rects = []
+        for text in self._overlay_text:
+            rects.append(screen.blit(text, (screen.get_width() - text.get_width() - x, y)))
+            y += text.get_height()
+        return rects[0].unionall(rects[1:]) if rects else None
+
+
+DISABLED = Profiler(enabled=False, trace_capacity=0)
+
+
+def make_profiler(args, fps=60):
+    # Profiler configured from the add_simulation_arguments() --profile flags; disabled when none is given
+    return Profiler(fps, enabled=bool(args.profile or args.profile_trace or args.profile_overlay),
+                    overlay=args.profile_overlay)
+
+
+def finish_profiler(profiler, args):
+    # Print the per-phase table and write the files selected by --profile / --profile-trace
+    if not profiler.enabled:
+        return
+    print(profiler.report(), file=sys.stderr)
+    if args.profile:
+        profiler.save_json(args.profile)
+    if args.profile_trace:
+        profiler.save_trace(args.profile_trace)
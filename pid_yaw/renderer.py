@@ -0,0 +1,79 @@
+import pygame
+from constants import WHITE
+from profiler import DISABLED
+
+
+class SceneRenderer:
+    """
+    Renders a scene as a cached static background plus dynamic objects.
+
+    Static elements (paths, lanes) are drawn once onto an off-screen surface.
+    Each frame only the areas the dynamic objects covered last frame are
+    restored from that surface, the objects are drawn again and just those
+    rectangles are pushed to the display with pygame.display.update(rects)
+    instead of a full flip().
+
+    :param screen: Display surface returned by pygame.display.set_mode.
+    :param background_color: Fill color of the static layer.
+    :param margin: Half size of the square assumed to contain everything an
+        object draws around its (x, y) position, steering lines included.
+    :param profiler: Optional profiler.Profiler timing the display update as 'flip'.
+    """
+
+    def __init__(self, screen, background_color=WHITE, margin=70, profiler=None):
+        self.screen = screen
+        self.profiler = profiler or DISABLED
+        self.background_color = background_color
+        self.margin = margin
+        self.background = pygame.Surface(screen.get_size())
+        self._static_drawers = []
+        self._dirty = []
+        self._full_redraw = True
+        self.rebuild()
+
+    def add_static(self, draw):
+        # draw(surface) is called now and whenever the background is rebuilt
+        self._static_drawers.append(draw)
+        draw(self.background)
+        self._full_redraw = True
+
+    def rebuild(self):
+        self.background.fill(self.background_color)
+        for draw in self._static_drawers:
+            draw(self.background)
+        self._full_redraw = True
+
+    def bounds(self, obj):
+        size = 2 * self.margin
+        return pygame.Rect(int(obj.x) - self.margin, int(obj.y) - self.margin, size, size)
+
+    def render(self, objects, overlays=()):
+        """
+        Draw one frame.
+
+        :param objects: Objects with x, y and draw(screen), e.g. cars.
+        :param overlays: Callables draw(screen) returning the Rect they touched,
+            for HUD elements that are not tied to an object position.
+        """
+        if self._full_redraw:
+            self.screen.blit(self.background, (0, 0))
+        else:
+            # Erase last frame's dynamic objects
+            for rect in self._dirty:
+                self.screen.blit(self.background, rect, rect)
+
+        rects = [self.bounds(obj) for obj in objects]
+        for obj in objects:
+            obj.draw(self.screen)
+        for overlay in overlays:
+            rect = overlay(self.screen)
+            if rect is not None:
+                rects.append(rect)
+
+        with self.profiler.phase('flip'):
+            if self._full_redraw:
+                pygame.display.flip()
+                self._full_redraw = False
+            else:
+                pygame.display.update(self._dirty + rects)
+        self._dirty = rects
@@ -0,0 +1,116 @@
+import argparse
+import time
+import numpy as np
+import pygame
+from constants import *
+from trajectory import Trajectory
+
+TIMELINE_HEIGHT = 20
+
+
+def car_polygons(frame, length=50, width=20):
+    # Corners of every car at one frame, shape (n_cars, 4, 2)
+    cos, sin = np.cos(frame['yaw']), np.sin(frame['yaw'])
+    corners = np.array([(length / 2, width / 2), (length / 2, -width / 2),
+                        (-length / 2, -width / 2), (-length / 2, width / 2)])
+    x = frame['x'][:, None] + corners[:, 0] * cos[:, None] - corners[:, 1] * sin[:, None]
+    y = frame['y'][:, None] + corners[:, 0] * sin[:, None] + corners[:, 1] * cos[:, None]
+    return np.stack((x, y), axis=-1)
+
+
+def draw_frame(screen, trajectory, index, trail, font, max_trail_cars=64):
+    screen.fill(WHITE)
+    frame = trajectory.frame(index)
+
+    # Recent path of the first cars, read from the memory-mapped columns
+    start = max(0, index - trail)
+    if index > start:
+        xs = trajectory.column('x', start, index + 1)[:, :max_trail_cars]
+        ys = trajectory.column('y', start, index + 1)[:, :max_trail_cars]
+        for car in range(xs.shape[1]):
+            pygame.draw.lines(screen, GREY, False, np.column_stack((xs[:, car], ys[:, car])), 1)
+
+    front = (frame['front_left_wheel_angle'] + frame['front_right_wheel_angle']) / 2
+    rear = (frame['rear_left_wheel_angle'] + frame['rear_right_wheel_angle']) / 2
+    for car, corners in enumerate(car_polygons(frame)):
+        pygame.draw.polygon(screen, BLUE, corners)
+        front_center, rear_center = corners[:2].mean(axis=0), corners[2:].mean(axis=0)
+        yaw = frame['yaw'][car]
+        for center, angle, color in ((front_center, front[car], RED), (rear_center, rear[car], GREEN)):
+            end = center + 30 * np.array((np.cos(yaw + angle), np.sin(yaw + angle)))
+            pygame.draw.line(screen, color, center, end, 2)
+
+    # Timeline with the current position
+    bar = pygame.Rect(0, screen_height - TIMELINE_HEIGHT, screen_width, TIMELINE_HEIGHT)
+    pygame.draw.rect(screen, GREY, bar)
+    position = int(index / max(len(trajectory) - 1, 1) * (screen_width - 1))
+    pygame.draw.line(screen, RED, (position, bar.top), (position, bar.bottom), 3)
+    text = font.render(f"frame {index}/{len(trajectory) - 1}  t={frame['time']:.2f}s", True, BLACK)
+    screen.blit(text, (10, 10))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a run saved with --record")
+    parser.add_argument('directory', help="Recording directory")
+    parser.add_argument('--start', type=float, default=0, help="Simulated time to start from, in seconds")
+    parser.add_argument('--speed', type=float, default=1, help="Playback speed relative to real time")
+    parser.add_argument('--trail', type=int, default=300, help="Frames of path drawn behind each car")
+    args = parser.parse_args()
+
+    trajectory = Trajectory(args.directory)
+    if not len(trajectory):
+        parser.error("the recording is empty")
+    dt = trajectory.dt or 1 / 60
+
+    pygame.init()
+    screen = pygame.display.set_mode((screen_width, screen_height))
+    pygame.display.set_caption(f"Replay {args.directory}")
+    font = pygame.font.Font(None, 24)
+    clock = pygame.time.Clock()
+
+    # Controls: space pauses, left/right step (shift: 100 frames), up/down change
+    # the speed, home/end jump, a click on the timeline seeks
+    position = float(trajectory.seek_time(args.start))
+    speed = args.speed
+    playing = True
+    last = len(trajectory) - 1
+    previous = time.perf_counter()
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                step = 100 if event.mod & pygame.KMOD_SHIFT else 1
+                if event.key == pygame.K_SPACE:
+                    playing = not playing
+                elif event.key == pygame.K_RIGHT:
+                    position += step
+                elif event.key == pygame.K_LEFT:
+                    position -= step
+                elif event.key == pygame.K_UP:
+                    speed *= 2
+                elif event.key == pygame.K_DOWN:
+                    speed /= 2
+                elif event.key == pygame.K_HOME:
+                    position = 0
+                elif event.key == pygame.K_END:
+                    position = last
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.pos[1] >= screen_height - TIMELINE_HEIGHT:
+                position = event.pos[0] / (screen_width - 1) * last
+
+        now = time.perf_counter()
+        if playing:
+            position += speed * (now - previous) / dt
+        previous = now
+        position = min(max(position, 0), last)
+
+        draw_frame(screen, trajectory, int(position), args.trail, font)
+        pygame.display.flip()
+        clock.tick(60)
+
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
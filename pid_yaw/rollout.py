@@ -0,0 +1,183 @@
+import math
+import random
+import numpy as np
+from car_batch import CarBatch
+from car_4ws_batch import Car4wsBatch
+from mpc import MPC
+from path import Path
+from path_generation import generate_circle, generate_smooth_random_path, generate_square_path
+from path_tracking import TRACKERS
+
+METRICS = ('rms_cte', 'max_cte', 'max_overshoot', 'settling_time', 'steering_effort', 'diverged')
+
+
+def make_path(path_type, start=(400, 300), seed=None, num_segments=40):
+    """
+    Build one of the standard test paths as a Path, starting at `start`.
+
+    :param path_type: 'circle', 'square' or 'random'.
+    :param seed: Seed for the random path, so every worker builds the same one.
+    :param num_segments: Number of segments of the random path.
+    """
+    x, y = start
+    if path_type == 'circle':
+        return Path(generate_circle(x + 100, y, 100, points=100))
+    if path_type == 'square':
+        return Path(generate_square_path(x + 100, y, 200))
+    if path_type == 'random':
+        points = generate_smooth_random_path(start, num_segments=num_segments, segment_length=50,
+                                             rng=random.Random(seed))
+        return Path(points)
+    raise ValueError(f"Unknown path type: {path_type}")
+
+
+def simulate_pid(path, Kp, Ki, Kd, velocity=30, duration=20.0, delta_time=1 / 60,
+                 initial_offset=20.0, settle_band=5.0, divergence_cte=300.0, recorder=None,
+                 gain_schedule=None):
+    """
+    Headless closed-loop rollouts of the pid_yaw Car on `path`, one vehicle
+    per entry of the (broadcast) gain arrays, advanced together in a CarBatch.
+
+    Every vehicle starts at the path start, `initial_offset` to the right of
+    it and aligned with it, so the run is a step response. Metrics are
+    accumulated on the fly; no trajectory is stored unless a
+    trajectory.TrajectoryRecorder for the n vehicles is passed as `recorder`.
+    A gain_schedule.GainSchedule overrides the gains with speed-scheduled ones.
+
+    :return: Dict of per-vehicle arrays keyed by METRICS:
+        rms_cte - root mean square cross-track error,
+        max_cte - largest absolute cross-track error,
+        max_overshoot - largest error on the opposite side of the initial offset,
+        settling_time - time after which |cte| stays within `settle_band`
+            (duration when it never settles),
+        steering_effort - RMS front wheel angle in radians, up to divergence,
+        diverged - whether |cte| ever exceeded `divergence_cte`; the four
+            error metrics of a diverged vehicle are inf.
+    """
+    cars, x0, y0 = _start_cars(path, initial_offset, lambda x, y, angle: CarBatch(
+        x, y, angle, velocity, Kp, Ki, Kd, gain_schedule=gain_schedule))
+
+    def advance(cte):
+        cars.step(delta_time, cte)
+        return cars.front_wheel_angle
+
+    return _closed_loop(path, cars, advance, x0, y0, duration, delta_time, initial_offset,
+                        settle_band, divergence_cte, recorder)
+
+
+def simulate_tracker(path, tracker='pure_pursuit', velocity=30, mode='2ws', policy='front_only', n=1,
+                     duration=20.0, delta_time=1 / 60, initial_offset=20.0, settle_band=5.0,
+                     divergence_cte=300.0, recorder=None, **options):
+    """
+    simulate_pid for the geometric trackers of path_tracking.py: n vehicles
+    (CarBatch in the '2ws' mode, Car4wsBatch in the '4ws' mode) steered by
+    one tracker, `options` being its constructor arguments.
+
+    :return: Dict of per-vehicle arrays keyed by METRICS, see simulate_pid;
+        steering_effort uses the average front wheel angle.
+    """
+    controller = TRACKERS[tracker](path, **options)
+    if mode == '4ws':
+        cars, x0, y0 = _start_cars(path, initial_offset, lambda x, y, angle: Car4wsBatch(
+            x, y, angle, velocity, n=n))
+
+        def advance(cte):
+            controller.steer(cars, mode, policy)
+            cars.step(delta_time)
+            return cars.avg_front_wheel_angle
+    else:
+        cars, x0, y0 = _start_cars(path, initial_offset, lambda x, y, angle: CarBatch(
+            x, y, angle, velocity, n=n))
+
+        def advance(cte):
+            controller.steer(cars, mode, policy)
+            cars.drive(delta_time)
+            return cars.front_wheel_angle
+
+    return _closed_loop(path, cars, advance, x0, y0, duration, delta_time, initial_offset,
+                        settle_band, divergence_cte, recorder)
+
+
+def simulate_mpc(path, velocity=30, duration=20.0, delta_time=1 / 60, initial_offset=20.0, settle_band=5.0,
+                 divergence_cte=300.0, recorder=None, **options):
+    """
+    simulate_pid for the mpc.MPC controller steering one Car_4ws (a
+    Car4wsBatch of one), `options` being the MPC constructor arguments.
+    Solves stop on max_iterations and convergence, not on a wall-clock budget
+    (unless `time_budget` is passed), so the rollout is reproducible.
+
+    :return: Dict of one-entry arrays keyed by METRICS, see simulate_pid;
+        steering_effort uses the average front wheel angle.
+    """
+    cars, x0, y0 = _start_cars(path, initial_offset, lambda x, y, angle: Car4wsBatch(x, y, angle, velocity))
+    options.setdefault('time_budget', None)
+    controller = MPC(path, cars.length[0], cars.max_steering_angle[0], **options)
+
+    def advance(cte):
+        front, rear = controller.solve(cars.x[0], cars.y[0], cars.yaw[0], cars.velocity[0], delta_time)
+        cars.front_left_wheel_angle[:] = cars.front_right_wheel_angle[:] = front
+        cars.rear_left_wheel_angle[:] = cars.rear_right_wheel_angle[:] = rear
+        cars.step(delta_time)
+        return cars.avg_front_wheel_angle
+
+    return _closed_loop(path, cars, advance, x0, y0, duration, delta_time, initial_offset,
+                        settle_band, divergence_cte, recorder)
+
+
+def _start_cars(path, initial_offset, make_cars):
+    # Cars at the path start, `initial_offset` to the right of it and aligned with it
+    x0, y0, heading = path.interpolate(0.0)
+    # Offset to the right of the path in x-y math axes (same sign as the CTE)
+    start_x = x0 + initial_offset * math.sin(heading)
+    start_y = y0 - initial_offset * math.cos(heading)
+    return make_cars(start_x, start_y, math.degrees(heading)), x0, y0
+
+
+def _closed_loop(path, cars, advance, x0, y0, duration, delta_time, initial_offset,
+                 settle_band, divergence_cte, recorder):
+    # Step `advance(cte)` (returning the front wheel angles) and accumulate METRICS on the fly
+    n = cars.n
+
+    steps = int(round(duration / delta_time))
+    sum_sq_cte = np.zeros(n)
+    sum_sq_steering = np.zeros(n)
+    max_cte = np.zeros(n)
+    max_overshoot = np.zeros(n)
+    last_outside = np.zeros(n)
+    diverged = np.zeros(n, dtype=bool)
+    active_steps = np.zeros(n)
+    side = math.copysign(1.0, initial_offset) if initial_offset else 0.0
+
+    for step in range(steps):
+        cte = path.cross_track_error(cars.x, cars.y)
+        front_wheel_angle = advance(cte)
+        if recorder is not None:
+            recorder.record((step + 1) * delta_time, cars)
+
+        # Metrics freeze at divergence: parked cars would keep adding near-zero CTE
+        active = ~diverged
+        tracked = np.where(active, cte, 0.0)
+        sum_sq_cte += tracked * tracked
+        sum_sq_steering += np.where(active, front_wheel_angle * front_wheel_angle, 0.0)
+        active_steps += active
+        np.maximum(max_cte, np.abs(tracked), out=max_cte)
+        np.maximum(max_overshoot, -side * tracked if side else np.abs(tracked), out=max_overshoot)
+        outside = active & (np.abs(cte) > settle_band)
+        last_outside[outside] = (step + 1) * delta_time
+        diverged |= ~(np.abs(cte) <= divergence_cte)  # Also catches NaN
+
+        # Park diverged cars so they cannot blow up the path projection
+        if diverged.any():
+            cars.velocity[diverged] = 0
+            cars.x[diverged] = x0
+            cars.y[diverged] = y0
+
+    # A diverged car never tracked the path: its error metrics are infinite
+    return {
+        'rms_cte': np.where(diverged, np.inf, np.sqrt(sum_sq_cte / steps)),
+        'max_cte': np.where(diverged, np.inf, max_cte),
+        'max_overshoot': np.where(diverged, np.inf, max_overshoot),
+        'settling_time': np.where(diverged, np.inf, last_outside),
+        'steering_effort': np.sqrt(sum_sq_steering / np.maximum(active_steps, 1)),
+        'diverged': diverged,
+    }
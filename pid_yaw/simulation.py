@@ -0,0 +1,354 @@
+import collections
+import os
+import sys
+import threading
+import time
+from integrators import INTEGRATORS
+from profiler import DISABLED, finish_profiler, make_profiler
+
+
+class FixedStepSimulation:
+    """
+    Fixed-timestep simulation core that does not depend on pygame or a display.
+
+    Physics always advances in steps of exactly `dt`, so a run is reproducible
+    no matter how the frame rate jitters. Wall-clock time is fed into an
+    accumulator and turned into a whole number of steps; `render` is called
+    once at least `render_every` steps have run since the previous render.
+
+    :param step: Callable taking dt, advances physics and control by one step.
+    :param dt: Physics timestep in seconds.
+    :param render: Optional callable taking the interpolation factor alpha in [0, 1).
+    :param render_every: Number of physics steps between two render calls.
+    :param max_frame_time: Upper bound on the wall time accepted per frame, so a
+        long stall does not trigger a burst of catch-up steps.
+    :param snapshot: Optional callable returning a copy of the state to draw;
+        when given, render is called as render(alpha, state).
+    :param profiler: Optional profiler.Profiler timing the 'events', 'physics'
+        and 'draw' phases and every real-time frame.
+    """
+
+    def __init__(self, step, dt=1 / 60, render=None, render_every=1, max_frame_time=0.25, snapshot=None,
+                 profiler=None):
+        self.step = step
+        self.dt = dt
+        self.render = render
+        self.render_every = max(1, int(render_every))
+        self.max_frame_time = max_frame_time
+        self.snapshot = snapshot
+        self.profiler = profiler or DISABLED
+
+        self.accumulator = 0.0
+        self.step_count = 0
+        self.render_count = 0
+        self.running = False
+        self._steps_since_render = 0
+
+    @property
+    def sim_time(self):
+        return self.step_count * self.dt
+
+    def stop(self):
+        self.running = False
+
+    def advance(self, elapsed, max_steps=None):
+        # Feed `elapsed` seconds of wall time and run every whole step it covers
+        self.accumulator += min(elapsed, self.max_frame_time)
+        steps = 0
+        while self.accumulator >= self.dt and (max_steps is None or steps < max_steps):
+            with self.profiler.phase('physics'):
+                self.step(self.dt)
+            self.accumulator -= self.dt
+            steps += 1
+        self._after_steps(steps)
+        return steps
+
+    def _after_steps(self, steps):
+        self.step_count += steps
+        self._steps_since_render += steps
+        if self.render is not None and self._steps_since_render >= self.render_every:
+            with self.profiler.phase('draw'):
+                if self.snapshot is None:
+                    self.render(self.accumulator / self.dt)
+                else:
+                    self.render(self.accumulator / self.dt, self.snapshot())
+            self.render_count += 1
+            self._steps_since_render = 0
+
+    def run(self, duration=None, steps=None, fast_forward=False, fps=60, poll=None):
+        """
+        Run until `duration` simulated seconds or `steps` steps have elapsed, or
+        until stop() is called or `poll` returns False.
+
+        In fast-forward mode wall time is ignored and steps run back to back as
+        fast as the CPU allows; otherwise frames are paced at `fps`. `poll` is
+        called once per frame (e.g. to drain pygame events).
+        """
+        if steps is None and duration is not None:
+            steps = int(round(duration / self.dt))
+        last_step = None if steps is None else self.step_count + steps
+
+        self.running = True
+        frame_time = 1.0 / fps
+        previous = time.perf_counter()
+        while self.running:
+            if last_step is not None and self.step_count >= last_step:
+                break
+            frame_start = time.perf_counter_ns()
+            if poll is not None:
+                with self.profiler.phase('events'):
+                    keep_running = poll() is not False
+                if not keep_running:
+                    break
+
+            if fast_forward:
+                batch = self.render_every if self.render is not None else 1024
+                if last_step is not None:
+                    batch = min(batch, last_step - self.step_count)
+                # A stop() from inside a step ends the batch right after that step
+                ran = 0
+                while ran < batch and self.running:
+                    with self.profiler.phase('physics'):
+                        self.step(self.dt)
+                    ran += 1
+                self._after_steps(ran)
+                continue
+
+            now = time.perf_counter()
+            elapsed, previous = now - previous, now
+            self.advance(elapsed, None if last_step is None else last_step - self.step_count)
+            self.profiler.frame(frame_start)
+
+            # Sleep away what is left of the frame budget
+            remaining = frame_time - (time.perf_counter() - now)
+            if remaining > 0:
+                time.sleep(remaining)
+        self.running = False
+        return self.step_count
+
+
+class SnapshotBuffer:
+    """
+    Double buffer of state snapshots shared by the physics thread (writer) and
+    the render thread (reader).
+
+    publish() stores a new snapshot in the back slot and then flips the front
+    index with a single attribute store, which is atomic under the GIL, so the
+    reader never waits on a lock and never sees a half-written state. Snapshots
+    must be fresh objects (copies), never mutated once published. The slot
+    behind the front keeps the previous snapshot for interpolation.
+    """
+
+    def __init__(self):
+        self._slots = [None, None]
+        self._front = 0
+        self.sequence = 0  # Number of snapshots published so far
+        self.published_at = 0.0  # perf_counter() of the latest publish
+
+    def publish(self, state):
+        back = 1 - self._front
+        self._slots[back] = (state, self.sequence + 1)
+        self.published_at = time.perf_counter()
+        self._front = back
+        self.sequence += 1
+
+    def latest(self):
+        # (state, sequence) of the newest snapshot, (None, 0) before the first one
+        return self._slots[self._front] or (None, 0)
+
+    def previous(self):
+        return self._slots[1 - self._front] or (None, 0)
+
+
+class InputQueue:
+    """
+    Lock-free single-producer, single-consumer queue carrying input events from
+    the pygame main thread to the physics thread.
+
+    collections.deque append() and popleft() are atomic, so neither side ever
+    blocks the other; the physics step drains whatever arrived since its last
+    step and applies it at a step boundary.
+    """
+
+    def __init__(self, maxlen=4096):
+        self._items = collections.deque(maxlen=maxlen)
+
+    def put(self, item):
+        self._items.append(item)
+
+    def drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self._items.popleft())
+            except IndexError:
+                return items
+
+
+class ThreadedSimulation(FixedStepSimulation):
+    """
+    FixedStepSimulation with physics and control on their own thread.
+
+    The physics thread steps against absolute deadlines (one every `dt`), so a
+    slow frame on the render side does not shift the control timing; when it
+    falls more than `max_frame_time` behind it drops the backlog instead of
+    bursting. Every `render_every` steps it publishes `snapshot()` to a
+    SnapshotBuffer. The calling thread, which must be the one that owns the
+    pygame display, polls input and renders the latest snapshot at `fps`,
+    skipping snapshots it cannot keep up with.
+
+    :param snapshot: Callable returning a copy of the state to draw; render is
+        called as render(alpha, state), alpha being the fraction of a step
+        elapsed since the snapshot was published.
+    :param switch_interval: GIL switch interval while running (sys.setswitchinterval),
+        short enough for the physics thread to meet its deadlines while the
+        render thread runs Python code.
+    """
+
+    def __init__(self, step, dt=1 / 60, render=None, render_every=1, max_frame_time=0.25, snapshot=None,
+                 profiler=None, switch_interval=0.001):
+        super().__init__(step, dt, render, render_every, max_frame_time, snapshot, profiler)
+        self.snapshots = SnapshotBuffer()
+        self.switch_interval = switch_interval
+
+        # Control timing statistics of the physics thread
+        self.max_lateness = 0.0  # Worst delay of a step past its deadline, seconds
+        self.total_lateness = 0.0
+        self.late_steps = 0  # Steps that started more than a whole dt past their deadline
+        self.resyncs = 0  # Times the backlog was dropped
+        self.dropped_snapshots = 0  # Published snapshots that were never rendered
+        self._error = None
+
+    def _physics_loop(self, last_step, fast_forward):
+        try:
+            deadline = time.perf_counter()
+            while self.running and (last_step is None or self.step_count < last_step):
+                if not fast_forward:
+                    lateness = time.perf_counter() - deadline
+                    if lateness < 0:
+                        time.sleep(-lateness)
+                        lateness = max(0.0, time.perf_counter() - deadline)
+                    if lateness > self.max_frame_time:
+                        self.resyncs += 1
+                        deadline = time.perf_counter()
+                    self.max_lateness = max(self.max_lateness, lateness)
+                    self.total_lateness += lateness
+                    self.late_steps += lateness > self.dt
+                    deadline += self.dt
+
+                with self.profiler.phase('physics'):
+                    self.step(self.dt)
+                self.step_count += 1
+                self._steps_since_render += 1
+                if self.render is not None and self._steps_since_render >= self.render_every:
+                    self.snapshots.publish(None if self.snapshot is None else self.snapshot())
+                    self._steps_since_render = 0
+        except BaseException as error:  # Re-raised on the calling thread
+            self._error = error
+        finally:
+            self.running = False
+
+    def run(self, duration=None, steps=None, fast_forward=False, fps=60, poll=None):
+        """
+        Run the physics thread until `duration` simulated seconds or `steps`
+        steps have elapsed, or until stop() is called or `poll` returns False;
+        poll and render run on the calling thread meanwhile.
+        """
+        if steps is None and duration is not None:
+            steps = int(round(duration / self.dt))
+        last_step = None if steps is None else self.step_count + steps
+
+        self.running = True
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.switch_interval))
+        physics = threading.Thread(target=self._physics_loop, args=(last_step, fast_forward),
+                                   name='physics', daemon=True)
+        physics.start()
+
+        frame_time = 1.0 / fps
+        rendered = 0
+        try:
+            while self.running:
+                start = time.perf_counter()
+                frame_start = time.perf_counter_ns()
+                if poll is not None:
+                    with self.profiler.phase('events'):
+                        keep_running = poll() is not False
+                    if not keep_running:
+                        break
+                state, sequence = self.snapshots.latest()
+                if self.render is not None and sequence > rendered:
+                    self.dropped_snapshots += sequence - rendered - 1
+                    rendered = sequence
+                    alpha = min((time.perf_counter() - self.snapshots.published_at) / self.dt, 1.0)
+                    with self.profiler.phase('draw'):
+                        if self.snapshot is None:
+                            self.render(alpha)
+                        else:
+                            self.render(alpha, state)
+                    self.render_count += 1
+                    self.profiler.frame(frame_start)
+
+                remaining = frame_time - (time.perf_counter() - start)
+                if remaining > 0:
+                    time.sleep(remaining)
+        finally:
+            self.running = False
+            physics.join()
+            sys.setswitchinterval(switch_interval)
+        if self._error is not None:
+            raise self._error
+        return self.step_count
+
+    def timing_report(self):
+        mean = self.total_lateness / self.step_count if self.step_count else 0.0
+        return (f"{self.step_count} physics steps, lateness mean {mean * 1000:.2f} ms "
+                f"max {self.max_lateness * 1000:.2f} ms, {self.late_steps} late steps, "
+                f"{self.resyncs} resyncs, {self.render_count} frames, "
+                f"{self.dropped_snapshots} snapshots not rendered")
+
+
+def add_simulation_arguments(parser):
+    # Command-line flags shared by every entry point that runs on FixedStepSimulation
+    parser.add_argument('--headless', action='store_true', help="Run without a display and without rendering")
+    parser.add_argument('--fast-forward', action='store_true', help="Run physics as fast as the CPU allows")
+    parser.add_argument('--duration', type=float, help="Simulated seconds to run before exiting")
+    parser.add_argument('--render-every', type=int, default=1, help="Physics steps between two rendered frames")
+    parser.add_argument('--dt', type=float, default=1 / 60, help="Fixed physics timestep in seconds")
+    parser.add_argument('--integrator', choices=sorted(INTEGRATORS),
+                        help="Pose integrator of the car model ('arc' is exact for any --dt), "
+                             "the model's own by default")
+    parser.add_argument('--threaded', action='store_true',
+                        help="Run physics and control on their own fixed-rate thread; "
+                             "the main thread renders the latest state snapshot")
+    parser.add_argument('--profile', metavar='FILE', help="Time every loop phase and write the histograms to a .json file")
+    parser.add_argument('--profile-trace', metavar='FILE',
+                        help="Write the most recent phase spans as a Chrome trace (.json, chrome://tracing)")
+    parser.add_argument('--profile-overlay', action='store_true', help="Show p50/p99 per phase and dropped frames")
+    return parser
+
+
+def parse_simulation_arguments(parser):
+    args = parser.parse_args()
+    if args.headless:
+        # Must happen before pygame.display.set_mode()
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    return args
+
+
+def run_simulation(step, render, args, poll=None, snapshot=None, profiler=None):
+    # Build and run a FixedStepSimulation (ThreadedSimulation with --threaded) configured from
+    # add_simulation_arguments() flags; with `snapshot`, render(alpha, state) draws a copied state.
+    # `profiler` (make_profiler(args) when not given) is reported and exported at the end
+    profiler = profiler or make_profiler(args)
+    simulation_class = ThreadedSimulation if args.threaded else FixedStepSimulation
+    simulation = simulation_class(step, dt=args.dt,
+                                  render=None if args.headless else render,
+                                  render_every=args.render_every,
+                                  snapshot=snapshot,
+                                  profiler=profiler)
+    simulation.run(duration=args.duration, fast_forward=args.fast_forward or args.headless, poll=poll)
+    if isinstance(simulation, ThreadedSimulation):
+        print(simulation.timing_report(), file=sys.stderr)
+    finish_profiler(profiler, args)
+    return simulation
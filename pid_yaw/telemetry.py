@@ -0,0 +1,267 @@
+import csv
+import math
+import threading
+import numpy as np
+
+FIELDS = ('time', 'x', 'y', 'yaw', 'velocity',
+          'front_left_wheel_angle', 'front_right_wheel_angle',
+          'rear_left_wheel_angle', 'rear_right_wheel_angle',
+          'cte', 'p_term', 'i_term', 'd_term')
+DTYPE = np.dtype([(name, np.float64) for name in FIELDS])
+
+
+def car_state(car):
+    """
+    (x, y, yaw, velocity, front left, front right, rear left, rear right wheel
+    angles) of a Car, Car_4ws or car_model.Car, in radians. Works on the batch
+    engines too, returning arrays.
+    """
+    if hasattr(car, 'front_left_wheel_angle'):
+        wheels = (car.front_left_wheel_angle, car.front_right_wheel_angle,
+                  car.rear_left_wheel_angle, car.rear_right_wheel_angle)
+    else:
+        wheels = (car.front_wheel_angle, car.front_wheel_angle,
+                  car.rear_wheel_angle, car.rear_wheel_angle)
+    if hasattr(car, 'yaw'):
+        return (car.x, car.y, car.yaw, car.velocity) + wheels
+    # car_model.Car keeps its heading and wheel angles in degrees
+    return (car.x, car.y, math.radians(car.angle), car.speed) + tuple(math.radians(angle) for angle in wheels)
+
+
+class Telemetry:
+    """
+    Per-step telemetry recorder backed by a preallocated NumPy ring buffer.
+
+    record() writes one row into the ring; a background thread drains new
+    rows to the attached sinks (CSV, NPZ, live overlay, ...). With no sink
+    attached record() returns immediately, so leaving the calls in a main
+    loop costs next to nothing. If the sinks fall more than `capacity` rows
+    behind, the oldest rows are dropped and counted in `dropped`.
+
+    :param capacity: Number of rows in the ring buffer.
+    :param flush_every: Wake the drain thread once this many rows are pending.
+    """
+
+    def __init__(self, capacity=8192, flush_every=256):
+        self.buffer = np.zeros(capacity, dtype=DTYPE)
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.sinks = []
+        self.written = 0  # Rows ever written; the next row goes to written % capacity
+        self.drained = 0  # Rows ever handed to the sinks
+        self.dropped = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()  # Serializes draining, not recording
+        self._thread = None
+        self._closing = False
+
+    def attach(self, sink):
+        self.sinks.append(sink)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._drain_loop, daemon=True)
+            self._thread.start()
+        return sink
+
+    def record(self, row):
+        # row: tuple of values in FIELDS order
+        if not self.sinks:
+            return
+        self.buffer[self.written % self.capacity] = row
+        self.written += 1
+        if self.written - self.drained >= self.flush_every:
+            self._wake.set()
+
+    def record_car(self, time, car, cte=math.nan):
+        """
+        Record the state of a Car, Car_4ws or car_model.Car. PID terms are taken
+        from the car's PIDController when it has one.
+        """
+        if not self.sinks:
+            return
+        pid = getattr(car, 'pid_controller', None)
+        terms = (pid.p_term, pid.i_term, pid.d_term) if pid is not None else (math.nan,) * 3
+        self.record((time,) + car_state(car) + (cte,) + terms)
+
+    def _pending(self):
+        # Copy out the rows written since the last drain, oldest first
+        written = self.written
+        start = max(self.drained, written - self.capacity)
+        self.dropped += start - self.drained
+        first, last = start % self.capacity, written % self.capacity
+        if written - start == 0:
+            rows = self.buffer[:0].copy()
+        elif first < last:
+            rows = self.buffer[first:last].copy()
+        else:
+            rows = np.concatenate((self.buffer[first:], self.buffer[:last]))
+        # Rows the producer overwrote while we were copying are unreliable
+        overwritten = self.written - self.capacity - start
+        if overwritten > 0:
+            rows = rows[overwritten:]
+            self.dropped += overwritten
+            start += overwritten
+        self.drained = written
+        return start, rows
+
+    def flush(self):
+        with self._lock:
+            start, rows = self._pending()
+            if len(rows):
+                for sink in self.sinks:
+                    sink.write(start, rows)
+
+    def _drain_loop(self):
+        while not self._closing:
+            self._wake.wait(0.1)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        self._closing = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+
+class Sink:
+    """
+    Base class of telemetry sinks.
+
+    :param fields: Fields to keep, all of FIELDS by default.
+    :param rates: Optional {field: n} keeping only every n-th row of that field.
+    """
+
+    def __init__(self, fields=None, rates=None):
+        self.fields = tuple(fields or FIELDS)
+        self.rates = {name: max(1, int(rates.get(name, 1))) for name in self.fields} if rates else {}
+
+    def sampled(self, start, rows, name):
+        # Row indices and values of `name` that pass its sampling rate
+        index = np.arange(start, start + len(rows))
+        every = self.rates.get(name, 1)
+        if every == 1:
+            return index, rows[name]
+        keep = index % every == 0
+        return index[keep], rows[name][keep]
+
+    def write(self, start, rows):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvSink(Sink):
+    # One CSV row per record; fields skipped by their sampling rate are left empty
+
+    def __init__(self, path, fields=None, rates=None):
+        super().__init__(fields, rates)
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(('step',) + self.fields)
+
+    def write(self, start, rows):
+        columns = []
+        for name in self.fields:
+            column = np.full(len(rows), '', dtype=object)
+            index, values = self.sampled(start, rows, name)
+            column[index - start] = values.astype(str)
+            columns.append(column)
+        steps = np.arange(start, start + len(rows))
+        self.writer.writerows(zip(steps, *columns))
+
+    def close(self):
+        self.file.close()
+
+
+class NpzSink(Sink):
+    # Collects each field, with its own sampling, and saves them in one .npz on close
+
+    def __init__(self, path, fields=None, rates=None):
+        super().__init__(fields, rates)
+        self.path = path
+        self.chunks = {name: [] for name in self.fields}
+        self.steps = {name: [] for name in self.fields}
+
+    def write(self, start, rows):
+        for name in self.fields:
+            index, values = self.sampled(start, rows, name)
+            self.steps[name].append(index)
+            self.chunks[name].append(values)
+
+    def close(self):
+        arrays = {}
+        for name in self.fields:
+            arrays[name] = np.concatenate(self.chunks[name]) if self.chunks[name] else np.zeros(0)
+            arrays[name + '_step'] = np.concatenate(self.steps[name]) if self.steps[name] else np.zeros(0, int)
+        np.savez(self.path, **arrays)
+
+
+class OverlaySink(Sink):
+    """
+    Keeps the latest record for an on-screen overlay. draw(screen) renders it
+    and returns the Rect it touched, so it can be passed to SceneRenderer as
+    an overlay. Angles are shown in degrees.
+    """
+
+    ANGLES = ('yaw', 'front_left_wheel_angle', 'front_right_wheel_angle',
+              'rear_left_wheel_angle', 'rear_right_wheel_angle')
+
+    def __init__(self, fields=('front_left_wheel_angle', 'front_right_wheel_angle',
+                               'rear_left_wheel_angle', 'rear_right_wheel_angle'),
+                 position=(10, 10), color=(0, 0, 0)):
+        super().__init__(fields)
+        self.position = position
+        self.color = color
+        self.latest = None
+        self._font = None
+
+    def write(self, start, rows):
+        self.latest = rows[-1]
+
+    def draw(self, screen):
+        import pygame
+        if self.latest is None:
+            return None
+        if self._font is None:
+            self._font = pygame.font.Font(None, 22)
+        x, y = self.position
+        rects = []
+        for name in self.fields:
+            value = float(self.latest[name])
+            if name in self.ANGLES:
+                value = math.degrees(value)
+            text = self._font.render(f"{name}: {value:.2f}", True, self.color)
+            rects.append(screen.blit(text, (x, y)))
+            y += text.get_height()
+        return rects[0].unionall(rects[1:])
+
+
+def add_telemetry_arguments(parser):
+    # Command-line flags selecting the telemetry sinks of an entry point
+    parser.add_argument('--telemetry', metavar='FILE', help="Log per-step telemetry to a .csv or .npz file")
+    parser.add_argument('--telemetry-rate', metavar='FIELD=N', action='append', default=[],
+                        help="Keep only every N-th sample of FIELD, can be repeated")
+    parser.add_argument('--telemetry-overlay', action='store_true', help="Show live wheel angles on screen")
+    return parser
+
+
+def make_telemetry(args):
+    """
+    Telemetry with the sinks selected by add_telemetry_arguments() flags.
+    Returns (telemetry, overlay sink or None).
+    """
+    rates = {}
+    for item in args.telemetry_rate:
+        name, every = item.split('=')
+        rates[name] = int(every)
+    telemetry = Telemetry()
+    if args.telemetry:
+        sink = NpzSink(args.telemetry, rates=rates) if args.telemetry.endswith('.npz') \
+            else CsvSink(args.telemetry, rates=rates)
+        telemetry.attach(sink)
+    overlay = telemetry.attach(OverlaySink()) if args.telemetry_overlay else None
+    return telemetry, overlay
@@ -0,0 +1,230 @@
+"""
+Dense multi-lane traffic on a ring road, for stress-testing lane changes.
+
+Every car is one entry of a Car4wsBatch. Each tick the cars keep their gap
+to the car ahead in their lane, occasionally change to a free adjacent lane
+(car 0, the ego car, changes lanes on main1.py's fixed schedule instead)
+along a maneuver from the lane_change library, steer through the curvature
+table with in-phase rear steering, and are checked for collisions with
+collision.find_collisions.
+"""
+import copy
+import math
+import time
+from types import SimpleNamespace
+import numpy as np
+import pygame
+from car_4ws_batch import Car4wsBatch
+from collision import box_corners, find_collisions
+from constants import BLUE, RED, GREEN
+from curvature_table import get_table
+from lane_change import get_library, track
+
+
+class Traffic:
+    """
+    :param n_cars: Number of cars, car 0 being the ego car.
+    :param lane_centers: y of every lane center, cars drive toward +x.
+    :param road_length: Length of the ring road; x wraps around it. By
+        default the lanes hold one car every `spacing` units.
+    :param speed_range: Desired speeds are drawn uniformly in this range.
+    :param lane_change_rate: Lane change attempts per car per second.
+    :param safe_gap: Free distance needed ahead and behind in the target lane.
+    :param maneuver: Lane change shape, see lane_change.SHAPES.
+    """
+
+    def __init__(self, n_cars, lane_centers, road_length=None, seed=None, spacing=200.0,
+                 speed_range=(25.0, 45.0), lane_change_rate=0.1, safe_gap=10.0,
+                 min_gap=15.0, headway=0.8, acceleration=20.0, braking=80.0,
+                 length=50, width=20, maneuver='quintic'):
+        self.rng = np.random.default_rng(seed)
+        self.lane_centers = np.asarray(lane_centers, dtype=float)
+        lanes = len(self.lane_centers)
+        self.road_length = road_length or math.ceil(n_cars / lanes) * spacing
+        self.lane_change_rate = lane_change_rate
+        self.safe_gap = safe_gap
+        self.min_gap = min_gap
+        self.headway = headway
+        self.acceleration = acceleration
+        self.braking = braking
+        self.length = length
+        self.width = width
+
+        # Cars evenly spread over the lanes, slightly jittered and staggered from
+        # lane to lane, the ego car in the middle lane
+        lane = (np.arange(n_cars) + lanes // 2) % lanes
+        slot = np.arange(n_cars) // lanes
+        per_lane = math.ceil(n_cars / lanes)
+        x = (slot + lane / lanes + 0.1 * self.rng.uniform(-1, 1, n_cars)) * self.road_length / per_lane
+        self.desired_speed = self.rng.uniform(*speed_range, n_cars)
+        self.cars = Car4wsBatch(x % self.road_length, self.lane_centers[lane], 0, self.desired_speed,
+                                length=length, width=width)
+        self.lane = lane
+        self.target_lane = lane.copy()
+
+        # Current maneuver of every car; cars keeping their lane track a finished one
+        self.maneuver = maneuver
+        self.library = get_library()
+        self.max_curvature = get_table(self.cars.max_steering_angle[0], length).range('in_phase')[1]
+        self.maneuver_distance = np.zeros(n_cars)  # Driven since the maneuver started
+        self.maneuver_length = np.ones(n_cars)
+        self.maneuver_from = self.cars.y.copy()
+        self.maneuver_to = self.cars.y.copy()
+
+        self.time = 0.0
+        self.colliding = np.zeros(n_cars, dtype=bool)
+        self.collision_pairs = np.empty((0, 2), dtype=np.intp)
+        self.collision_ticks = 0  # Sum over ticks of the number of colliding pairs
+        self.lane_changes = 0
+        self.collision_seconds = 0.0  # Time spent in the last detect_collisions()
+
+        # Ego schedule of main1.py: a change every 2 s, turning back every 5 changes
+        self.ego_direction = -1
+        self.ego_changes = 0
+        self.ego_last_change = 0.0
+
+    @property
+    def n(self):
+        return self.cars.n
+
+    def _lane_entries(self):
+        # Every car occupies its lane, and its target lane too while changing
+        changing = np.flatnonzero(self.target_lane != self.lane)
+        car = np.concatenate((np.arange(self.n), changing))
+        lane = np.concatenate((self.lane, self.target_lane[changing]))
+        x = self.cars.x[car]
+        order = np.lexsort((x, lane))
+        return car[order], lane[order], x[order]
+
+    def _gaps_ahead(self):
+        # Free distance to the next car ahead in any lane the car occupies
+        car, lane, x = self._lane_entries()
+        count = len(car)
+        following = np.arange(1, count + 1)
+        # The last entry of a lane wraps around to the first one of the same lane
+        last = np.flatnonzero(np.append(lane[1:] != lane[:-1], True))
+        first = np.concatenate(([0], last[:-1] + 1))
+        following[last] = first
+        gap = (x[following] - x) % self.road_length - self.length
+        gap[following == np.arange(count)] = self.road_length - self.length  # Alone in the lane
+        gaps = np.full(self.n, np.inf)
+        np.minimum.at(gaps, car, gap)
+        return gaps
+
+    def _lane_is_free(self, candidates, lanes):
+        # Whether each candidate has safe_gap free ahead and behind in the given lane
+        car, lane, x = self._lane_entries()
+        free = np.ones(len(candidates), dtype=bool)
+        for target in np.unique(lanes):
+            which = np.flatnonzero(lanes == target)
+            occupants = x[lane == target]
+            if not len(occupants):
+                continue
+            position = self.cars.x[candidates[which]]
+            ahead = occupants[np.searchsorted(occupants, position) % len(occupants)]
+            behind = occupants[np.searchsorted(occupants, position) - 1]
+            clearance = self.safe_gap + self.length
+            free[which] = (((ahead - position) % self.road_length >= clearance)
+                           & ((position - behind) % self.road_length >= clearance))
+        return free
+
+    def _choose_lane_changes(self, delta_time):
+        lanes = len(self.lane_centers)
+        # Only cars done with their maneuver and centered in their lane start a new change
+        settled = ((self.target_lane == self.lane) & (self.maneuver_from == self.maneuver_to)
+                   & (np.abs(self.cars.y - self.lane_centers[self.lane]) < 2.0))
+        attempt = settled & (self.rng.random(self.n) < self.lane_change_rate * delta_time)
+        attempt[0] = False
+        if self.time - self.ego_last_change > 2 and self.ego_changes < 10 and settled[0]:
+            if 0 <= self.lane[0] + self.ego_direction < lanes:
+                attempt[0] = True
+        candidates = np.flatnonzero(attempt)
+        if not len(candidates):
+            return
+        direction = self.rng.choice((-1, 1), len(candidates))
+        if candidates[0] == 0:
+            direction[0] = self.ego_direction
+        target = self.lane[candidates] + direction
+        # Bounce off the outer lanes
+        target = np.where((target < 0) | (target >= lanes), self.lane[candidates] - direction, target)
+        free = self._lane_is_free(candidates, target)
+        changing = candidates[free]
+        self.target_lane[changing] = target[free]
+        self.lane_changes += len(changing)
+
+        # Scale the normalized maneuver to each change
+        self.maneuver_distance[changing] = 0.0
+        self.maneuver_from[changing] = self.cars.y[changing]
+        self.maneuver_to[changing] = self.lane_centers[target[free]]
+        self.maneuver_length[changing] = self.library.length_for(
+            self.maneuver_to[changing] - self.maneuver_from[changing], self.max_curvature, self.maneuver)
+        if candidates[0] == 0 and free[0]:
+            self.ego_changes += 1
+            self.ego_last_change = self.time
+            if self.ego_changes % 5 == 0:
+                self.ego_direction *= -1
+
+    def step(self, delta_time):
+        cars = self.cars
+        self.time += delta_time
+        self._choose_lane_changes(delta_time)
+
+        # Longitudinal: desired speed, limited by a time headway to the car ahead
+        gaps = self._gaps_ahead()
+        target_speed = np.clip((gaps - self.min_gap) / self.headway, 0, self.desired_speed)
+        cars.velocity += np.clip(target_speed - cars.velocity, -self.braking * delta_time,
+                                 self.acceleration * delta_time)
+
+        # Lateral: follow the maneuver, turning through the curvature table
+        reference = self.library.reference(self.maneuver, self.maneuver_distance, self.maneuver_length,
+                                           self.maneuver_from, self.maneuver_to)
+        cars.steer_to_curvature(track(cars.y, cars.yaw, cars.velocity, *reference), 'in_phase')
+        previous_x = cars.x.copy()
+        cars.step(delta_time)
+        np.mod(cars.x, self.road_length, out=cars.x)
+        self.maneuver_distance += (cars.x - previous_x) % self.road_length
+        # A finished maneuver collapses to holding its end position
+        finished = self.maneuver_distance >= self.maneuver_length
+        self.maneuver_from[finished] = self.maneuver_to[finished]
+
+        # A car belongs to the lane it is closest to
+        self.lane = np.abs(cars.y[:, None] - self.lane_centers[None, :]).argmin(axis=1)
+
+        self.detect_collisions()
+
+    def detect_collisions(self):
+        start = time.perf_counter()
+        corners = box_corners(self.cars.x, self.cars.y, self.cars.yaw, self.length, self.width)
+        # Cars near the end of the ring are copied one road length back, so
+        # pairs across the seam are found as well
+        seam = np.flatnonzero(self.cars.x > self.road_length - 2 * self.length)
+        ghosts = corners[seam].copy()
+        ghosts[..., 0] -= self.road_length
+        pairs = find_collisions(np.concatenate((corners, ghosts)))
+        owner = np.concatenate((np.arange(self.n), seam))
+        pairs = owner[pairs]
+        pairs = np.unique(np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1), axis=0)
+        self.collision_pairs = pairs
+        self.colliding[:] = False
+        self.colliding[pairs.ravel()] = True
+        self.collision_ticks += len(pairs)
+        self.collision_seconds = time.perf_counter() - start
+        return pairs
+
+    def snapshot(self):
+        # Copy of what draw() and the status line read, for rendering on another thread
+        view = copy.copy(self)
+        view.cars = SimpleNamespace(n=self.n, x=self.cars.x.copy(), y=self.cars.y.copy(), yaw=self.cars.yaw.copy())
+        view.colliding = self.colliding.copy()
+        return view
+
+    def draw(self, screen, view_x=0.0):
+        # Cars within the screen-wide window starting at view_x, ego in green, colliding cars in red
+        # Screen x of every car, cars partly off the left edge included
+        shift = (self.cars.x - view_x + self.length) % self.road_length - self.length
+        visible = np.flatnonzero(shift < screen.get_width() + self.length)
+        corners = box_corners(shift[visible], self.cars.y[visible], self.cars.yaw[visible],
+                              self.length, self.width)
+        for car, polygon in zip(visible, corners):
+            color = RED if self.colliding[car] else GREEN if car == 0 else BLUE
+            pygame.draw.polygon(screen, color, polygon)
@@ -0,0 +1,150 @@
+import json
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+from telemetry import car_state
+
+# Per-car columns; every frame also stores one 'time' value
+FIELDS = ('x', 'y', 'yaw', 'velocity',
+          'front_left_wheel_angle', 'front_right_wheel_angle',
+          'rear_left_wheel_angle', 'rear_right_wheel_angle')
+
+
+def _chunk_path(directory, name, chunk):
+    return os.path.join(directory, f'{name}.{chunk:05d}.npy')
+
+
+class TrajectoryRecorder:
+    """
+    Streams car states into a directory of chunked columnar .npy files.
+
+    Each field is stored on its own, as a series of files of `chunk_frames`
+    frames by `n_cars` cars that are written through np.memmap, so memory use
+    stays at one chunk per field however long the run is. meta.json holds the
+    layout and is rewritten on every chunk boundary, so a run cut short is
+    still readable up to its last complete chunk.
+
+    :param directory: Output directory, created if needed.
+    :param n_cars: Number of cars recorded each frame.
+    :param chunk_frames: Frames per chunk file.
+    :param dt: Optional physics timestep, stored in the metadata.
+    """
+
+    def __init__(self, directory, n_cars=1, chunk_frames=4096, dt=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.n_cars = n_cars
+        self.chunk_frames = chunk_frames
+        self.dt = dt
+        self.frames = 0
+        self._columns = None
+        self._open_chunk(0)
+
+    def _open_chunk(self, chunk):
+        self._columns = {'time': open_memmap(_chunk_path(self.directory, 'time', chunk), mode='w+',
+                                             dtype=np.float64, shape=(self.chunk_frames,))}
+        for name in FIELDS:
+            self._columns[name] = open_memmap(_chunk_path(self.directory, name, chunk), mode='w+',
+                                              dtype=np.float64, shape=(self.chunk_frames, self.n_cars))
+
+    def _write_meta(self):
+        meta = {'fields': FIELDS, 'n_cars': self.n_cars, 'chunk_frames': self.chunk_frames,
+                'frames': self.frames, 'dt': self.dt}
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as output:
+            json.dump(meta, output)
+
+    def record(self, time, cars):
+        """
+        Append one frame.
+
+        :param cars: A list of Car, Car_4ws or car_model.Car objects, or one
+            CarBatch/Car4wsBatch holding all `n_cars` cars.
+        """
+        if isinstance(cars, (list, tuple)):
+            state = np.array([car_state(car) for car in cars]).T
+        else:
+            state = car_state(cars)
+        row = self.frames % self.chunk_frames
+        self._columns['time'][row] = time
+        for name, values in zip(FIELDS, state):
+            self._columns[name][row] = values
+        self.frames += 1
+
+        if self.frames % self.chunk_frames == 0:
+            for column in self._columns.values():
+                column.flush()
+            self._write_meta()
+            self._open_chunk(self.frames // self.chunk_frames)
+
+    def close(self):
+        # Shrink the last chunk to the frames actually written
+        used = self.frames % self.chunk_frames
+        chunk = self.frames // self.chunk_frames
+        columns, self._columns = self._columns, None
+        for name in list(columns):
+            column = columns.pop(name)
+            tail = np.array(column[:used])
+            del column  # Unmap before the file is replaced
+            path = _chunk_path(self.directory, name, chunk)
+            if used:
+                np.save(path, tail)
+            else:
+                os.remove(path)
+        self._write_meta()
+
+
+class Trajectory:
+    """
+    Read-only view of a recorded run. Chunks are memory-mapped, so seeking to
+    any frame only touches the pages holding it.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+        self.directory = directory
+        self.fields = tuple(meta['fields'])
+        self.n_cars = meta['n_cars']
+        self.chunk_frames = meta['chunk_frames']
+        self.frames = meta['frames']
+        self.dt = meta['dt']
+        chunks = -(-self.frames // self.chunk_frames)
+        self._columns = {name: [np.load(_chunk_path(directory, name, chunk), mmap_mode='r')
+                                for chunk in range(chunks)]
+                         for name in ('time',) + self.fields}
+
+    def __len__(self):
+        return self.frames
+
+    def frame(self, index):
+        # {field: value per car} plus 'time' at frame `index`
+        if not -self.frames <= index < self.frames:
+            raise IndexError(f"frame {index} out of range for {self.frames} frames")
+        index %= self.frames
+        chunk, row = divmod(index, self.chunk_frames)
+        return {name: chunks[chunk][row] for name, chunks in self._columns.items()}
+
+    def column(self, name, start=0, stop=None):
+        # Frames [start, stop) of one field, read only from the chunks that cover them
+        stop = self.frames if stop is None else min(stop, self.frames)
+        start = max(0, start)
+        if start >= stop:
+            return self._columns[name][0][:0] if self._columns[name] else np.zeros(0)
+        first, last = start // self.chunk_frames, (stop - 1) // self.chunk_frames
+        parts = []
+        for chunk in range(first, last + 1):
+            offset = chunk * self.chunk_frames
+            parts.append(self._columns[name][chunk][max(start - offset, 0):stop - offset])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def seek_time(self, time):
+        # Index of the first frame at or after `time`, searched chunk by chunk
+        for chunk, times in enumerate(self._columns['time']):
+            if times[-1] >= time:
+                return min(chunk * self.chunk_frames + int(np.searchsorted(times, time)), self.frames - 1)
+        return self.frames - 1
+
+
+def add_recording_arguments(parser):
+    parser.add_argument('--record', metavar='DIR', help="Record the run to this directory for replay.py")
+    return parser
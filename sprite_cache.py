@@ -0,0 +1,63 @@
+from collections import OrderedDict
+import pygame
+
+
+class SpriteCache:
+    """
+    Cache of pre-rotated sprites keyed by vehicle type and quantized angle.
+
+    Each vehicle type registers a builder returning its unrotated surface
+    (facing angle 0). Rotations are quantized to `steps` per full turn and
+    rendered lazily on first use, or all at once with prerender(). With
+    `max_size` set, the least recently used rotations are evicted.
+
+    :param steps: Number of rotation steps per 360 degrees.
+    :param max_size: Maximum number of cached rotated surfaces, None for no limit.
+    """
+
+    def __init__(self, steps=72, max_size=None):
+        self.steps = steps
+        self.max_size = max_size
+        self._builders = {}
+        self._bases = {}
+        self._rotated = OrderedDict()
+
+    def register(self, kind, build):
+        self._builders[kind] = build
+        self._bases.pop(kind, None)
+        for key in [key for key in self._rotated if key[0] == kind]:
+            del self._rotated[key]
+
+    def _base(self, kind):
+        base = self._bases.get(kind)
+        if base is None:
+            base = self._bases[kind] = self._builders[kind]()
+        return base
+
+    def quantize(self, angle):
+        # Index of the rotation step closest to `angle` degrees
+        return round(angle * self.steps / 360) % self.steps
+
+    def get(self, kind, angle):
+        key = (kind, self.quantize(angle))
+        sprite = self._rotated.get(key)
+        if sprite is not None:
+            self._rotated.move_to_end(key)
+            return sprite
+
+        # pygame rotates counterclockwise, screen y points down: negate like Car.draw did
+        sprite = pygame.transform.rotate(self._base(kind), -key[1] * 360 / self.steps)
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert_alpha()  # Match the display format for fast blits
+        self._rotated[key] = sprite
+        if self.max_size is not None and len(self._rotated) > self.max_size:
+            self._rotated.popitem(last=False)
+        return sprite
+
+    def prerender(self, kind):
+        for step in range(self.steps):
+            self.get(kind, step * 360 / self.steps)
+
+    def blit(self, screen, kind, angle, center):
+        sprite = self.get(kind, angle)
+        return screen.blit(sprite, sprite.get_rect(center=center))
@@ -1,58 +1,122 @@
-import pygame
+import argparse
 import math
+import os
+import sys
+import time
+import numpy as np
 import matplotlib.pyplot as plt
 
-from car_model import Car
-
-# Initialize Pygame
-pygame.init()
-
-# Setup display
-screen_width, screen_height = 800, 600
-screen = pygame.display.set_mode((screen_width, screen_height))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pid_yaw'))
+from car_4ws_batch import Car4wsBatch
+from integrators import INTEGRATORS
+from trajectory import TrajectoryRecorder
 
 # Define experiment parameters
-steering_angles = range(-30, 35, 5)  # From -30 to 30 degrees, in steps of 5
-turning_radii = []
+steering_angles = np.arange(-30, 35, 5)  # From -30 to 30 degrees, in steps of 5
+speeds = np.array([5, 10, 20, 30, 40, 60])
+rear_ratios = np.array([-1.0, -0.5, -0.25, 0.0, 0.25, 0.5, 1.0])  # Rear angle / front angle, 0 is front-only
+
 
 # Function to calculate turning radius from car's path
 def calculate_turning_radius(car_path):
-    # Implement a method to calculate the turning radius based on car_path
-    # This could be as simple as finding the max deviation from a straight line
-    # For simplicity, this example will not provide a complex calculation
-    return 100  # Placeholder value
-
-for angle in steering_angles:
-    car = Car(screen_width // 2, screen_height // 2)
-    car.steering_angle = angle  # Set car's steering angle
-    
-    car_path = []  # Store the car's path to calculate turning radius
-    
-    # Reset Pygame clock
-    clock = pygame.time.Clock()
-    
-    for _ in range(60):  # Run each experiment for a few seconds
-        car.update_position()
-        car_path.append((car.x, car.y))
-        
-        # Clear screen and redraw (optional, for visualization)
-        screen.fill((255, 255, 255))
-        car.draw(screen)
-        pygame.display.flip()
-        
-        clock.tick(60)  # Maintain a steady framerate
-    
-    # Calculate and record turning radius for current angle
-    turning_radius = calculate_turning_radius(car_path)
-    turning_radii.append(turning_radius)
-
-# Plotting results
-plt.plot(steering_angles, turning_radii, marker='o')
-plt.xlabel('Steering Angle (degrees)')
-plt.ylabel('Turning Radius')
-plt.title('Turning Radius by Steering Angle')
-plt.grid(True)
-plt.show()
-
-# Quit Pygame
-pygame.quit()
+    """
+    Least-squares (Kasa) circle fit of many trajectories at once.
+
+    :param car_path: Array of shape (configurations, samples, 2).
+    :return: Array of fitted radii, inf for straight-line trajectories.
+    """
+    car_path = np.asarray(car_path, dtype=float)
+    # Center every trajectory on its mean for a well conditioned fit
+    centered = car_path - car_path.mean(axis=1, keepdims=True)
+    x, y = centered[..., 0], centered[..., 1]
+    # Solve x^2 + y^2 = a x + b y + c for (a, b, c) per trajectory
+    design = np.stack((x, y, np.ones_like(x)), axis=-1)
+    normal = np.einsum('nti,ntj->nij', design, design)
+    rhs = np.einsum('nti,nt->ni', design, x * x + y * y)
+
+    radii = np.full(len(car_path), np.inf)
+    # Collinear samples make the normal matrix singular: driving straight
+    scale = np.einsum('nii->n', normal)
+    curved = np.abs(np.linalg.det(normal)) > 1e-12 * scale ** 3
+    if curved.any():
+        a, b, c = np.linalg.solve(normal[curved], rhs[curved][..., None])[..., 0].T
+        radii[curved] = np.sqrt(c + (a * a + b * b) / 4)
+    return radii
+
+
+def run_experiment(duration=2.0, delta_time=1 / 60, max_steering_angle=30, record=None, integrator='euler'):
+    # Every (rear ratio, speed, angle) configuration is one car of a single batch
+    ratio, speed, angle = np.meshgrid(rear_ratios, speeds, steering_angles, indexing='ij')
+    front = np.radians(angle.ravel())
+    rear = np.clip(front * ratio.ravel(), -math.radians(max_steering_angle), math.radians(max_steering_angle))
+
+    cars = Car4wsBatch(0, 0, 0, speed.ravel(), max_steering_angle=math.radians(max_steering_angle),
+                       integrator=integrator)
+    cars.front_left_wheel_angle[:] = cars.front_right_wheel_angle[:] = front
+    cars.rear_left_wheel_angle[:] = cars.rear_right_wheel_angle[:] = rear
+
+    steps = int(round(duration / delta_time))
+    car_path = np.empty((cars.n, steps, 2))  # Store the car's path to calculate turning radius
+    # Optionally keep the whole run, one car per configuration, for replay.py
+    recorder = TrajectoryRecorder(record, n_cars=cars.n, dt=delta_time) if record else None
+    for step in range(steps):
+        cars.step(delta_time)
+        car_path[:, step, 0] = cars.x
+        car_path[:, step, 1] = cars.y
+        if recorder:
+            recorder.record((step + 1) * delta_time, cars)
+    if recorder:
+        recorder.close()
+
+    # Calculate and record turning radius for every configuration
+    turning_radii = calculate_turning_radius(car_path)
+    return turning_radii.reshape(ratio.shape)
+
+
+def plot(turning_radii, output=None):
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5))
+    # Radius by steering angle for each rear ratio, at the first speed (the
+    # kinematic model gives the same radius at every speed)
+    for ratio, radii in zip(rear_ratios, turning_radii[:, 0]):
+        label = 'front only' if ratio == 0 else f'rear = {ratio:+.2f} x front'
+        axes[0].plot(steering_angles, radii, marker='o', label=label)
+    axes[0].set_xlabel('Steering Angle (degrees)')
+    axes[0].set_ylabel('Turning Radius')
+    axes[0].set_title('Turning Radius by Steering Angle')
+    axes[0].set_yscale('log')
+    axes[0].legend()
+    axes[0].grid(True)
+
+    # Radius by speed for the widest front angle
+    widest = np.argmax(steering_angles)
+    for ratio, radii in zip(rear_ratios, turning_radii[:, :, widest]):
+        axes[1].plot(speeds, radii, marker='o')
+    axes[1].set_xlabel('Speed')
+    axes[1].set_ylabel('Turning Radius')
+    axes[1].set_title(f'Turning Radius by Speed at {steering_angles[widest]} degrees')
+    axes[1].grid(True)
+
+    fig.tight_layout()
+    if output:
+        fig.savefig(output)
+    else:
+        plt.show()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless turning radius experiment")
+    parser.add_argument('--duration', type=float, default=2.0, help="Simulated seconds per configuration")
+    parser.add_argument('--output', help="Save the plot to this file instead of showing it")
+    parser.add_argument('--record', metavar='DIR', help="Record every configuration's trajectory to this directory")
+    parser.add_argument('--dt', type=float, default=1 / 60, help="Physics timestep in seconds")
+    # Euler's polygon has the wrong radius at large timesteps; the arc integrator is exact at any dt
+    parser.add_argument('--integrator', choices=sorted(INTEGRATORS), default='euler', help="Pose integrator")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    turning_radii = run_experiment(args.duration, args.dt, record=args.record, integrator=args.integrator)
+    elapsed = time.perf_counter() - start
+    print(f"{turning_radii.size} configurations in {elapsed * 1000:.1f} ms")
+
+    # Plotting results
+    plot(turning_radii, args.output)